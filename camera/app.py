@@ -1,7 +1,9 @@
 import argparse
 import base64
+import functools
 import logging
 import os
+import random
 import socket
 import sys
 import time
@@ -9,18 +11,38 @@ import traceback
 from datetime import datetime
 
 import cv2  # Requires: pip install opencv-python
+import numpy as np
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
-# Configure logging
+from encoding import AdaptiveEncoder, encode_frame
+from frame_client import FrameClient
+from pending_jobs import PendingJobs
+from spool import (
+    CircuitBreaker,
+    RetryLater,
+    ServiceError,
+    Spool,
+    SpoolDrainer,
+    is_retryable,
+)
+import tracing
+
+# Configure logging. tracing adds trace_id to every log record.
+tracing.configure("camera")
 logging.basicConfig(
     level=logging.DEBUG,
-    format="%(asctime)s [%(levelname)s] %(filename)s:%(lineno)d - %(message)s",
+    format="%(asctime)s [%(levelname)s] [%(trace_id)s] %(filename)s:%(lineno)d - %(message)s",
     handlers=[logging.StreamHandler(sys.stdout)],
 )
 logger = logging.getLogger(__name__)
 
+_frame_client = None
+# Async mode in a capture loop: submitted jobs whose results are published
+# by a background thread (see pending_jobs.py).
+_pending_jobs = None
+
 
 def log_network_info():
     """Log network configuration to help with debugging"""
@@ -64,27 +86,103 @@ def log_network_info():
         logger.debug(traceback.format_exc())
 
 
+def build_ml_payload(image_data=None):
+    payload = {
+        "CollectionId": os.environ.get("COLLECTION_ID", "student-gallery"),
+        "MaxFaces": 1,
+        "FaceMatchThreshold": 80,
+    }
+    camera_id = os.environ.get("CAMERA_ID")
+    if camera_id:
+        # Lets the ML service reuse this camera's last face position. Only an
+        # explicit ID is sent: hostnames are shared by cameras on one host
+        # and change when a container is recreated.
+        payload["SourceId"] = camera_id
+    if image_data is not None:
+        payload["Image"] = {"Bytes": image_data}
+    return payload
+
+
+def get_frame_client():
+    """The local frame socket client, if FRAME_SOCKET_PATH is set."""
+    global _frame_client
+    if _frame_client is None:
+        _frame_client = FrameClient.from_env()
+    return _frame_client
+
+
+def call_ml_service_local(frame):
+    """
+    Send a raw BGR frame to a co-located ML service through shared memory.
+    Falls back to the HTTP API if the frame socket cannot be reached, but not
+    if the service timed out on the frame, since it may still be recognizing
+    it.
+    """
+    client = get_frame_client()
+    logger.info(f"Calling ML service through local socket: {client.socket_path}")
+    try:
+        request = dict(build_ml_payload(), traceparent=tracing.current_traceparent())
+        result, status = client.predict(frame, request)
+    except socket.timeout:
+        logger.error(f"ML service did not answer within {client.timeout}s")
+        raise
+    except OSError as e:
+        logger.warning(f"Local frame socket unavailable ({e}), falling back to HTTP")
+        return call_ml_service(encode_upload(frame))
+
+    logger.info(f"ML service response status: {status}")
+    if status != 200:
+        logger.error(f"ML Service error: {result}")
+        raise ServiceError(f"ML Service error: {result}", status)
+    logger.debug(f"ML service response: {result}")
+    return result
+
+
 def call_ml_service(image_data):
     ML_SERVICE_URL = os.environ.get(
         "ML_SERVICE_URL", "http://localhost:8000/api/predict"
     )
     logger.info(f"Calling ML service at: {ML_SERVICE_URL}")
 
-    ml_payload = {
-        "CollectionId": "student-gallery",
-        "Image": {"Bytes": image_data},
-        "MaxFaces": 1,
-        "FaceMatchThreshold": 80,
-    }
+    ml_payload = build_ml_payload(image_data)
+
+    # Connection errors and overload responses are retried a few times with
+    # jittered backoff; anything longer is left to the spool.
+    retries = int(os.environ.get("ML_RETRIES", "2"))
+    backoff = float(os.environ.get("ML_RETRY_BACKOFF", "0.5"))
 
     try:
         logger.debug(f"Sending POST request to ML service with payload: {ml_payload}")
-        response = requests.post(ML_SERVICE_URL, json=ml_payload)
+        for attempt in range(retries + 1):
+            delay = backoff * 2**attempt * random.uniform(0.5, 1.5)
+            try:
+                response = requests.post(
+                    ML_SERVICE_URL, json=ml_payload, headers=tracing.headers()
+                )
+            except (
+                requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+            ):
+                if attempt == retries:
+                    raise
+                logger.warning(f"ML service unreachable, retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            if response.status_code in (502, 503, 504) and attempt < retries:
+                logger.warning(
+                    f"ML service returned {response.status_code}, "
+                    f"retrying in {delay:.1f}s"
+                )
+                time.sleep(delay)
+                continue
+            break
         logger.info(f"ML service response status: {response.status_code}")
 
         if response.status_code != 200:
             logger.error(f"ML Service error: {response.text}")
-            raise Exception(f"ML Service error: {response.text}")
+            raise ServiceError(
+                f"ML Service error: {response.text}", response.status_code
+            )
 
         result = response.json()
         logger.debug(f"ML service response: {result}")
@@ -100,6 +198,78 @@ def call_ml_service(image_data):
         raise
 
 
+def submit_ml_job(image_data):
+    """Queue the frame as a prediction job on the ML service; returns its ID."""
+    ML_JOBS_URL = os.environ.get(
+        "ML_JOBS_URL", "http://localhost:8000/api/predict/jobs"
+    )
+    logger.info(f"Submitting prediction job to: {ML_JOBS_URL}")
+
+    response = requests.post(
+        ML_JOBS_URL, json=build_ml_payload(image_data), headers=tracing.headers()
+    )
+    if response.status_code != 202:
+        logger.error(f"ML job submission error: {response.text}")
+        raise ServiceError(
+            f"ML job submission error: {response.text}", response.status_code
+        )
+    job_id = response.json()["jobId"]
+    logger.info(f"Prediction job {job_id} queued")
+    return job_id
+
+
+def call_ml_service_async(image_data):
+    """
+    Submit the frame as a prediction job and poll until it finishes. The ML
+    service stores the job durably, so the result survives an ML service restart
+    while we wait; connection errors during polling are retried until
+    ML_JOB_TIMEOUT. Used by one-shot runs and spool replays; a capture loop
+    hands jobs to _pending_jobs instead of waiting.
+    """
+    ML_JOBS_URL = os.environ.get(
+        "ML_JOBS_URL", "http://localhost:8000/api/predict/jobs"
+    )
+    timeout = float(os.environ.get("ML_JOB_TIMEOUT", "60"))
+    poll_interval = float(os.environ.get("ML_JOB_POLL_INTERVAL", "0.5"))
+    job_id = submit_ml_job(image_data)
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            # A hung poll must not outlast the deadline either.
+            response = requests.get(
+                f"{ML_JOBS_URL}/{job_id}", timeout=max(deadline - time.time(), 0.001)
+            )
+        except (
+            requests.exceptions.ConnectionError,
+            requests.exceptions.Timeout,
+        ) as e:
+            logger.warning(f"ML service unavailable while polling job {job_id}: {e}")
+            time.sleep(min(poll_interval, max(deadline - time.time(), 0)))
+            continue
+
+        if response.status_code != 200:
+            logger.error(f"ML job poll error: {response.text}")
+            raise ServiceError(
+                f"ML job poll error: {response.text}", response.status_code
+            )
+
+        job = response.json()
+        if job["status"] == "done":
+            if job.get("statusCode") != 200:
+                raise ServiceError(
+                    f"ML Service error: {job.get('result')}", job.get("statusCode")
+                )
+            logger.debug(f"ML job result: {job['result']}")
+            return job["result"]
+        if job["status"] == "failed":
+            # The service gave up after retrying it.
+            raise ServiceError(f"ML job {job_id} failed: {job.get('error')}", 500)
+        time.sleep(poll_interval)
+
+    raise TimeoutError(f"ML job {job_id} did not finish within {timeout}s")
+
+
 def create_retry_session(retries=5, backoff_factor=0.5):
     session = requests.Session()
     retry = Retry(
@@ -125,12 +295,18 @@ def query_student_db(student_id):
     session = create_retry_session()
 
     try:
-        response = session.get(STUDENT_DB_URL, params={"studentId": student_id})
+        response = session.get(
+            STUDENT_DB_URL,
+            params={"studentId": student_id},
+            headers=tracing.headers(),
+        )
         logger.info(f"Student DB response status: {response.status_code}")
 
         if response.status_code != 200:
             logger.error(f"Student DB error: {response.text}")
-            raise Exception(f"Student DB error: {response.text}")
+            raise ServiceError(
+                f"Student DB error: {response.text}", response.status_code
+            )
 
         result = response.json()
         logger.debug(f"Student DB response: {result}")
@@ -142,48 +318,223 @@ def query_student_db(student_id):
         raise
 
 
-def update_frontend(update_payload):
-    FRONTEND_UI_URL = os.environ.get(
-        "FRONTEND_UI_URL", "http://localhost:3000/api/classroom/update"
+def update_frontend_batch(updates):
+    """
+    Send several seat updates (possibly for different classrooms) in one request.
+    The frontend applies them atomically and returns only the new versions.
+    """
+    FRONTEND_BATCH_URL = os.environ.get(
+        "FRONTEND_BATCH_URL", "http://localhost:3000/api/classroom/updates"
     )
-    logger.info(f"Updating frontend at: {FRONTEND_UI_URL}")
+    logger.info(f"Sending {len(updates)} seat updates to: {FRONTEND_BATCH_URL}")
 
     try:
-        response = requests.post(FRONTEND_UI_URL, json=update_payload)
+        with tracing.span("seat_update", updates=len(updates)):
+            response = requests.post(
+                FRONTEND_BATCH_URL, json={"updates": updates}, headers=tracing.headers()
+            )
         logger.info(f"Frontend response status: {response.status_code}")
 
         if response.status_code != 200:
             logger.error(f"Frontend UI error: {response.text}")
-            raise Exception(f"Frontend UI error: {response.text}")
+            raise ServiceError(
+                f"Frontend UI error: {response.text}", response.status_code
+            )
 
         result = response.json()
         logger.debug(f"Frontend response: {result}")
         return result
 
     except Exception as e:
-        logger.error(f"Error in update_frontend: {str(e)}")
+        logger.error(f"Error in update_frontend_batch: {str(e)}")
         logger.debug(traceback.format_exc())
         raise
 
 
-def process_capture(image_data, seat_id=None):
+def predict(image_data):
+    """
+    Recognize image_data: a base64 encoded image, or a raw BGR frame to send
+    through the local frame socket.
+    """
+    if isinstance(image_data, np.ndarray):
+        with tracing.span("ml_predict", transport="shm"):
+            return call_ml_service_local(image_data)
+    if os.environ.get("ML_PREDICT_MODE", "sync") == "async":
+        with tracing.span("ml_predict", transport="job"):
+            return call_ml_service_async(image_data)
+    with tracing.span("ml_predict", transport="http"):
+        return call_ml_service(image_data)
+
+
+def utc_now():
+    return datetime.utcnow().isoformat() + "Z"
+
+
+def process_capture(image_data, seat_id=None, encoder=None, spool=None, breaker=None):
+    """
+    Recognize a capture and publish the seat update. With a spool, a capture
+    that cannot be recognized or published because a backend is down is
+    spooled for later replay (status 202) instead of being lost.
+
+    Each capture starts a trace that the ML service, database and frontend
+    continue.
+    """
+    with tracing.span(
+        "capture", seat_id=seat_id, classroom_id=os.environ.get("CLASSROOM_ID")
+    ) as span:
+        result, status = capture_and_publish(
+            image_data, seat_id, encoder, spool, breaker
+        )
+        span.set("status", status)
+        return result, status
+
+
+def capture_and_publish(image_data, seat_id, encoder, spool, breaker):
     logger.info("Starting image capture processing")
 
+    captured_at = utc_now()
+
+    def spool_capture():
+        # Raw frames are only encoded if they have to wait in the spool.
+        image = image_data
+        if isinstance(image, np.ndarray):
+            image = encode_upload(image)
+        spool.put(
+            {
+                "kind": "capture",
+                "image": image,
+                "classroomId": os.environ.get("CLASSROOM_ID"),
+                "seatId": seat_id,
+                "capturedAt": captured_at,
+            }
+        )
+
+    if breaker is not None and not breaker.allow():
+        logger.warning("Circuit breaker open, spooling capture without calling")
+        spool_capture()
+        return {"error": "Backend unavailable", "spooled": True}, 202
+
+    started = time.time()
+    pending = _pending_jobs if isinstance(image_data, str) else None
     try:
-        logger.info("Calling ML service for face detection")
-        ml_result = call_ml_service(image_data)
+        if pending is not None:
+            job_id = submit_ml_job(image_data)
+        else:
+            logger.info("Calling ML service for face detection")
+            ml_result = predict(image_data)
     except Exception as e:
         logger.error(f"ML service processing failed: {str(e)}")
+        if encoder is not None:
+            encoder.observe(time.time() - started)
+        if not is_retryable(e):
+            # The ML service is up but refused this capture; spooling it
+            # would only fail again.
+            if breaker is not None:
+                breaker.record_success()
+            return {"error": str(e)}, 500
+        if breaker is not None:
+            breaker.record_failure()
+        if spool is not None:
+            spool_capture()
+            return {"error": str(e), "spooled": True}, 202
         return {"error": str(e)}, 500
 
+    if pending is not None:
+        # The result is published when the job finishes; capture moves on.
+        if breaker is not None:
+            breaker.record_success()
+        pending.add(
+            job_id,
+            {
+                "seatId": seat_id,
+                "capturedAt": captured_at,
+                "submittedAt": started,
+                "traceparent": tracing.current_traceparent(),
+            },
+        )
+        return {"jobId": job_id, "status": "queued"}, 202
+
+    if encoder is not None:
+        # The ML service reports a similarity whenever it found a face.
+        similarity = ml_result.get("similarity")
+        encoder.observe(
+            time.time() - started,
+            similarity / 100 if similarity is not None else None,
+        )
+
+    result, status = publish_result(ml_result, seat_id, captured_at, spool)
+    if breaker is not None:
+        if status == 202:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+    return result, status
+
+
+def publish_job_result(job, context, spool=None, encoder=None):
+    """
+    PendingJobs callback: publish a finished prediction job with the time its
+    frame was captured, in the trace of the capture that submitted it.
+    """
+    with tracing.span(
+        "job_result", context["traceparent"], job_id=job["jobId"]
+    ) as span:
+        if job["status"] != "done" or job.get("statusCode") != 200:
+            logger.error(
+                f"Prediction job {job['jobId']} failed: "
+                f"{job.get('error') or job.get('result')}"
+            )
+            span.set("status", job.get("statusCode", 500))
+            return
+        ml_result = job["result"]
+        if encoder is not None:
+            similarity = ml_result.get("similarity")
+            encoder.observe(
+                time.time() - context["submittedAt"],
+                similarity / 100 if similarity is not None else None,
+            )
+        _, status = publish_result(
+            ml_result, context["seatId"], context["capturedAt"], spool
+        )
+        span.set("status", status)
+
+
+def process_frame(frame, seat_id=None, recognizer=None):
+    """
+    Embedded mode: run the in-process FaceRecognizer on a BGR frame and
+    publish the result. No image is serialized or sent over the network.
+    """
+    logger.info("Running in-process face recognition")
+    with tracing.span("capture", seat_id=seat_id, embedded=True) as span:
+        try:
+            img_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            ml_result = recognizer.recognize_face(
+                img_rgb,
+                collection_id=os.environ.get("COLLECTION_ID"),
+                source_id=os.environ.get("CAMERA_ID") or seat_id,
+            )
+        except Exception as e:
+            logger.error(f"In-process recognition failed: {str(e)}")
+            span.set("status", 500)
+            return {"error": str(e)}, 500
+
+        result, status = publish_result(ml_result, seat_id)
+        span.set("status", status)
+        return result, status
+
+
+def build_seat_update(ml_result, seat_id=None, last_seen=None):
+    """
+    The frontend seat update for a recognition result, or None if no face
+    was matched with enough confidence. last_seen defaults to now.
+    """
     # Check if a match was found and if the similarity is over 50%
     if not ml_result.get("match") or ml_result.get("similarity", 0) < 50:
-        logger.warning("No face detected or low confidence in ML results")
-        return {"error": "No face detected or low confidence"}, 400
+        return None
 
     # Extract student info directly from the ML result
     predicted_student_id = ml_result.get("studentId", None)
-    student_info = ml_result.get("studentInfo", {})
+    student_info = ml_result.get("studentInfo") or {}
     similarity = (
         ml_result.get("similarity", 0) / 100
         if ml_result.get("similarity", 0) > 1
@@ -194,25 +545,45 @@ def process_capture(image_data, seat_id=None):
         f"Face detected: Student ID = {predicted_student_id}, Similarity = {similarity}"
     )
 
-    update_payload = {
+    return {
+        "classroomId": os.environ.get("CLASSROOM_ID"),
         "studentId": predicted_student_id if predicted_student_id else None,
         "name": student_info.get("name", None),
         "seatId": seat_id,
         "confidence": similarity,
-        "lastSeen": datetime.utcnow().isoformat() + "Z",
+        "lastSeen": last_seen or utc_now(),
     }
+
+
+def publish_result(ml_result, seat_id=None, last_seen=None, spool=None):
+    """
+    Turn a recognition result into a seat update and send it to the frontend.
+    With a spool, an update that could not be delivered because the frontend
+    is unreachable or failing (5xx) is spooled (202); one it rejected is not.
+    """
+    update_payload = build_seat_update(ml_result, seat_id, last_seen)
+    if update_payload is None:
+        logger.warning("No face detected or low confidence in ML results")
+        return {"error": "No face detected or low confidence"}, 400
     logger.info(f"Prepared frontend update payload: {update_payload}")
 
     try:
         logger.info("Sending update to frontend UI")
-        frontend_response = update_frontend(update_payload)
+        frontend_response = update_frontend_batch([update_payload])
     except Exception as e:
         logger.error(f"Frontend update failed: {str(e)}")
+        if spool is not None and is_retryable(e):
+            spool.put({"kind": "update", "update": update_payload})
+            return {"error": str(e), "spooled": True}, 202
         return {"error": str(e)}, 500
 
+    if spool is not None:
+        spool.mark_published(
+            update_payload["classroomId"], seat_id, update_payload["lastSeen"]
+        )
     result = {
         "ml_result": ml_result,
-        "student_info": student_info,
+        "student_info": ml_result.get("studentInfo") or {},
         "frontend_update": update_payload,
         "frontend_response": frontend_response,
         "message": "Capture and update successful",
@@ -221,9 +592,74 @@ def process_capture(image_data, seat_id=None):
     return result, 200
 
 
-def capture_image():
+def replay_entry(entry, spool):
     """
-    Capture an image from the webcam, encode it as JPEG, and return a base64 string.
+    Publish one spooled entry with its original capture time. Raises when it
+    should be retried later; returns False if it was skipped without calling
+    any backend. Each replay is traced on its own.
+    """
+    with tracing.span("replay", kind=entry["kind"]):
+        return replay(entry, spool)
+
+
+def replay(entry, spool):
+    if entry["kind"] == "update":
+        update = entry["update"]
+    else:
+        if spool.is_superseded(
+            entry["classroomId"], entry["seatId"], entry["capturedAt"]
+        ):
+            logger.info(f"Skipping spooled capture from {entry['capturedAt']}")
+            return False
+        ml_result = predict(entry["image"])
+        update = build_seat_update(ml_result, entry["seatId"], entry["capturedAt"])
+        if update is None:
+            logger.info("Spooled capture had no confident match, dropping it")
+            return
+        update["classroomId"] = entry["classroomId"]
+
+    if spool.is_superseded(update["classroomId"], update["seatId"], update["lastSeen"]):
+        logger.info(f"Skipping spooled update from {update['lastSeen']}")
+        return False
+    try:
+        update_frontend_batch([update])
+    except Exception as e:
+        if not is_retryable(e):
+            raise
+        # Keep the recognition result so the retry does not call the ML service.
+        raise RetryLater(str(e), entry={"kind": "update", "update": update})
+    spool.mark_published(update["classroomId"], update["seatId"], update["lastSeen"])
+    return True
+
+
+def build_spool():
+    """
+    Spool, circuit breaker and drainer from the environment, or Nones when
+    SPOOL_DIR is not set.
+    """
+    spool = Spool.from_env()
+    if spool is None:
+        return None, None, None
+    breaker = CircuitBreaker(
+        failure_threshold=int(os.environ.get("BREAKER_FAILURES", "3")),
+        reset_seconds=float(os.environ.get("BREAKER_RESET_SECONDS", "30")),
+        state_path=os.path.join(spool.directory, "breaker.json"),
+    )
+    drainer = SpoolDrainer(
+        spool,
+        functools.partial(replay_entry, spool=spool),
+        breaker,
+        rate=float(os.environ.get("DRAIN_RATE", "1")),
+        max_backoff=float(os.environ.get("DRAIN_MAX_BACKOFF", "300")),
+        max_attempts=int(os.environ.get("SPOOL_MAX_ATTEMPTS", "10")),
+    )
+    return spool, breaker, drainer
+
+
+def capture_frame():
+    """
+    Capture one BGR frame from the webcam, optionally saving a copy to
+    SAVE_CAPTURE_PATH.
     """
     logger.info("Attempting to open webcam for image capture")
     cap = cv2.VideoCapture(0)
@@ -238,21 +674,87 @@ def capture_image():
         logger.error("Failed to capture image from webcam")
         return None
 
-    cv2.imwrite("captured_image.jpg", frame)
-    print("Image saved as captured_image.jpg")
-    # Encode the image as JPEG
-    ret, buffer = cv2.imencode(".jpg", frame)
-    if not ret:
+    save_path = os.environ.get("SAVE_CAPTURE_PATH")
+    if save_path:
+        cv2.imwrite(save_path, frame)
+        print(f"Image saved as {save_path}")
+    return frame
+
+
+def capture_image(encoder=None):
+    """
+    Capture an image from the webcam, encode it with the encoder's current
+    profile (full-resolution JPEG without one), and return a base64 string.
+    """
+    frame = capture_frame()
+    if frame is None:
+        return None
+    return encode_upload(frame, encoder)
+
+
+def encode_upload(frame, encoder=None):
+    """
+    Encode a BGR frame with the encoder's current profile (full-resolution
+    JPEG without one) as a base64 string, or None if encoding failed.
+    """
+    profile = (
+        encoder.profile
+        if encoder
+        else {"max_side": None, "format": "jpg", "quality": 95}
+    )
+    image_bytes, fmt = encode_frame(frame, profile)
+    if image_bytes is None:
         logger.error("Failed to encode captured image")
         return None
-    jpg_bytes = buffer.tobytes()
+    logger.info(
+        f"Encoded {frame.shape[1]}x{frame.shape[0]} frame as {fmt} "
+        f"(max side {profile['max_side']}, quality {profile['quality']}): "
+        f"{len(image_bytes)} bytes"
+    )
     # Encode the bytes in base64 to safely include in JSON
-    encoded_image = base64.b64encode(jpg_bytes).decode("utf-8")
+    encoded_image = base64.b64encode(image_bytes).decode("utf-8")
     logger.info("Image captured and encoded successfully")
     return encoded_image
 
 
+def decode_frame(image_data):
+    """Decode a base64 image (as passed with -i) to a BGR frame."""
+    img_bytes = base64.b64decode(image_data)
+    return cv2.imdecode(np.frombuffer(img_bytes, np.uint8), cv2.IMREAD_COLOR)
+
+
+def run_embedded(image_data, seat_id, recognizer):
+    frame = decode_frame(image_data) if image_data else capture_frame()
+    if frame is None:
+        logger.error("Image capture failed")
+        return {"error": "Image capture failed"}, 1
+    return process_frame(frame, seat_id, recognizer)
+
+
+def run_service(image_data, seat_id, encoder, spool=None, breaker=None):
+    if not image_data:
+        if get_frame_client() is not None:
+            # Co-located ML service: the raw frame goes through shared memory.
+            image_data = capture_frame()
+        else:
+            image_data = capture_image(encoder)
+        if image_data is None:
+            logger.error("Image capture failed")
+            return {"error": "Image capture failed"}, 1
+        if isinstance(image_data, np.ndarray):
+            logger.info(
+                f"Processing {image_data.shape[1]}x{image_data.shape[0]} raw frame"
+            )
+            return process_capture(image_data, seat_id, None, spool, breaker)
+
+    logger.info(
+        f"Processing capture with image data (first 20 chars): {image_data[:20]}..."
+    )
+    return process_capture(image_data, seat_id, encoder, spool, breaker)
+
+
 def main():
+    global _pending_jobs
     parser = argparse.ArgumentParser(description="Run camera service")
 
     parser.add_argument(
@@ -272,19 +774,26 @@ def main():
         action="store_true",
         help="Enable debug logging (default: info)",
     )
+    parser.add_argument(
+        "-e",
+        "--embedded",
+        action="store_true",
+        help="Run face recognition in-process instead of calling the ML service "
+        "(or set PIPELINE_MODE=embedded)",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=float(os.environ.get("CAPTURE_INTERVAL", "0")),
+        help="Keep running and capture every INTERVAL seconds (default: capture once)",
+    )
     args = parser.parse_args()
 
     logger.setLevel(logging.DEBUG if args.debug else logging.INFO)
 
     image_data = args.image_data
     seat_id = args.seat_id
-
-    if not image_data:
-        logger.info("No image data provided, capturing from webcam")
-        image_data = capture_image()
-        if image_data is None:
-            logger.error("Image capture failed, exiting")
-            sys.exit(1)
+    embedded = args.embedded or os.environ.get("PIPELINE_MODE") == "embedded"
 
     if not seat_id:
         seat_id = os.environ.get("SEAT_ID", None)
@@ -292,17 +801,60 @@ def main():
             logger.error("No seat ID provided, exiting")
             sys.exit(1)
 
-    logger.info(
-        f"Processing capture with image data (first 20 chars): {image_data[:20]}..."
-    )
-    result, status = process_capture(image_data, seat_id)
-    logger.info(f"Process completed with status: {status}")
-    logger.debug(f"Result: {result}")
+    drainer = None
+    if embedded:
+        from embedded import build_embedded_recognizer
+
+        # Built once; in loop mode every capture reuses the loaded models and gallery.
+        recognizer = build_embedded_recognizer()
+        run = functools.partial(run_embedded, image_data, seat_id, recognizer)
+    else:
+        if not os.environ.get("CAMERA_ID"):
+            logger.info(
+                "CAMERA_ID is not set, so face position (ROI) reuse is disabled"
+            )
+        # Raw frames sent through shared memory are not encoded at all.
+        local_frames = get_frame_client() is not None
+        encoder = None if image_data or local_frames else AdaptiveEncoder.from_env()
+        spool, breaker, drainer = build_spool()
+        run = functools.partial(
+            run_service, image_data, seat_id, encoder, spool, breaker
+        )
+        if drainer is not None and args.interval > 0 and not image_data:
+            drainer.start(idle_interval=args.interval)
+        if (
+            os.environ.get("ML_PREDICT_MODE", "sync") == "async"
+            and args.interval > 0
+            and not image_data
+            and not local_frames
+        ):
+            # Captures only submit jobs; results are published as they finish.
+            _pending_jobs = PendingJobs.from_env(
+                functools.partial(publish_job_result, spool=spool, encoder=encoder)
+            )
+            _pending_jobs.start()
+
+    while True:
+        result, status = run()
+        logger.info(f"Process completed with status: {status}")
+        logger.debug(f"Result: {result}")
+
+        # Print results to stdout as well (for compatibility with existing code)
+        print("Status:", status)
+        print("Result:", result)
+
+        if args.interval <= 0 or image_data:
+            break
+        time.sleep(args.interval)
 
-    # Print results to stdout as well (for compatibility with existing code)
-    print("Status:", status)
-    print("Result:", result)
+    if drainer is not None and not drainer.running:
+        # One-shot runs replay a few spooled entries before exiting.
+        drainer.drain(max_items=int(os.environ.get("DRAIN_BATCH", "10")))
 
+    if _pending_jobs is not None:
+        _pending_jobs.stop(wait=_pending_jobs.timeout)
+    if _frame_client is not None:
+        _frame_client.close()
     logger.info("Camera service shutting down")
     sys.exit(status)
 
@@ -0,0 +1,88 @@
+"""
+Embedded pipeline mode for single-room edge boxes.
+
+Instead of POSTing a base64 frame to the ML service, which then calls the
+database service, the camera imports the ML service's FaceRecognizer and runs
+it in-process on the captured numpy frame. Student details come from a local
+read-only copy of the database service's students table. Only the final seat
+update goes over the network to the frontend.
+
+The recognizer is built by the ML service's recognizer_config module, which
+has no import side effects: unlike its app.py, it starts no frame server,
+preload thread or Flask app. The ML service code is imported from
+ML_SERVICE_DIR (default: ../ml_service next to this directory), and its
+dependencies must be installed (pip install -r ../ml_service/requirements.txt).
+The recognizer reads the same environment variables as the ML service
+(REFERENCE_FACES_DIR, EMBEDDING_BACKEND, SIMILARITY_THRESHOLD, ...).
+"""
+
+import importlib
+import logging
+import os
+import sqlite3
+import sys
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ML_SERVICE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "ml_service"
+)
+
+
+class LocalStudentDirectory:
+    """
+    Read-only snapshot of the students table from a copy of the database
+    service's SQLite file, loaded once at startup.
+    """
+
+    def __init__(self, path):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Student database not found: {path}")
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        conn.row_factory = sqlite3.Row
+        try:
+            rows = conn.execute("SELECT * FROM students").fetchall()
+        finally:
+            conn.close()
+        self.students = {row["studentId"]: dict(row) for row in rows}
+        logger.info(f"Loaded {len(self.students)} students from {path}")
+
+    def get(self, student_id):
+        student = self.students.get(student_id)
+        if student is None:
+            logger.error(f"Student {student_id} not in local student table")
+        return student
+
+
+def load_ml_service(ml_service_dir=None):
+    """
+    Import and return the ML service's recognizer_config module, which builds
+    the recognizer from the same environment variables as the service.
+    """
+    ml_service_dir = os.path.abspath(
+        ml_service_dir or os.environ.get("ML_SERVICE_DIR", DEFAULT_ML_SERVICE_DIR)
+    )
+    if not os.path.exists(os.path.join(ml_service_dir, "recognizer_config.py")):
+        raise FileNotFoundError(f"ML service code not found in {ml_service_dir}")
+    if ml_service_dir not in sys.path:
+        # After the camera's own modules, so its tracing.py is the one used.
+        sys.path.append(ml_service_dir)
+    return importlib.import_module("recognizer_config")
+
+
+def build_embedded_recognizer(student_db_path=None, ml_service_dir=None):
+    """
+    Build an in-process FaceRecognizer that looks students up locally instead
+    of calling the database service. Sharding is not used in embedded mode.
+    """
+    student_db_path = student_db_path or os.environ.get(
+        "STUDENT_DB_PATH", "students.db"
+    )
+    directory = LocalStudentDirectory(student_db_path)
+    ml_service = load_ml_service(ml_service_dir)
+    return ml_service.build_face_recognizer(
+        student_lookup=directory.get,
+        shard_index=None,
+        shard_count=1,
+        shard_urls=[],
+    )
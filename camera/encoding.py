@@ -0,0 +1,184 @@
+"""
+Adaptive frame encoding for the camera.
+
+Frames are encoded with one rung of a quality ladder, from full-resolution
+JPEG down to small WebP. After each ML call the observed latency and
+recognition similarity move the camera along the ladder:
+
+- similarity below CONFIDENCE_LOW steps towards better quality;
+- otherwise latency above LATENCY_HIGH steps towards smaller frames, and
+  latency below LATENCY_LOW steps back towards better quality.
+
+Rungs below ENCODING_MIN_SIDE / ENCODING_MIN_QUALITY are never used, so faces
+stay large and sharp enough to recognise. The camera runs as a one-shot
+script, so the controller state is kept in a small JSON file between runs.
+"""
+
+import json
+import logging
+import os
+
+import cv2
+
+logger = logging.getLogger(__name__)
+
+# Best quality first. max_side None keeps the capture resolution.
+LADDER = (
+    {"max_side": None, "format": "jpg", "quality": 95},
+    {"max_side": 1920, "format": "jpg", "quality": 85},
+    {"max_side": 1280, "format": "jpg", "quality": 80},
+    {"max_side": 1280, "format": "webp", "quality": 75},
+    {"max_side": 960, "format": "webp", "quality": 70},
+    {"max_side": 640, "format": "webp", "quality": 65},
+    {"max_side": 480, "format": "webp", "quality": 60},
+)
+
+QUALITY_FLAGS = {"jpg": cv2.IMWRITE_JPEG_QUALITY, "webp": cv2.IMWRITE_WEBP_QUALITY}
+
+
+def build_ladder(min_side=640, min_quality=60, formats=("jpg", "webp")):
+    """Rungs of LADDER that respect the floor and use an allowed format."""
+    return [
+        profile
+        for profile in LADDER
+        if (profile["max_side"] is None or profile["max_side"] >= min_side)
+        and profile["quality"] >= min_quality
+        and profile["format"] in formats
+    ]
+
+
+def encode_frame(frame, profile):
+    """
+    Resize the frame to the profile's max_side and encode it. Falls back to
+    JPEG if this OpenCV build cannot write WebP. Returns (bytes, format).
+    """
+    height, width = frame.shape[:2]
+    max_side = profile["max_side"]
+    if max_side and max(height, width) > max_side:
+        scale = max_side / max(height, width)
+        frame = cv2.resize(
+            frame,
+            (round(width * scale), round(height * scale)),
+            interpolation=cv2.INTER_AREA,
+        )
+
+    fmt = profile["format"]
+    ok, buffer = cv2.imencode(
+        f".{fmt}", frame, [QUALITY_FLAGS[fmt], profile["quality"]]
+    )
+    if not ok and fmt != "jpg":
+        logger.warning(f"Could not encode {fmt}, falling back to JPEG")
+        fmt = "jpg"
+        ok, buffer = cv2.imencode(
+            ".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, profile["quality"]]
+        )
+    if not ok:
+        return None, fmt
+    return buffer.tobytes(), fmt
+
+
+class AdaptiveEncoder:
+    """
+    Picks the ladder rung for the next capture from EWMAs of ML latency and
+    similarity, and persists that choice in state_path (if given).
+    """
+
+    def __init__(
+        self,
+        ladder=None,
+        state_path=None,
+        latency_high=1.5,
+        latency_low=0.5,
+        confidence_low=0.6,
+        alpha=0.3,
+    ):
+        self.ladder = ladder or build_ladder()
+        self.state_path = state_path
+        self.latency_high = latency_high
+        self.latency_low = latency_low
+        self.confidence_low = confidence_low
+        self.alpha = alpha
+        self.level = 0
+        self.latency = None
+        self.confidence = None
+        self.load()
+
+    @classmethod
+    def from_env(cls):
+        formats = os.environ.get("ENCODING_FORMATS", "jpg,webp").split(",")
+        ladder = build_ladder(
+            min_side=int(os.environ.get("ENCODING_MIN_SIDE", "640")),
+            min_quality=int(os.environ.get("ENCODING_MIN_QUALITY", "60")),
+            formats=[fmt.strip() for fmt in formats],
+        )
+        if os.environ.get("ADAPTIVE_ENCODING", "true").lower() != "true":
+            ladder = ladder[:1]
+        return cls(
+            ladder=ladder,
+            state_path=os.environ.get(
+                "ENCODING_STATE_PATH", "/tmp/camera_encoding_state.json"
+            ),
+            latency_high=float(os.environ.get("LATENCY_HIGH", "1.5")),
+            latency_low=float(os.environ.get("LATENCY_LOW", "0.5")),
+            confidence_low=float(os.environ.get("CONFIDENCE_LOW", "0.6")),
+        )
+
+    @property
+    def profile(self):
+        return self.ladder[self.level]
+
+    def load(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+            self.level = min(max(int(state.get("level", 0)), 0), len(self.ladder) - 1)
+            self.latency = state.get("latency")
+            self.confidence = state.get("confidence")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable encoding state {self.state_path}: {e}")
+
+    def save(self):
+        if not self.state_path:
+            return
+        state = {
+            "level": self.level,
+            "latency": self.latency,
+            "confidence": self.confidence,
+        }
+        try:
+            with open(self.state_path, "w") as f:
+                json.dump(state, f)
+        except OSError as e:
+            logger.warning(f"Could not save encoding state {self.state_path}: {e}")
+
+    def _smooth(self, average, value):
+        if average is None:
+            return value
+        return self.alpha * value + (1 - self.alpha) * average
+
+    def observe(self, latency, confidence=None):
+        """
+        Record one ML call. confidence is the similarity (0-1) of the best
+        match, or None when no face was found or the call failed.
+        """
+        self.latency = self._smooth(self.latency, latency)
+        if confidence is not None:
+            self.confidence = self._smooth(self.confidence, confidence)
+
+        previous = self.level
+        if confidence is not None and self.confidence < self.confidence_low:
+            self.level -= 1
+        elif self.latency > self.latency_high:
+            self.level += 1
+        elif self.latency < self.latency_low:
+            self.level -= 1
+        self.level = min(max(self.level, 0), len(self.ladder) - 1)
+
+        if self.level != previous:
+            logger.info(
+                f"Encoding level {previous} -> {self.level} {self.profile} "
+                f"(latency {self.latency:.2f}s, confidence {self.confidence})"
+            )
+        self.save()
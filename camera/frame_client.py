@@ -0,0 +1,121 @@
+"""
+Client for the ML service's local frame socket (ml_service/frame_transport.py).
+
+When the camera and the ML service share a host, a captured frame is copied
+once, converted to RGB, into a shared-memory segment. Only a small JSON
+header goes over a Unix domain socket, so nothing is JPEG encoded, base64
+encoded or decoded. Both processes need the same /dev/shm (e.g. containers
+started with --ipc=host) and the socket path on a shared volume.
+
+The segment belongs to this client: it is reused for every frame that fits,
+replaced by a larger one when a frame does not, and unlinked by close().
+"""
+
+import json
+import logging
+import os
+import socket
+import struct
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct(">I")
+
+
+class FrameClient:
+    def __init__(self, socket_path, timeout=30.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._sock = None
+        self._segment = None
+
+    @classmethod
+    def from_env(cls):
+        socket_path = os.environ.get("FRAME_SOCKET_PATH")
+        if not socket_path:
+            return None
+        return cls(socket_path, float(os.environ.get("FRAME_SOCKET_TIMEOUT", "30")))
+
+    def predict(self, frame_bgr, request):
+        """
+        Send a BGR frame with the /api/predict fields in request (without
+        Image). Returns (body, status). Raises OSError if the ML service
+        cannot be reached on the socket, and socket.timeout if it does not
+        reply within timeout seconds.
+        """
+        shape = frame_bgr.shape
+        segment = self._segment_for(frame_bgr.nbytes)
+        rgb = np.ndarray(shape, dtype=np.uint8, buffer=segment.buf)
+        cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB, dst=rgb)
+        del rgb
+
+        message = dict(request, shm=segment.name, shape=list(shape))
+        try:
+            reply = self._exchange(message)
+        except socket.timeout:
+            # The service is still working on the frame: sending it again
+            # would only queue a second recognition behind the first. The
+            # late reply must not be read as the next frame's, so drop the
+            # connection.
+            self._disconnect()
+            raise
+        except (ConnectionError, FileNotFoundError):
+            # Refused, reset or a broken pipe: the service may have restarted
+            # since the last frame, so connect once more.
+            self._disconnect()
+            reply = self._exchange(message)
+        except OSError:
+            self._disconnect()
+            raise
+        return reply["body"], reply["status"]
+
+    def _segment_for(self, size):
+        if self._segment is None or self._segment.size < size:
+            self._release_segment()
+            self._segment = shared_memory.SharedMemory(create=True, size=size)
+            logger.debug(f"Created shared memory segment {self._segment.name}")
+        return self._segment
+
+    def _exchange(self, message):
+        if self._sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.socket_path)
+            except OSError:
+                sock.close()
+                raise
+            self._sock = sock
+        data = json.dumps(message).encode("utf-8")
+        self._sock.sendall(HEADER.pack(len(data)) + data)
+        (length,) = HEADER.unpack(self._recv_exactly(HEADER.size))
+        return json.loads(self._recv_exactly(length))
+
+    def _recv_exactly(self, size):
+        chunks = []
+        while size:
+            chunk = self._sock.recv(size)
+            if not chunk:
+                raise ConnectionError("ML service closed the frame socket")
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+    def _disconnect(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _release_segment(self):
+        if self._segment is not None:
+            self._segment.close()
+            self._segment.unlink()
+            self._segment = None
+
+    def close(self):
+        self._disconnect()
+        self._release_segment()
@@ -0,0 +1,108 @@
+"""
+Results of prediction jobs the camera has submitted but not yet published.
+
+In async mode with a capture interval, a capture only submits its frame to
+the ML service's job queue and moves on, so capturing never waits for
+inference. PendingJobs polls the submitted jobs from a background thread and
+hands each finished one to a callback, which publishes the seat update with
+the original capture time. Jobs still unfinished after timeout seconds are
+given up.
+"""
+
+import logging
+import os
+import threading
+import time
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+class PendingJobs:
+    def __init__(self, jobs_url, on_done, poll_interval=0.5, timeout=60.0):
+        self.jobs_url = jobs_url.rstrip("/")
+        self.on_done = on_done
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_env(cls, on_done):
+        return cls(
+            os.environ.get("ML_JOBS_URL", "http://localhost:8000/api/predict/jobs"),
+            on_done,
+            poll_interval=float(os.environ.get("ML_JOB_POLL_INTERVAL", "0.5")),
+            timeout=float(os.environ.get("ML_JOB_TIMEOUT", "60")),
+        )
+
+    def __len__(self):
+        with self._lock:
+            return len(self._jobs)
+
+    def add(self, job_id, context):
+        """Track job_id; context is passed to on_done with the finished job."""
+        with self._lock:
+            self._jobs[job_id] = (time.time() + self.timeout, context)
+
+    def poll(self):
+        """Check every pending job once. Returns how many were finished."""
+        with self._lock:
+            pending = list(self._jobs.items())
+        finished = 0
+        for job_id, (deadline, context) in pending:
+            job = self._fetch(job_id)
+            if job is False:
+                logger.error(f"Prediction job {job_id} is unknown to the ML service")
+                job = None
+            elif job is None or job["status"] not in ("done", "failed"):
+                if time.time() < deadline:
+                    continue
+                logger.error(f"Prediction job {job_id} not done after {self.timeout}s")
+                job = None
+            with self._lock:
+                self._jobs.pop(job_id, None)
+            if job is None:
+                continue
+            finished += 1
+            try:
+                self.on_done(job, context)
+            except Exception as e:
+                logger.error(f"Publishing result of job {job_id} failed: {e}")
+        return finished
+
+    def _fetch(self, job_id):
+        """The job, None if it cannot be checked right now, False if unknown."""
+        try:
+            response = requests.get(f"{self.jobs_url}/{job_id}", timeout=5)
+        except requests.exceptions.RequestException as e:
+            # E.g. the ML service is restarting; its queue keeps the job.
+            logger.warning(f"Could not poll prediction job {job_id}: {e}")
+            return None
+        if response.status_code == 404:
+            return False
+        if response.status_code != 200:
+            logger.warning(f"Polling job {job_id} returned {response.status_code}")
+            return None
+        return response.json()
+
+    def start(self):
+        def run():
+            while not self._stop.is_set():
+                self.poll()
+                self._stop.wait(self.poll_interval)
+
+        self._thread = threading.Thread(target=run, name="job-results", daemon=True)
+        self._thread.start()
+
+    def stop(self, wait=0.0):
+        """Stop polling, after waiting up to wait seconds for pending jobs."""
+        deadline = time.time() + wait
+        while len(self) and time.time() < deadline:
+            time.sleep(self.poll_interval)
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
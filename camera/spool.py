@@ -0,0 +1,354 @@
+"""
+Offline buffering for the camera.
+
+When the ML service or the frontend is unreachable, a capture is written to a
+bounded on-disk spool instead of being lost:
+
+- a "capture" entry holds the encoded frame and still needs recognition;
+- an "update" entry holds a seat update whose recognition already succeeded.
+
+Both keep the original capture time, which is sent as lastSeen when the entry
+is finally published. A SpoolDrainer replays entries oldest first, at most
+DRAIN_RATE per second, backing off exponentially (with jitter) after a
+failure. A CircuitBreaker shared with the live path stops every capture from
+hitting a backend that is known to be down; after it opens, each camera waits
+a jittered reset period before a single trial request, so a restarted backend
+is not hit by every camera at once.
+
+Entries older than the last successful publish for the same seat are dropped
+rather than replayed, since they would overwrite a newer seat state.
+
+Only outages are spooled and retried: connection errors, timeouts and 5xx
+responses. A 4xx response means the backend is up but refused the request
+(e.g. an unknown collection or seat), so it does not count against the
+breaker and the entry is dropped instead of blocking the ones behind it.
+"""
+
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class RetryLater(Exception):
+    """
+    A replay failed in a way worth retrying. entry, if given, replaces the
+    spooled entry (e.g. a capture that was recognized but not yet published).
+    """
+
+    def __init__(self, message, entry=None):
+        super().__init__(message)
+        self.entry = entry
+
+
+class ServiceError(Exception):
+    """A backend answered with an error status."""
+
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+def is_retryable(error):
+    """
+    True for outages worth spooling and retrying: connection errors and
+    timeouts (OSError, which includes requests' exceptions) and 5xx
+    responses. False for 4xx responses and anything unexpected.
+    """
+    if isinstance(error, RetryLater):
+        return True
+    if isinstance(error, ServiceError):
+        return error.status >= 500
+    return isinstance(error, OSError)
+
+
+class Spool:
+    """
+    A directory of JSON entries, one file each, named so that they sort
+    oldest first. Holds at most max_entries files and max_bytes in total; the
+    oldest entries are dropped to make room.
+    """
+
+    def __init__(self, directory, max_entries=500, max_bytes=200 * 1024 * 1024):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.published_path = os.path.join(directory, "published.json")
+        # The drainer thread and the live capture loop both update it.
+        self._published_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        directory = os.environ.get("SPOOL_DIR")
+        if not directory:
+            return None
+        return cls(
+            directory,
+            max_entries=int(os.environ.get("SPOOL_MAX_ENTRIES", "500")),
+            max_bytes=int(float(os.environ.get("SPOOL_MAX_MB", "200")) * 1024 * 1024),
+        )
+
+    def paths(self):
+        return sorted(
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if name.endswith(".entry.json")
+        )
+
+    def __len__(self):
+        return len(self.paths())
+
+    def put(self, entry):
+        """Write an entry atomically, dropping the oldest ones if over the bounds."""
+        name = f"{time.time():017.6f}-{uuid.uuid4().hex[:8]}.entry.json"
+        path = os.path.join(self.directory, name)
+        self._write(path, entry)
+        self._enforce_bounds()
+        logger.info(f"Spooled {entry.get('kind')} entry ({len(self)} waiting)")
+        return path
+
+    def replace(self, path, entry):
+        self._write(path, entry)
+
+    def _write(self, path, entry):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            self.remove(tmp_path)
+            raise
+
+    def _enforce_bounds(self):
+        paths = self.paths()
+        sizes = {path: os.path.getsize(path) for path in paths}
+        total = sum(sizes.values())
+        while paths and (len(paths) > self.max_entries or total > self.max_bytes):
+            oldest = paths.pop(0)
+            total -= sizes[oldest]
+            self.remove(oldest)
+            logger.warning(f"Spool full, dropped oldest entry {oldest}")
+
+    def load(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Dropping unreadable spool entry {path}: {e}")
+            self.remove(path)
+            return None
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _published(self):
+        try:
+            with open(self.published_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def mark_published(self, classroom_id, seat_id, last_seen):
+        """Remember the newest lastSeen published for a seat."""
+        key = f"{classroom_id}/{seat_id}"
+        with self._published_lock:
+            published = self._published()
+            if last_seen > published.get(key, ""):
+                published[key] = last_seen
+                self._write(self.published_path, published)
+
+    def is_superseded(self, classroom_id, seat_id, last_seen):
+        with self._published_lock:
+            published = self._published().get(f"{classroom_id}/{seat_id}")
+        return published is not None and last_seen < published
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures. While open, allow()
+    is False until a jittered reset period has passed; then one trial is
+    allowed, and its outcome closes or re-opens the breaker. State is kept in
+    state_path so it survives between one-shot camera runs.
+    """
+
+    def __init__(self, failure_threshold=3, reset_seconds=30.0, state_path=None):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state_path = state_path
+        self.failures = 0
+        self.open_until = 0.0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+            self.failures = int(state.get("failures", 0))
+            self.open_until = float(state.get("open_until", 0.0))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable breaker state {self.state_path}: {e}")
+
+    def _save(self):
+        if not self.state_path:
+            return
+        # Written to a temporary file and renamed, so a crash mid-write
+        # leaves the previous state rather than a truncated file.
+        state = {"failures": self.failures, "open_until": self.open_until}
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(
+                dir=os.path.dirname(os.path.abspath(self.state_path)), suffix=".tmp"
+            )
+            with os.fdopen(fd, "w") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            logger.warning(f"Could not save breaker state {self.state_path}: {e}")
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    @property
+    def is_open(self):
+        return self.failures >= self.failure_threshold
+
+    def allow(self):
+        with self._lock:
+            if not self.is_open:
+                return True
+            if time.time() < self.open_until:
+                return False
+            # Half-open: let this one request through and hold off the rest
+            # until it reports back.
+            self.open_until = time.time() + self.reset_seconds
+            self._save()
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self.is_open:
+                logger.info("Circuit breaker closed")
+            self.failures = 0
+            self.open_until = 0.0
+            self._save()
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.is_open:
+                self.open_until = time.time() + self.reset_seconds * random.uniform(
+                    1.0, 1.5
+                )
+                logger.warning(
+                    f"Circuit breaker open after {self.failures} failures, "
+                    f"next trial in {self.open_until - time.time():.0f}s"
+                )
+            self._save()
+
+
+class SpoolDrainer:
+    """
+    Replays spooled entries through handler(entry), oldest first, at most
+    rate entries per second. handler returns when the entry is done: False if
+    it was skipped without contacting a backend, anything else once published.
+    It raises when the entry could not be published. Retryable errors (see
+    is_retryable) keep the entry for later, up to max_attempts replays; any
+    other error drops it at once and the drain moves on to the next entry.
+    """
+
+    def __init__(
+        self, spool, handler, breaker, rate=1.0, max_backoff=300.0, max_attempts=10
+    ):
+        self.spool = spool
+        self.handler = handler
+        self.breaker = breaker
+        self.rate = rate
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+        self.backoff = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def drain(self, max_items=None):
+        """
+        Replay up to max_items entries; stops at the first retryable failure
+        or when the breaker is open. Returns how many entries were completed
+        (published, skipped or dropped as rejected).
+        """
+        done = 0
+        for path in self.spool.paths():
+            if max_items is not None and done >= max_items:
+                break
+            if self._stop.is_set() or not self.breaker.allow():
+                break
+            entry = self.spool.load(path)
+            if entry is None:
+                continue
+            try:
+                outcome = self.handler(entry)
+            except Exception as e:
+                if is_retryable(e):
+                    if isinstance(e, RetryLater) and e.entry is not None:
+                        entry = e.entry
+                    self._failed(path, entry, e)
+                    break
+                # The backend is up but refused the entry; retrying cannot help.
+                logger.error(f"Dropping spooled {entry.get('kind')} entry: {e}")
+                outcome = None
+            self.spool.remove(path)
+            done += 1
+            if outcome is False:
+                continue
+            self.breaker.record_success()
+            self.backoff = 0.0
+            if self.rate > 0:
+                self._stop.wait(1.0 / self.rate)
+        if done:
+            logger.info(f"Replayed {done} spooled entries ({len(self.spool)} left)")
+        return done
+
+    def _failed(self, path, entry, error):
+        logger.warning(f"Spool replay failed: {error}")
+        entry["attempts"] = entry.get("attempts", 0) + 1
+        if entry["attempts"] >= self.max_attempts:
+            logger.error(f"Dropping spool entry after {entry['attempts']} attempts")
+            self.spool.remove(path)
+        else:
+            self.spool.replace(path, entry)
+        self.breaker.record_failure()
+        # Exponential backoff with full jitter.
+        self.backoff = min(self.max_backoff, max(1.0, self.backoff * 2))
+        self._stop.wait(random.uniform(0, self.backoff))
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, idle_interval=5.0):
+        def run():
+            # Cameras that restarted together should not drain in lockstep.
+            self._stop.wait(random.uniform(0, idle_interval))
+            while not self._stop.is_set():
+                self.drain()
+                self._stop.wait(idle_interval)
+
+        self._thread = threading.Thread(target=run, name="spool-drainer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
@@ -1,9 +1,14 @@
 import pytest
 import sys
+import time
+
+import requests
 from app import (
+    build_ml_payload,
     call_ml_service,
+    call_ml_service_async,
     query_student_db,
-    update_frontend,
+    update_frontend_batch,
     process_capture,
     main,
 )
@@ -25,7 +30,7 @@ class DummyResponse:
 
 def test_call_ml_service_success(monkeypatch):
     # Simulate a successful ML service response.
-    def dummy_post(url, json):
+    def dummy_post(url, json, headers=None):
         return DummyResponse(
             200,
             {
@@ -49,7 +54,7 @@ def test_call_ml_service_success(monkeypatch):
 
 def test_call_ml_service_failure(monkeypatch):
     # Simulate a failure (non-200 response) from the ML service.
-    def dummy_post(url, json):
+    def dummy_post(url, json, headers=None):
         return DummyResponse(500, None, "ML Service error occurred")
 
     monkeypatch.setattr("app.requests.post", dummy_post)
@@ -58,6 +63,78 @@ def test_call_ml_service_failure(monkeypatch):
     assert "ML Service error" in str(excinfo.value)
 
 
+def test_call_ml_service_async_polls_until_done(monkeypatch):
+    monkeypatch.setenv("ML_JOBS_URL", "http://ml/api/predict/jobs")
+    monkeypatch.setenv("ML_JOB_POLL_INTERVAL", "0")
+    polls = [
+        DummyResponse(200, {"jobId": "job1", "status": "queued"}),
+        DummyResponse(200, {"jobId": "job1", "status": "running"}),
+        DummyResponse(
+            200,
+            {
+                "jobId": "job1",
+                "status": "done",
+                "statusCode": 200,
+                "result": {"match": True, "studentId": "stu123"},
+            },
+        ),
+    ]
+
+    def dummy_post(url, json, headers=None):
+        assert json["Image"]["Bytes"] == "dummy_image"
+        return DummyResponse(202, {"jobId": "job1", "status": "queued"})
+
+    def dummy_get(url, timeout=None):
+        assert url == "http://ml/api/predict/jobs/job1"
+        assert 0 < timeout <= 60
+        return polls.pop(0)
+
+    monkeypatch.setattr("app.requests.post", dummy_post)
+    monkeypatch.setattr("app.requests.get", dummy_get)
+    result = call_ml_service_async("dummy_image")
+    assert result == {"match": True, "studentId": "stu123"}
+    assert polls == []
+
+
+def test_call_ml_service_async_failed_job(monkeypatch):
+    monkeypatch.setenv("ML_JOB_POLL_INTERVAL", "0")
+    monkeypatch.setattr(
+        "app.requests.post",
+        lambda url, json, headers=None: DummyResponse(
+            202, {"jobId": "job1", "status": "queued"}
+        ),
+    )
+    monkeypatch.setattr(
+        "app.requests.get",
+        lambda url, timeout=None: DummyResponse(
+            200, {"jobId": "job1", "status": "failed", "error": "boom"}
+        ),
+    )
+    with pytest.raises(Exception) as excinfo:
+        call_ml_service_async("dummy_image")
+    assert "boom" in str(excinfo.value)
+
+
+def test_call_ml_service_async_poll_timeouts_respect_deadline(monkeypatch):
+    monkeypatch.setenv("ML_JOB_TIMEOUT", "0.3")
+    monkeypatch.setenv("ML_JOB_POLL_INTERVAL", "0")
+    monkeypatch.setattr(
+        "app.requests.post",
+        lambda url, json, headers=None: DummyResponse(202, {"jobId": "job1"}),
+    )
+    timeouts = []
+
+    def hung_get(url, timeout=None):
+        timeouts.append(timeout)
+        time.sleep(min(timeout, 0.1))
+        raise requests.exceptions.ReadTimeout("no reply")
+
+    monkeypatch.setattr("app.requests.get", hung_get)
+    with pytest.raises(TimeoutError):
+        call_ml_service_async("dummy_image")
+    assert timeouts and all(t <= 0.3 for t in timeouts)
+
+
 # -------- Tests for query_student_db --------
 
 
@@ -92,42 +169,6 @@ def test_query_student_db_failure(monkeypatch):
     assert "Student DB error" in str(excinfo.value)
 
 
-# -------- Tests for update_frontend --------
-
-
-def test_update_frontend_success(monkeypatch):
-    def dummy_post(url, json):
-        return DummyResponse(200, {"message": "Update successful"})
-
-    monkeypatch.setattr("app.requests.post", dummy_post)
-    payload = {
-        "studentId": "stu123",
-        "name": "Alice Johnson",
-        "seatId": "seat5",
-        "confidence": 0.998,
-        "lastSeen": "dummy",
-    }
-    result = update_frontend(payload)
-    assert result["message"] == "Update successful"
-
-
-def test_update_frontend_failure(monkeypatch):
-    def dummy_post(url, json):
-        return DummyResponse(500, None, "Update failed")
-
-    monkeypatch.setattr("app.requests.post", dummy_post)
-    payload = {
-        "studentId": "stu123",
-        "name": "Alice Johnson",
-        "seatId": "seat5",
-        "confidence": 0.998,
-        "lastSeen": "dummy",
-    }
-    with pytest.raises(Exception) as excinfo:
-        update_frontend(payload)
-    assert "Frontend UI error" in str(excinfo.value)
-
-
 # -------- Tests for process_capture --------
 
 
@@ -163,7 +204,7 @@ def dummy_frontend_success(payload):
 def test_process_capture_success(monkeypatch):
     monkeypatch.setattr("app.call_ml_service", dummy_ml_success)
     monkeypatch.setattr("app.query_student_db", dummy_student_success)
-    monkeypatch.setattr("app.update_frontend", dummy_frontend_success)
+    monkeypatch.setattr("app.update_frontend_batch", dummy_frontend_success)
 
     result, status = process_capture("dummy_image")
     assert status == 200
@@ -201,3 +242,118 @@ def test_main_success(monkeypatch, capsys):
     captured = capsys.readouterr().out
     assert "Status: 0" in captured
     assert "test success" in captured
+
+
+def test_update_frontend_batch_success(monkeypatch):
+    sent = {}
+
+    def dummy_post(url, json, headers=None):
+        sent["json"] = json
+        return DummyResponse(200, {"status": "success", "versions": {"classroom1": 3}})
+
+    monkeypatch.setattr("app.requests.post", dummy_post)
+    updates = [
+        {"classroomId": "classroom1", "seatId": "seat1", "name": "Alice Johnson"},
+        {"classroomId": "classroom1", "seatId": "seat2", "name": "Bob Smith"},
+    ]
+    result = update_frontend_batch(updates)
+    assert sent["json"] == {"updates": updates}
+    assert result["versions"]["classroom1"] == 3
+
+
+def test_process_capture_sends_one_batch(monkeypatch):
+    batches = []
+    monkeypatch.setenv("CLASSROOM_ID", "classroom2")
+    monkeypatch.setattr(
+        "app.call_ml_service",
+        lambda image_data: {
+            "match": True,
+            "similarity": 91.0,
+            "studentId": "stu123",
+            "studentInfo": {"name": "Alice Johnson"},
+        },
+    )
+
+    def dummy_batch(updates):
+        batches.append(updates)
+        return {"status": "success", "versions": {"classroom2": 1}}
+
+    monkeypatch.setattr("app.update_frontend_batch", dummy_batch)
+    result, status = process_capture("dummy_image", "seat5")
+    assert status == 200
+    assert len(batches) == 1
+    assert batches[0][0]["classroomId"] == "classroom2"
+    assert batches[0][0]["seatId"] == "seat5"
+    assert result["frontend_response"]["versions"] == {"classroom2": 1}
+
+
+def test_process_capture_reports_latency_and_similarity(monkeypatch):
+    observed = []
+
+    class RecordingEncoder:
+        def observe(self, latency, confidence=None):
+            observed.append((latency, confidence))
+
+    monkeypatch.setattr(
+        "app.call_ml_service",
+        lambda image_data: {"match": False, "similarity": 42.0},
+    )
+    result, status = process_capture("dummy_image", "seat1", RecordingEncoder())
+    assert status == 400
+    assert len(observed) == 1
+    assert observed[0][0] >= 0
+    assert observed[0][1] == 0.42
+
+
+def test_call_ml_service_retries_unavailable_service(monkeypatch):
+    monkeypatch.setenv("ML_RETRY_BACKOFF", "0")
+    responses = [
+        requests.exceptions.ConnectionError("refused"),
+        DummyResponse(503, None, "Server overloaded"),
+        DummyResponse(200, {"match": False}),
+    ]
+
+    def dummy_post(url, json, headers=None):
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    monkeypatch.setattr("app.requests.post", dummy_post)
+    assert call_ml_service("dummy_image") == {"match": False}
+    assert responses == []
+
+
+def test_process_capture_propagates_one_trace(monkeypatch):
+    sent = []
+
+    def dummy_post(url, json, headers=None):
+        sent.append((url, headers["traceparent"]))
+        if "predict" in url:
+            return DummyResponse(
+                200,
+                {
+                    "match": True,
+                    "similarity": 91.0,
+                    "studentId": "stu123",
+                    "studentInfo": {"name": "Alice"},
+                },
+            )
+        return DummyResponse(200, {"status": "success", "versions": {}})
+
+    monkeypatch.setattr("app.requests.post", dummy_post)
+    result, status = process_capture("dummy_image", "seat1")
+    assert status == 200
+    assert len(sent) == 2
+    (_, ml_parent), (_, frontend_parent) = sent
+    # Same trace, sent from the ml_predict and seat_update spans respectively.
+    assert ml_parent.split("-")[1] == frontend_parent.split("-")[1]
+    assert ml_parent.split("-")[2] != frontend_parent.split("-")[2]
+
+
+def test_source_id_is_only_sent_with_camera_id(monkeypatch):
+    monkeypatch.delenv("CAMERA_ID", raising=False)
+    assert "SourceId" not in build_ml_payload("abc")
+
+    monkeypatch.setenv("CAMERA_ID", "room-101-front")
+    assert build_ml_payload("abc")["SourceId"] == "room-101-front"
@@ -0,0 +1,114 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+from app import process_frame
+from embedded import (
+    DEFAULT_ML_SERVICE_DIR,
+    LocalStudentDirectory,
+    build_embedded_recognizer,
+)
+
+
+def write_students(path):
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE students (studentId TEXT PRIMARY KEY, name TEXT NOT NULL, "
+        "email TEXT NOT NULL, photoReference TEXT)"
+    )
+    conn.execute(
+        "INSERT INTO students VALUES (?, ?, ?, ?)",
+        ("stu123", "Alice Johnson", "alice@example.com", "stu123.jpg"),
+    )
+    conn.commit()
+    conn.close()
+
+
+def test_local_student_directory_is_read_only_snapshot(tmp_path):
+    path = str(tmp_path / "students.db")
+    write_students(path)
+    directory = LocalStudentDirectory(path)
+
+    assert directory.get("stu123")["name"] == "Alice Johnson"
+    assert directory.get("missing") is None
+
+    with pytest.raises(FileNotFoundError):
+        LocalStudentDirectory(str(tmp_path / "nope.db"))
+
+
+def test_process_frame_recognizes_in_process_and_publishes(monkeypatch):
+    frames, batches = [], []
+
+    class FakeRecognizer:
+        def recognize_face(self, img_rgb, collection_id=None, source_id=None):
+            frames.append(img_rgb)
+            return {
+                "match": True,
+                "similarity": 93.0,
+                "studentId": "stu123",
+                "studentInfo": {"name": "Alice Johnson"},
+            }
+
+    def fail_ml_call(image_data):
+        raise AssertionError("embedded mode must not call the ML service")
+
+    def dummy_batch(updates):
+        batches.append(updates)
+        return {"status": "success", "versions": {"classroom1": 1}}
+
+    monkeypatch.setattr("app.call_ml_service", fail_ml_call)
+    monkeypatch.setattr("app.update_frontend_batch", dummy_batch)
+
+    frame = np.zeros((48, 64, 3), dtype=np.uint8)
+    frame[:, :, 0] = 255  # blue in BGR
+    result, status = process_frame(frame, "seat3", FakeRecognizer())
+
+    assert status == 200
+    assert frames[0][0, 0].tolist() == [0, 0, 255]  # handed over as RGB
+    assert batches[0][0]["name"] == "Alice Johnson"
+    assert batches[0][0]["seatId"] == "seat3"
+    assert batches[0][0]["confidence"] == 0.93
+
+
+@pytest.mark.skipif(
+    not os.path.exists(os.path.join(DEFAULT_ML_SERVICE_DIR, "face_recognition.py")),
+    reason="ml_service code is not next to the camera",
+)
+def test_build_embedded_recognizer_uses_local_students(tmp_path, monkeypatch):
+    path = str(tmp_path / "students.db")
+    write_students(path)
+    monkeypatch.setenv("REFERENCE_FACES_DIR", str(tmp_path / "faces"))
+
+    recognizer = build_embedded_recognizer(student_db_path=path)
+
+    assert recognizer.get_student_info("stu123")["email"] == "alice@example.com"
+    assert recognizer.gallery is None
+
+
+@pytest.mark.skipif(
+    not os.path.exists(os.path.join(DEFAULT_ML_SERVICE_DIR, "recognizer_config.py")),
+    reason="ml_service code is not next to the camera",
+)
+def test_loading_ml_service_has_no_side_effects(tmp_path):
+    code = (
+        "import sys, threading, tracing, embedded; "
+        "config = embedded.load_ml_service(); "
+        "import face_recognition; "
+        "print(sorted(m for m in ('flask', 'ml_service_app') if m in sys.modules), "
+        "threading.active_count(), face_recognition.tracing is tracing)"
+    )
+    env = dict(
+        os.environ,
+        FRAME_SOCKET_PATH=str(tmp_path / "frames.sock"),
+        PRELOAD_RECOGNIZER="true",
+    )
+    output = subprocess.check_output(
+        [sys.executable, "-c", code],
+        cwd=os.path.join(os.path.dirname(__file__), ".."),
+        env=env,
+    )
+    assert output.split() == [b"[]", b"1", b"True"]
+    assert not (tmp_path / "frames.sock").exists()
@@ -0,0 +1,63 @@
+import numpy as np
+from encoding import AdaptiveEncoder, build_ladder, encode_frame
+
+
+def frame(width=1920, height=1080):
+    img = np.zeros((height, width, 3), dtype=np.uint8)
+    img[:, : width // 2] = (40, 120, 200)
+    return img
+
+
+def test_ladder_respects_floor_and_formats():
+    ladder = build_ladder(min_side=960, min_quality=70, formats=["jpg"])
+    assert all(p["format"] == "jpg" for p in ladder)
+    assert all(p["max_side"] is None or p["max_side"] >= 960 for p in ladder)
+    assert all(p["quality"] >= 70 for p in ladder)
+    assert ladder[0]["max_side"] is None
+
+
+def test_encode_frame_resizes_and_uses_format():
+    data, fmt = encode_frame(frame(), {"max_side": 640, "format": "jpg", "quality": 80})
+    assert fmt == "jpg" and data[:2] == b"\xff\xd8"
+
+    data, fmt = encode_frame(
+        frame(), {"max_side": 640, "format": "webp", "quality": 70}
+    )
+    assert fmt == "webp" and data[:4] == b"RIFF" and data[8:12] == b"WEBP"
+
+    full, _ = encode_frame(frame(), {"max_side": None, "format": "jpg", "quality": 80})
+    assert len(full) > len(data)
+
+
+def test_high_latency_steps_down_to_floor():
+    encoder = AdaptiveEncoder(ladder=build_ladder(min_side=960), alpha=1.0)
+    for _ in range(10):
+        encoder.observe(latency=3.0, confidence=0.9)
+    assert encoder.level == len(encoder.ladder) - 1
+    assert encoder.profile["max_side"] == 960
+
+
+def test_low_confidence_steps_back_up():
+    encoder = AdaptiveEncoder(alpha=1.0)
+    encoder.level = 3
+    encoder.observe(latency=3.0, confidence=0.4)
+    assert encoder.level == 2
+
+
+def test_fast_responses_restore_quality():
+    encoder = AdaptiveEncoder(alpha=1.0)
+    encoder.level = 2
+    encoder.observe(latency=0.1)
+    encoder.observe(latency=0.1)
+    assert encoder.level == 0
+
+
+def test_state_persists_between_runs(tmp_path):
+    path = str(tmp_path / "state.json")
+    first = AdaptiveEncoder(state_path=path, alpha=1.0)
+    first.observe(latency=2.0, confidence=0.95)
+
+    second = AdaptiveEncoder(state_path=path, alpha=1.0)
+    assert second.level == 1
+    assert second.latency == 2.0
+    assert second.confidence == 0.95
@@ -0,0 +1,135 @@
+import json
+import socket
+import struct
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+import app
+from frame_client import FrameClient
+from spool import Spool
+
+HEADER = struct.Struct(">I")
+
+
+def recv_exactly(conn, size):
+    data = b""
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+@pytest.fixture
+def frame_server(tmp_path):
+    """Stand-in for the ML service's frame socket: replies with the mean RGB."""
+    path = str(tmp_path / "frames.sock")
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen(1)
+    requests = []
+
+    def serve():
+        conn, _ = listener.accept()
+        while True:
+            header = recv_exactly(conn, HEADER.size)
+            if header is None:
+                break
+            request = json.loads(recv_exactly(conn, HEADER.unpack(header)[0]))
+            requests.append(request)
+            segment = shared_memory.SharedMemory(name=request["shm"])
+            frame = np.ndarray(request["shape"], dtype=np.uint8, buffer=segment.buf)
+            body = {"mean": frame.reshape(-1, 3).mean(axis=0).tolist()}
+            del frame
+            segment.close()
+            data = json.dumps({"status": 200, "body": body}).encode()
+            conn.sendall(HEADER.pack(len(data)) + data)
+        conn.close()
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    yield path, requests
+    listener.close()
+
+
+def test_frames_are_sent_as_rgb_through_shared_memory(frame_server):
+    path, requests = frame_server
+    client = FrameClient(path, timeout=5)
+    frame = np.zeros((4, 6, 3), dtype=np.uint8)
+    frame[:] = (30, 20, 10)  # BGR
+
+    body, status = client.predict(frame, {"SourceId": "cam"})
+    assert status == 200 and body == {"mean": [10, 20, 30]}
+
+    body, _ = client.predict(np.full((2, 3, 3), 7, dtype=np.uint8), {})
+    assert body == {"mean": [7, 7, 7]}
+    # The smaller frame reused the first segment.
+    assert requests[0]["shm"] == requests[1]["shm"]
+    assert requests[0]["shape"] == [4, 6, 3] and requests[0]["SourceId"] == "cam"
+    client.close()
+
+
+def test_unreachable_socket_falls_back_to_http(tmp_path, monkeypatch):
+    monkeypatch.setenv("FRAME_SOCKET_PATH", str(tmp_path / "missing.sock"))
+    monkeypatch.setattr(app, "_frame_client", None)
+    sent = []
+    monkeypatch.setattr(
+        app, "call_ml_service", lambda image_data: sent.append(image_data) or {}
+    )
+
+    app.predict(np.zeros((4, 6, 3), dtype=np.uint8))
+    assert isinstance(sent[0], str)
+    app.get_frame_client().close()
+
+
+def test_raw_frame_is_encoded_only_when_spooled(tmp_path, monkeypatch):
+    def down(image_data):
+        raise ConnectionError("ML service down")
+
+    monkeypatch.setattr(app, "predict", down)
+    spool = Spool(str(tmp_path / "spool"))
+    _, status = app.process_capture(
+        np.zeros((4, 6, 3), dtype=np.uint8), "seat1", spool=spool
+    )
+    assert status == 202
+    entry = spool.load(spool.paths()[0])
+    assert app.decode_frame(entry["image"]).shape == (4, 6, 3)
+
+
+def test_timeout_is_not_sent_again(tmp_path, monkeypatch):
+    path = str(tmp_path / "slow.sock")
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen(2)
+    client = FrameClient(path, timeout=0.2)
+    monkeypatch.setattr(app, "_frame_client", client)
+    monkeypatch.setattr(
+        app, "call_ml_service", lambda image_data: pytest.fail("sent over HTTP")
+    )
+
+    with pytest.raises(socket.timeout):
+        app.call_ml_service_local(np.zeros((4, 6, 3), dtype=np.uint8))
+    conn, _ = listener.accept()
+    listener.settimeout(0.1)
+    with pytest.raises(socket.timeout):
+        listener.accept()  # no second connection with the same frame
+    conn.close()
+    listener.close()
+    client.close()
+
+
+def test_stale_connection_is_reconnected(frame_server):
+    path, requests = frame_server
+    client = FrameClient(path, timeout=5)
+    stale_pair, other = socket.socketpair()
+    other.close()
+    client._sock = stale_pair  # the peer has gone away, as after a restart
+
+    body, status = client.predict(np.full((2, 2, 3), 5, dtype=np.uint8), {})
+    assert status == 200 and body == {"mean": [5, 5, 5]}
+    assert len(requests) == 1
+    client.close()
@@ -0,0 +1,65 @@
+import pytest
+
+import app
+from pending_jobs import PendingJobs
+
+
+class DummyResponse:
+    def __init__(self, status_code, json_data):
+        self.status_code = status_code
+        self._json = json_data
+
+    def json(self):
+        return self._json
+
+
+@pytest.fixture
+def ml_jobs(monkeypatch):
+    """Fake job endpoints: jobs stay queued until the test finishes them."""
+    jobs = {}
+
+    def fake_post(url, json, headers=None):
+        job_id = f"job{len(jobs) + 1}"
+        jobs[job_id] = {"jobId": job_id, "status": "queued"}
+        return DummyResponse(202, {"jobId": job_id, "status": "queued"})
+
+    def fake_get(url, timeout=None):
+        job = jobs.get(url.rsplit("/", 1)[1])
+        return DummyResponse(200, job) if job else DummyResponse(404, {})
+
+    monkeypatch.setattr("app.requests.post", fake_post)
+    monkeypatch.setattr("pending_jobs.requests.get", fake_get)
+    return jobs
+
+
+def test_capture_submits_without_waiting(ml_jobs, monkeypatch):
+    published = []
+    monkeypatch.setattr(
+        "app.update_frontend_batch",
+        lambda updates: published.extend(updates) or {"status": "success"},
+    )
+    pending = PendingJobs("http://ml/api/predict/jobs", app.publish_job_result)
+    monkeypatch.setattr(app, "_pending_jobs", pending)
+
+    result, status = app.process_capture("frame1", "seat1")
+    assert status == 202 and result == {"jobId": "job1", "status": "queued"}
+    assert pending.poll() == 0 and published == []
+
+    ml_jobs["job1"].update(
+        status="done",
+        statusCode=200,
+        result={"match": True, "similarity": 91.0, "studentId": "stu123"},
+    )
+    assert pending.poll() == 1 and len(pending) == 0
+    assert published[0]["seatId"] == "seat1"
+    assert published[0]["studentId"] == "stu123"
+
+
+def test_unfinished_jobs_are_given_up(ml_jobs):
+    done = []
+    pending = PendingJobs("http://ml/api/predict/jobs", done.append, timeout=0)
+    pending.add("job-missing", {})
+    ml_jobs["job1"] = {"jobId": "job1", "status": "running"}
+    pending.add("job1", {})
+    assert pending.poll() == 0
+    assert len(pending) == 0 and done == []
@@ -0,0 +1,200 @@
+import functools
+import json
+import os
+
+import pytest
+
+import app
+from spool import CircuitBreaker, ServiceError, Spool, SpoolDrainer
+
+MATCH = {
+    "match": True,
+    "similarity": 91.0,
+    "studentId": "stu123",
+    "studentInfo": {"name": "Alice Johnson"},
+}
+
+
+@pytest.fixture
+def backends(monkeypatch):
+    """Fake ML service and frontend that can be taken down and brought back."""
+    state = {"ml_up": False, "frontend_up": True, "ml_calls": 0, "published": []}
+
+    def fake_predict(image_data):
+        state["ml_calls"] += 1
+        if not state["ml_up"]:
+            raise ConnectionError("ML service down")
+        return dict(MATCH)
+
+    def fake_batch(updates):
+        if not state["frontend_up"]:
+            raise ConnectionError("Frontend down")
+        state["published"].extend(updates)
+        return {"status": "success"}
+
+    monkeypatch.setattr(app, "predict", fake_predict)
+    monkeypatch.setattr(app, "update_frontend_batch", fake_batch)
+    monkeypatch.setenv("CLASSROOM_ID", "room1")
+    return state
+
+
+def make_drainer(spool, breaker):
+    return SpoolDrainer(
+        spool, functools.partial(app.replay_entry, spool=spool), breaker, rate=0
+    )
+
+
+def test_spool_drops_oldest_entries_beyond_bounds(tmp_path):
+    spool = Spool(str(tmp_path), max_entries=3)
+    for i in range(5):
+        spool.put({"kind": "update", "n": i})
+    assert [spool.load(path)["n"] for path in spool.paths()] == [2, 3, 4]
+
+
+def test_breaker_opens_and_allows_one_trial(tmp_path, monkeypatch):
+    state_path = str(tmp_path / "breaker.json")
+    breaker = CircuitBreaker(
+        failure_threshold=2, reset_seconds=10, state_path=state_path
+    )
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+    # State survives a restart of the (one-shot) camera.
+    assert not CircuitBreaker(2, 10, state_path).allow()
+
+    trial_at = breaker.open_until + 1
+    monkeypatch.setattr("spool.time.time", lambda: trial_at)
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.allow()
+
+
+def test_breaker_state_is_replaced_not_truncated(tmp_path, monkeypatch):
+    state_path = tmp_path / "breaker.json"
+    breaker = CircuitBreaker(failure_threshold=2, state_path=str(state_path))
+    breaker.record_failure()
+
+    def failing_dump(state, f):
+        f.write('{"failures": ')
+        raise OSError("disk full")
+
+    monkeypatch.setattr("spool.json.dump", failing_dump)
+    breaker.record_failure()
+    monkeypatch.undo()
+
+    # The interrupted save left the previous state and no temporary file.
+    assert json.loads(state_path.read_text())["failures"] == 1
+    assert os.listdir(tmp_path) == ["breaker.json"]
+
+
+def test_outage_is_spooled_and_replayed_with_original_timestamp(tmp_path, backends):
+    spool = Spool(str(tmp_path))
+    breaker = CircuitBreaker(failure_threshold=5)
+
+    result, status = app.process_capture(
+        "frame1", "seat1", spool=spool, breaker=breaker
+    )
+    assert status == 202 and result["spooled"] is True
+    captured_at = spool.load(spool.paths()[0])["capturedAt"]
+
+    backends["ml_up"] = True
+    assert make_drainer(spool, breaker).drain() == 1
+    assert len(spool) == 0
+    assert backends["published"][0]["lastSeen"] == captured_at
+    assert backends["published"][0]["classroomId"] == "room1"
+
+
+def test_frontend_failure_keeps_recognition_result(tmp_path, backends):
+    spool = Spool(str(tmp_path))
+    breaker = CircuitBreaker(failure_threshold=5)
+    backends["ml_up"] = True
+    backends["frontend_up"] = False
+
+    _, status = app.process_capture("frame1", "seat1", spool=spool, breaker=breaker)
+    assert status == 202
+    assert spool.load(spool.paths()[0])["kind"] == "update"
+
+    backends["frontend_up"] = True
+    make_drainer(spool, breaker).drain()
+    # Replaying the update does not call the ML service again.
+    assert backends["ml_calls"] == 1
+    assert len(backends["published"]) == 1
+
+
+def test_entries_older_than_a_live_publish_are_skipped(tmp_path, backends):
+    spool = Spool(str(tmp_path))
+    breaker = CircuitBreaker(failure_threshold=5)
+    app.process_capture("old", "seat1", spool=spool, breaker=breaker)
+
+    backends["ml_up"] = True
+    _, status = app.process_capture("new", "seat1", spool=spool, breaker=breaker)
+    assert status == 200
+
+    assert make_drainer(spool, breaker).drain() == 1
+    assert len(backends["published"]) == 1
+    assert backends["ml_calls"] == 2
+
+
+def test_open_breaker_spools_without_calling(tmp_path, backends):
+    spool = Spool(str(tmp_path))
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=60)
+
+    app.process_capture("frame1", "seat1", spool=spool, breaker=breaker)
+    app.process_capture("frame2", "seat1", spool=spool, breaker=breaker)
+    assert backends["ml_calls"] == 1
+    assert len(spool) == 2
+    # The drainer waits for the breaker too.
+    assert make_drainer(spool, breaker).drain() == 0
+
+
+def test_failed_replays_back_off_and_give_up(tmp_path, backends, monkeypatch):
+    spool = Spool(str(tmp_path))
+    breaker = CircuitBreaker(failure_threshold=100)
+    app.process_capture("frame1", "seat1", spool=spool, breaker=breaker)
+
+    drainer = make_drainer(spool, breaker)
+    drainer.max_attempts = 2
+    monkeypatch.setattr(drainer._stop, "wait", lambda seconds: None)
+    drainer.drain()
+    assert spool.load(spool.paths()[0])["attempts"] == 1
+    assert drainer.backoff == 1.0
+    drainer.drain()
+    assert len(spool) == 0
+    assert drainer.backoff == 2.0
+
+
+def test_rejected_capture_is_not_spooled(tmp_path, backends, monkeypatch):
+    def rejected(image_data):
+        raise ServiceError("Collection not found", 404)
+
+    monkeypatch.setattr(app, "predict", rejected)
+    spool = Spool(str(tmp_path))
+    breaker = CircuitBreaker(failure_threshold=1)
+    _, status = app.process_capture("frame1", "seat1", spool=spool, breaker=breaker)
+    assert status == 500
+    assert len(spool) == 0 and not breaker.is_open
+
+
+def test_rejected_entry_does_not_block_the_spool(tmp_path, backends, monkeypatch):
+    spool = Spool(str(tmp_path))
+    breaker = CircuitBreaker(failure_threshold=1)
+    for seat_id in ("bad", "seat2"):
+        update = {
+            "seatId": seat_id,
+            "classroomId": "room1",
+            "lastSeen": "2025-01-01T00:00:00Z",
+        }
+        spool.put({"kind": "update", "update": update})
+
+    def fake_batch(updates):
+        if updates[0]["seatId"] == "bad":
+            raise ServiceError("Invalid seat ID: bad", 400)
+        backends["published"].extend(updates)
+        return {"status": "success"}
+
+    monkeypatch.setattr(app, "update_frontend_batch", fake_batch)
+    assert make_drainer(spool, breaker).drain() == 2
+    assert len(spool) == 0 and not breaker.is_open
+    assert [u["seatId"] for u in backends["published"]] == ["seat2"]
@@ -1,12 +1,47 @@
 # app.py
-from flask import Flask, request, jsonify
+from flask import Flask, g, request, jsonify
+import logging
 import sqlite3
 import os
+import tracing
+from changes import change_log_epoch, changes_since, ensure_change_log
+
+# Adds trace_id to log records, so it must come before the log format uses it.
+tracing.configure("database")
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - [%(trace_id)s] %(message)s",
+)
 
 app = Flask(__name__)
 DATABASE = os.environ.get("DATABASE_PATH", "students.db")
 
 
+@app.before_request
+def start_span():
+    # Continues the caller's trace (e.g. the ML service's student lookup).
+    g.span = tracing.start_span(
+        f"{request.method} {request.path}", request.headers.get("traceparent")
+    )
+
+
+@app.after_request
+def record_status(response):
+    span = g.get("span")
+    if span is not None:
+        span.set("status", response.status_code)
+    return response
+
+
+@app.teardown_request
+def end_span(exc):
+    span = g.pop("span", None)
+    if span is not None:
+        if exc is not None:
+            span.error = str(exc)
+        span.end()
+
+
 def get_db_connection():
     conn = sqlite3.connect(DATABASE)
     conn.row_factory = sqlite3.Row
@@ -26,6 +61,7 @@ def init_db():
         )
     """
     )
+    ensure_change_log(conn)
     # Insert a sample record if table is empty
     cursor.execute("SELECT COUNT(*) FROM students")
     if cursor.fetchone()[0] == 0:
@@ -45,15 +81,17 @@ def get_student():
     student_id = request.args.get("studentId")
     if not student_id:
         return jsonify({"error": "studentId parameter is required"}), 400
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM students WHERE studentId = ?", (student_id,))
-    row = cursor.fetchone()
-    conn.close()
+    with tracing.span("query", student_id=student_id):
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM students WHERE studentId = ?", (student_id,))
+        row = cursor.fetchone()
+        conn.close()
     if row:
         student = dict(row)
         return jsonify(student)
     else:
+        app.logger.info(f"Student {student_id} not found")
         return jsonify({"error": "Student not found"}), 404
 
 
@@ -82,11 +120,35 @@ def add_student():
         conn.commit()
     except sqlite3.IntegrityError:
         conn.close()
+        app.logger.info(f"Student {student_id} already exists")
         return jsonify({"error": "Student already exists"}), 409
     conn.close()
     return jsonify({"message": "Student added successfully"}), 201
 
 
+@app.route("/api/changes", methods=["GET"])
+def get_changes():
+    try:
+        since = int(request.args.get("since", 0))
+        limit = min(int(request.args.get("limit", 500)), 5000)
+    except ValueError:
+        return jsonify({"error": "since and limit must be integers"}), 400
+    if since < 0 or limit <= 0:
+        return jsonify({"error": "since must be >= 0 and limit > 0"}), 400
+    conn = get_db_connection()
+    changes, last_seq = changes_since(conn, since, limit)
+    epoch = change_log_epoch(conn)
+    conn.close()
+    return jsonify(
+        {
+            "changes": changes,
+            "lastSeq": last_seq,
+            "hasMore": len(changes) == limit,
+            "epoch": epoch,
+        }
+    )
+
+
 @app.route("/api/health", methods=["GET"])
 def health():
     conn = get_db_connection()
@@ -0,0 +1,108 @@
+"""
+Change log for the students table.
+
+Every insert, update and delete of a student is recorded by SQLite triggers
+as a row in student_changes with a monotonically increasing seq, whichever
+process made the write (this service or setup_db.py). Consumers remember the
+last seq they applied and ask for the changes after it.
+
+Students that already existed when the log was created are backfilled as
+'upsert' changes, so a consumer starting from seq 0 sees every student. The
+log also has an epoch, a random ID chosen when it is created: a consumer that
+sees the epoch change (e.g. the database file was recreated and its seqs
+started over) must drop its copy and sync again from 0.
+"""
+
+import uuid
+
+CHANGE_LOG_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS student_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        studentId TEXT NOT NULL,
+        op TEXT NOT NULL,
+        changedAt TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE IF NOT EXISTS student_changes_epoch (
+        epoch TEXT NOT NULL
+    );
+    CREATE TRIGGER IF NOT EXISTS students_insert_change
+    AFTER INSERT ON students
+    BEGIN
+        INSERT INTO student_changes (studentId, op) VALUES (NEW.studentId, 'upsert');
+    END;
+    CREATE TRIGGER IF NOT EXISTS students_update_change
+    AFTER UPDATE ON students
+    BEGIN
+        INSERT INTO student_changes (studentId, op)
+        SELECT OLD.studentId, 'delete' WHERE OLD.studentId != NEW.studentId;
+        INSERT INTO student_changes (studentId, op) VALUES (NEW.studentId, 'upsert');
+    END;
+    CREATE TRIGGER IF NOT EXISTS students_delete_change
+    AFTER DELETE ON students
+    BEGIN
+        INSERT INTO student_changes (studentId, op) VALUES (OLD.studentId, 'delete');
+    END;
+"""
+
+
+def ensure_change_log(conn):
+    """
+    Create the change log table and triggers if they do not exist yet. A new
+    log gets an epoch and an 'upsert' change for every existing student.
+    """
+    conn.executescript(CHANGE_LOG_SCHEMA)
+    if change_log_epoch(conn) is None:
+        conn.execute(
+            "INSERT INTO student_changes_epoch (epoch) VALUES (?)", (uuid.uuid4().hex,)
+        )
+        conn.execute("""
+            INSERT INTO student_changes (studentId, op)
+            SELECT studentId, 'upsert' FROM students ORDER BY rowid
+            """)
+        conn.commit()
+
+
+def change_log_epoch(conn):
+    row = conn.execute("SELECT epoch FROM student_changes_epoch").fetchone()
+    return row[0] if row else None
+
+
+def changes_since(conn, since=0, limit=500):
+    """
+    Changes with seq > since, oldest first, each with the student's current
+    row (None once deleted). Returns (changes, last seq returned or since).
+    """
+    rows = conn.execute(
+        """
+        SELECT c.seq, c.studentId, c.op, c.changedAt,
+               s.name, s.email, s.photoReference
+        FROM student_changes c
+        LEFT JOIN students s ON s.studentId = c.studentId AND c.op = 'upsert'
+        WHERE c.seq > ?
+        ORDER BY c.seq
+        LIMIT ?
+        """,
+        (since, limit),
+    ).fetchall()
+
+    changes = []
+    for seq, student_id, op, changed_at, name, email, photo_reference in rows:
+        student = None
+        if op == "upsert" and name is not None:
+            student = {
+                "studentId": student_id,
+                "name": name,
+                "email": email,
+                "photoReference": photo_reference,
+            }
+        changes.append(
+            {
+                "seq": seq,
+                "studentId": student_id,
+                "op": op,
+                "changedAt": changed_at,
+                "student": student,
+            }
+        )
+    last_seq = changes[-1]["seq"] if changes else since
+    return changes, last_seq
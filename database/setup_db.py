@@ -6,6 +6,8 @@ import sqlite3
 import shutil
 import logging
 
+from changes import ensure_change_log
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
@@ -29,13 +31,23 @@ def setup_database(db_path, students_json, images_dir=None, images_output_dir=No
             photoReference TEXT
         )
     """)
+    ensure_change_log(conn)
     
     inserted_count = 0
     for student in students:
         try:
+            # Only rows that actually changed are written, so restarting the
+            # service does not add a change-log entry for every student
             cursor.execute("""
-                INSERT OR REPLACE INTO students (studentId, name, email, photoReference)
+                INSERT INTO students (studentId, name, email, photoReference)
                 VALUES (?, ?, ?, ?)
+                ON CONFLICT(studentId) DO UPDATE SET
+                    name = excluded.name,
+                    email = excluded.email,
+                    photoReference = excluded.photoReference
+                WHERE name IS NOT excluded.name
+                    OR email IS NOT excluded.email
+                    OR photoReference IS NOT excluded.photoReference
             """, (
                 student["studentId"],
                 student["name"],
@@ -55,6 +67,16 @@ def setup_database(db_path, students_json, images_dir=None, images_output_dir=No
             
         copied_count = 0
         for student in students:
+            # Extra reference photos live in a directory named after the student
+            student_id = student.get("studentId")
+            extra_dir = os.path.join(images_dir, student_id) if student_id else None
+            if extra_dir and os.path.isdir(extra_dir):
+                try:
+                    shutil.copytree(extra_dir, os.path.join(images_output_dir, student_id), dirs_exist_ok=True)
+                    copied_count += len(os.listdir(extra_dir))
+                except (shutil.Error, IOError) as e:
+                    logger.error(f"Error copying extra images for {student_id}: {e}")
+
             photo_ref = student.get("photoReference")
             if not photo_ref:
                 continue
@@ -3,6 +3,7 @@ import tempfile
 import sqlite3
 import json
 import pytest
+import tracing
 from app import app, init_db
 
 
@@ -64,3 +65,35 @@ def test_add_duplicate_student(client):
     assert response.status_code == 409
     data = response.get_json()
     assert "error" in data
+
+
+def test_student_lookup_continues_callers_trace(client, tmp_path, monkeypatch):
+    path = tmp_path / "spans.jsonl"
+    exporter = tracing.FileExporter(str(path))
+    monkeypatch.setattr(tracing, "_exporters", [exporter])
+    traceparent = "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+    # Outside the fixture's `with` block, so the request context (and its
+    # span) is torn down as soon as the response is returned.
+    response = app.test_client().get(
+        "/api/student?studentId=stu123", headers={"traceparent": traceparent}
+    )
+    assert response.status_code == 200
+
+    exporter.flush()
+    query, request_span = [json.loads(line) for line in path.read_text().splitlines()]
+    assert request_span["name"] == "GET /api/student"
+    assert request_span["traceId"] == "4bf92f3577b34da6a3ce929d0e0e4736"
+    assert request_span["parentSpanId"] == "00f067aa0ba902b7"
+    assert request_span["attributes"]["status"] == 200
+    assert query["parentSpanId"] == request_span["spanId"]
+
+
+def test_log_lines_carry_trace_id(client, caplog):
+    traceparent = "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+    with caplog.at_level("INFO"):
+        response = client.get(
+            "/api/student?studentId=nobody", headers={"traceparent": traceparent}
+        )
+    assert response.status_code == 404
+    (record,) = [r for r in caplog.records if "nobody" in r.getMessage()]
+    assert record.trace_id == "4bf92f3577b34da6a3ce929d0e0e4736"
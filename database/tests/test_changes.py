@@ -0,0 +1,129 @@
+import json
+import sqlite3
+
+import pytest
+
+import app as database_app
+from app import app, init_db
+from changes import changes_since, ensure_change_log
+from setup_db import setup_database
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(database_app, "DATABASE", str(tmp_path / "students.db"))
+    init_db()
+    app.config["TESTING"] = True
+    with app.test_client() as client:
+        yield client
+
+
+def test_writes_are_recorded_in_order(client):
+    data = client.get("/api/changes").get_json()
+    assert [change["studentId"] for change in data["changes"]] == ["stu123"]
+    since = data["lastSeq"]
+
+    client.post(
+        "/api/student",
+        json={"studentId": "stu456", "name": "Bob Smith", "email": "bob@example.com"},
+    )
+    conn = sqlite3.connect(database_app.DATABASE)
+    conn.execute("DELETE FROM students WHERE studentId = 'stu123'")
+    conn.commit()
+    conn.close()
+
+    data = client.get(f"/api/changes?since={since}").get_json()
+    changes = data["changes"]
+    assert [(c["studentId"], c["op"]) for c in changes] == [
+        ("stu456", "upsert"),
+        ("stu123", "delete"),
+    ]
+    assert changes[0]["seq"] < changes[1]["seq"] == data["lastSeq"]
+    assert changes[0]["student"]["name"] == "Bob Smith"
+    assert changes[1]["student"] is None
+    assert data["hasMore"] is False
+
+    # Nothing new: lastSeq stays where the consumer is.
+    data = client.get(f"/api/changes?since={data['lastSeq']}").get_json()
+    assert data == {
+        "changes": [],
+        "lastSeq": changes[1]["seq"],
+        "hasMore": False,
+        "epoch": data["epoch"],
+    }
+
+
+def test_changes_are_paged(client):
+    for i in range(3):
+        client.post(
+            "/api/student",
+            json={"studentId": f"s{i}", "name": f"S {i}", "email": "s@example.com"},
+        )
+    data = client.get("/api/changes?since=0&limit=2").get_json()
+    assert len(data["changes"]) == 2 and data["hasMore"] is True
+    data = client.get(f"/api/changes?since={data['lastSeq']}&limit=2").get_json()
+    assert [c["studentId"] for c in data["changes"]] == ["s1", "s2"]
+
+
+def test_rejects_non_integer_since(client):
+    assert client.get("/api/changes?since=abc").status_code == 400
+
+
+def test_setup_db_records_only_real_changes(client, tmp_path):
+    students = [
+        {
+            "studentId": "ann",
+            "name": "Ann Lee",
+            "email": "ann@example.com",
+            "photoReference": "ann.jpg",
+        }
+    ]
+    students_json = tmp_path / "students.json"
+    students_json.write_text(json.dumps(students))
+
+    setup_database(database_app.DATABASE, str(students_json))
+    since = client.get("/api/changes").get_json()["lastSeq"]
+    setup_database(database_app.DATABASE, str(students_json))
+    assert client.get(f"/api/changes?since={since}").get_json()["changes"] == []
+
+    students[0]["email"] = "ann.lee@example.com"
+    students_json.write_text(json.dumps(students))
+    setup_database(database_app.DATABASE, str(students_json))
+    changes = client.get(f"/api/changes?since={since}").get_json()["changes"]
+    assert [(c["studentId"], c["op"]) for c in changes] == [("ann", "upsert")]
+    assert changes[0]["student"]["email"] == "ann.lee@example.com"
+
+
+def test_existing_students_are_backfilled(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE students (studentId TEXT PRIMARY KEY, name TEXT NOT NULL, "
+        "email TEXT NOT NULL, photoReference TEXT)"
+    )
+    conn.execute(
+        "INSERT INTO students VALUES ('ann', 'Ann Lee', 'ann@example.com', NULL)"
+    )
+    conn.commit()
+
+    ensure_change_log(conn)
+    ensure_change_log(conn)
+    changes, last_seq = changes_since(conn, 0)
+    assert [(c["studentId"], c["op"]) for c in changes] == [("ann", "upsert")]
+    assert changes[0]["student"]["name"] == "Ann Lee"
+    assert last_seq == 1
+    conn.close()
+
+
+def test_recreated_database_has_new_epoch(client, tmp_path, monkeypatch):
+    epoch = client.get("/api/changes").get_json()["epoch"]
+    assert epoch and client.get("/api/changes").get_json()["epoch"] == epoch
+
+    monkeypatch.setattr(database_app, "DATABASE", str(tmp_path / "recreated.db"))
+    init_db()
+    assert client.get("/api/changes").get_json()["epoch"] != epoch
+
+
+def test_rejects_non_positive_limit(client):
+    assert client.get("/api/changes?limit=0").status_code == 400
+    assert client.get("/api/changes?since=-1").status_code == 400
@@ -1,70 +1,206 @@
+const crypto = require('crypto');
 const express = require('express');
+const { traced } = require('./tracing');
 const app = express();
 
 app.use(express.json());
 app.use(express.static('public'));
 
-// In-memory data store for classroom layout
-// In a real application, this would be in a database
-let classroomData = {
-    classroomId: 'classroom1',
-    tables: [
-        {
-            tableId: 'table1',
-            seats: [
-                { seatId: 'table1-seat1', student: null },
-                { seatId: 'table1-seat2', student: null },
-                { seatId: 'table1-seat3', student: null },
-                { seatId: 'table1-seat4', student: null },
-                { seatId: 'table1-seat5', student: null },
-                { seatId: 'table1-seat6', student: null }
-            ]
-        },
-        {
-            tableId: 'table2',
-            seats: [
-                { seatId: 'table2-seat1', student: null }, // seat 7 
-                { seatId: 'table2-seat2', student: null }, // seat 8 etc. 
-                { seatId: 'table2-seat3', student: null },
-                { seatId: 'table2-seat4', student: null },
-                { seatId: 'table2-seat5', student: null },
-                { seatId: 'table2-seat6', student: null }
-            ]
+const TABLES_PER_CLASSROOM = 2;
+const SEATS_PER_TABLE = 6;
+
+// Change feed for push updates. Every seat change in a classroom gets the next
+// sequence number for that classroom; recent deltas are kept so reconnecting
+// clients can resume. Sequence numbers start over when the process restarts,
+// so they are only meaningful together with this process's epoch.
+const MAX_CHANGE_LOG = 1000;
+const HEARTBEAT_MS = 15000;
+const EPOCH = crypto.randomBytes(8).toString('hex');
+
+// Build an empty classroom and an index from every accepted seat ID to its seat.
+// Seats are addressed as "table1-seat1" or by their position in the room
+// ("seat1" .. "seat12"), which is what camera SEAT_IDs use.
+function createClassroom(classroomId) {
+    const data = { classroomId, tables: [] };
+    const seatIndex = new Map();
+    let position = 0;
+
+    for (let t = 1; t <= TABLES_PER_CLASSROOM; t++) {
+        const table = { tableId: `table${t}`, seats: [] };
+        for (let s = 1; s <= SEATS_PER_TABLE; s++) {
+            const seat = { seatId: `table${t}-seat${s}`, student: null };
+            position += 1;
+            seatIndex.set(seat.seatId, seat);
+            seatIndex.set(`seat${position}`, seat);
+            table.seats.push(seat);
         }
-    ]
-};
+        data.tables.push(table);
+    }
+
+    return { data, seatIndex, seq: 0, changeLog: [], subscribers: new Set() };
+}
+
+// In-memory data store for classroom layouts
+// In a real application, this would be in a database
+const classroomIds = (process.env.CLASSROOM_IDS || 'classroom1')
+    .split(',')
+    .map(id => id.trim())
+    .filter(Boolean);
+const DEFAULT_CLASSROOM_ID = classroomIds[0];
+const classrooms = new Map(classroomIds.map(id => [id, createClassroom(id)]));
+
+function getClassroom(classroomId) {
+    if (!classroomId || classroomId === 'default') {
+        return classrooms.get(DEFAULT_CLASSROOM_ID);
+    }
+    return classrooms.get(classroomId);
+}
+
+function snapshot(classroom) {
+    return { ...classroom.data, seq: classroom.seq, epoch: EPOCH };
+}
 
-// Update endpoint to handle seat changes
-app.post('/api/classroom/update', (req, res) => {
-    const { studentId, name, seatId, confidence, lastSeen } = req.body;
-    console.log('Received classroom update:', req.body);
+// Event IDs are "<epoch>:<seq>", which EventSource sends back as Last-Event-ID.
+function formatEvent(event, seq, data) {
+    return `id: ${EPOCH}:${seq}\nevent: ${event}\ndata: ${JSON.stringify(data)}\n\n`;
+}
 
-    // Extract table ID and seat position from the seatId (like "seat5")
-    const seatNumber = parseInt(seatId.replace('seat', ''), 10);
-    const tableIndex = Math.floor((seatNumber - 1) / 6); // Each table has 6 seats
-    const seatIndex = (seatNumber - 1) % 6;
+// The seq to resume after, or NaN if the ID is missing, malformed or from
+// another run of this process.
+function parseResumePoint(lastEventId) {
+    const [epoch, seq] = String(lastEventId).split(':');
+    return epoch === EPOCH && /^\d+$/.test(seq || '') ? parseInt(seq, 10) : NaN;
+}
 
-    if (isNaN(seatNumber) || tableIndex >= classroomData.tables.length || seatIndex >= 6) {
-        return res.status(400).json({ status: 'error', message: 'Invalid seat ID' });
+function recordSeatChange(classroom, seatId, student) {
+    classroom.seq += 1;
+    const delta = { seq: classroom.seq, epoch: EPOCH, classroomId: classroom.data.classroomId, seatId, student };
+    classroom.changeLog.push(delta);
+    if (classroom.changeLog.length > MAX_CHANGE_LOG) {
+        classroom.changeLog.shift();
     }
+    const message = formatEvent('seat', delta.seq, delta);
+    classroom.subscribers.forEach(res => res.write(message));
+    return delta;
+}
 
-    const table = classroomData.tables[tableIndex];
-    const seat = table.seats[seatIndex];
+// Resolve one update to its classroom and seat, or return an error message.
+function resolveUpdate(update) {
+    if (!update || typeof update !== 'object') {
+        return { error: 'Update must be an object' };
+    }
+    const classroom = getClassroom(update.classroomId);
+    if (!classroom) {
+        return { error: `Unknown classroom ID: ${update.classroomId}` };
+    }
+    const seat = classroom.seatIndex.get(update.seatId);
+    if (!seat) {
+        return { error: `Invalid seat ID: ${update.seatId}` };
+    }
+    return { classroom, seat };
+}
+
+// Validate every update first, then apply them all, so a batch is either
+// applied completely or not at all. Returns the new version of each classroom.
+function applyUpdates(updates) {
+    const resolved = updates.map(resolveUpdate);
+    const errors = resolved
+        .map((result, index) => (result.error ? { index, message: result.error } : null))
+        .filter(Boolean);
+    if (errors.length) {
+        return { errors };
+    }
+
+    const versions = {};
+    resolved.forEach(({ classroom, seat }, index) => {
+        const { studentId, name, confidence, lastSeen } = updates[index];
+        seat.student = name ? {
+            studentId,
+            name,
+            confidence,
+            lastSeen
+        } : null;
+        const delta = recordSeatChange(classroom, seat.seatId, seat.student);
+        versions[classroom.data.classroomId] = delta.seq;
+    });
+    return { versions };
+}
 
-    // Update the student information
-    seat.student = name ? {
-        studentId,
-        name,
-        confidence,
-        lastSeen
-    } : null;
+// Update endpoint to handle a single seat change
+app.post('/api/classroom/update', traced('seat_update'), (req, res) => {
+    console.log(`[${req.span.traceId}] Received classroom update:`, req.body);
+    req.span.attributes.updates = 1;
 
-    res.status(200).json({ status: 'success', data: classroomData });
+    const { errors, versions } = applyUpdates([req.body]);
+    if (errors) {
+        return res.status(400).json({ status: 'error', message: errors[0].message });
+    }
+
+    const [seq] = Object.values(versions);
+    res.status(200).json({ status: 'success', seq });
+});
+
+// Bulk endpoint: many seat changes across many classrooms, applied atomically
+app.post('/api/classroom/updates', traced('seat_update'), (req, res) => {
+    const updates = req.body && req.body.updates;
+    if (!Array.isArray(updates) || updates.length === 0) {
+        return res.status(400).json({ status: 'error', message: 'updates must be a non-empty array' });
+    }
+    console.log(`[${req.span.traceId}] Received ${updates.length} classroom updates`);
+    req.span.attributes.updates = updates.length;
+
+    const { errors, versions } = applyUpdates(updates);
+    if (errors) {
+        return res.status(400).json({ status: 'error', errors });
+    }
+    res.status(200).json({ status: 'success', versions });
 });
 
 // Get endpoint to retrieve current classroom data
 app.get('/api/classroom', (req, res) => {
-    res.status(200).json(classroomData);
+    const classroom = getClassroom(req.query.classroomId);
+    if (!classroom) {
+        return res.status(404).json({ status: 'error', message: 'Unknown classroom ID' });
+    }
+    res.status(200).json(snapshot(classroom));
+});
+
+// Server-Sent Events stream of seat deltas. Clients resume with the standard
+// Last-Event-ID header (sent automatically by EventSource) or ?since=<epoch>:<seq>;
+// if the requested point is no longer in the change log, or is from before a
+// restart, a full snapshot is sent.
+app.get('/api/classroom/stream', (req, res) => {
+    const classroom = getClassroom(req.query.classroomId);
+    if (!classroom) {
+        return res.status(404).json({ status: 'error', message: 'Unknown classroom ID' });
+    }
+    const lastEventId = req.get('Last-Event-ID') || req.query.since;
+    const since = lastEventId !== undefined ? parseResumePoint(lastEventId) : NaN;
+
+    res.status(200).set({
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        Connection: 'keep-alive'
+    });
+    res.flushHeaders();
+    res.write('retry: 2000\n\n');
+
+    const { changeLog } = classroom;
+    const oldest = changeLog.length ? changeLog[0].seq : classroom.seq + 1;
+    if (!isNaN(since) && since >= oldest - 1 && since <= classroom.seq) {
+        changeLog
+            .filter(delta => delta.seq > since)
+            .forEach(delta => res.write(formatEvent('seat', delta.seq, delta)));
+    } else {
+        res.write(formatEvent('snapshot', classroom.seq, snapshot(classroom)));
+    }
+
+    classroom.subscribers.add(res);
+    const heartbeat = setInterval(() => res.write(': ping\n\n'), HEARTBEAT_MS);
+    res.on('close', () => {
+        clearInterval(heartbeat);
+        classroom.subscribers.delete(res);
+    });
 });
 
 // Export the app for testing
@@ -76,4 +212,4 @@ if (require.main === module) {
     app.listen(PORT, () => {
         console.log(`Frontend service listening on port ${PORT}`);
     });
-}
\ No newline at end of file
+}
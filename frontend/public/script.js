@@ -1,31 +1,101 @@
 document.addEventListener('DOMContentLoaded', function () {
     // Store the current classroom data
     let classroomData = null;
+    // Sequence number of the last change applied to classroomData, and the
+    // server epoch it belongs to (seqs start over when the server restarts)
+    let lastSeq = 0;
+    let lastEpoch = null;
+    // Which classroom to show, e.g. /?classroomId=classroom2 (server default otherwise)
+    const classroomId = new URLSearchParams(window.location.search).get('classroomId');
+    const query = classroomId ? `?classroomId=${encodeURIComponent(classroomId)}` : '';
 
     // Function to fetch the latest classroom data from the server
     async function fetchClassroomData() {
         try {
-            const response = await fetch('/api/classroom');
+            const response = await fetch(`/api/classroom${query}`);
             if (!response.ok) {
                 throw new Error('Failed to fetch classroom data');
             }
             const data = await response.json();
 
             // Update the UI with the new data
-            if (JSON.stringify(data) !== JSON.stringify(classroomData)) {
-                classroomData = data;
-                renderClassroom(data);
+            if (data.seq !== lastSeq || data.epoch !== lastEpoch || classroomData === null) {
+                applySnapshot(data);
             }
         } catch (error) {
             console.error('Error fetching classroom data:', error);
         }
     }
 
-    // Initial data fetch
-    fetchClassroomData();
+    function applySnapshot(data) {
+        classroomData = data;
+        lastSeq = data.seq;
+        lastEpoch = data.epoch;
+        renderClassroom(data);
+    }
+
+    // Apply a single seat delta in place instead of re-rendering everything
+    function applySeatDelta(delta) {
+        if (delta.epoch === lastEpoch && delta.seq <= lastSeq) {
+            return;
+        }
+        if (classroomData === null || delta.epoch !== lastEpoch || delta.seq !== lastSeq + 1) {
+            // Missed a change; resynchronise from a full snapshot.
+            fetchClassroomData();
+            return;
+        }
+        classroomData.tables.forEach(table => {
+            table.seats.forEach(seat => {
+                if (seat.seatId === delta.seatId) {
+                    seat.student = delta.student;
+                }
+            });
+        });
+        lastSeq = delta.seq;
+
+        const seatElement = document.getElementById(delta.seatId);
+        if (seatElement) {
+            renderSeatName(seatElement.querySelector('.seat-name'), delta.student);
+        }
+    }
+
+    if (window.EventSource) {
+        // The browser reconnects on its own and sends Last-Event-ID, so the
+        // server replays only the deltas we missed.
+        const stream = new EventSource(`/api/classroom/stream${query}`);
+        stream.addEventListener('snapshot', event => applySnapshot(JSON.parse(event.data)));
+        stream.addEventListener('seat', event => applySeatDelta(JSON.parse(event.data)));
+        stream.onerror = () => console.warn('Classroom stream interrupted, reconnecting');
+    } else {
+        // Initial data fetch
+        fetchClassroomData();
 
-    // Set up polling to fetch updates every 3 seconds
-    setInterval(fetchClassroomData, 3000);
+        // Set up polling to fetch updates every 3 seconds
+        setInterval(fetchClassroomData, 3000);
+    }
+
+    function renderSeatName(nameElement, student) {
+        nameElement.style.borderColor = '';
+        nameElement.style.color = '';
+
+        if (student) {
+            nameElement.textContent = student.name;
+            if (student.confidence) {
+                // Optional: Show confidence level with color or styling
+                const confidence = parseFloat(student.confidence);
+                if (confidence > 0.8) {
+                    nameElement.style.borderColor = '#4CAF50'; // Green for high confidence
+                } else if (confidence > 0.5) {
+                    nameElement.style.borderColor = '#FFC107'; // Yellow for medium confidence
+                } else {
+                    nameElement.style.borderColor = '#F44336'; // Red for low confidence
+                }
+            }
+        } else {
+            nameElement.textContent = 'Empty';
+            nameElement.style.color = '#999';
+        }
+    }
 
     // Function to render the classroom
     function renderClassroom(data) {
@@ -55,24 +125,7 @@ document.addEventListener('DOMContentLoaded', function () {
 
                 const nameElement = document.createElement('div');
                 nameElement.className = 'seat-name';
-
-                if (seat.student) {
-                    nameElement.textContent = seat.student.name;
-                    if (seat.student.confidence) {
-                        // Optional: Show confidence level with color or styling
-                        const confidence = parseFloat(seat.student.confidence);
-                        if (confidence > 0.8) {
-                            nameElement.style.borderColor = '#4CAF50'; // Green for high confidence
-                        } else if (confidence > 0.5) {
-                            nameElement.style.borderColor = '#FFC107'; // Yellow for medium confidence
-                        } else {
-                            nameElement.style.borderColor = '#F44336'; // Red for low confidence
-                        }
-                    }
-                } else {
-                    nameElement.textContent = 'Empty';
-                    nameElement.style.color = '#999';
-                }
+                renderSeatName(nameElement, seat.student);
 
                 seatElement.appendChild(nameElement);
                 tableContainer.appendChild(seatElement);
@@ -81,4 +134,4 @@ document.addEventListener('DOMContentLoaded', function () {
             classroomElement.appendChild(tableContainer);
         });
     }
-});
\ No newline at end of file
+});
@@ -1,5 +1,10 @@
+const fs = require('fs');
+const http = require('http');
+const os = require('os');
+const path = require('path');
 const request = require('supertest');
 const app = require('../main'); // Adjust the path if needed
+const tracing = require('../tracing');
 
 describe('Frontend API Integration Tests', () => {
     it('should update classroom and return success', (done) => {
@@ -14,7 +19,12 @@ describe('Frontend API Integration Tests', () => {
             })
             .expect(200)
             .expect('Content-Type', /json/)
-            .expect({ status: 'success' }, done);
+            .expect((res) => {
+                if (res.body.status !== 'success') throw new Error('Update not acknowledged');
+                if (typeof res.body.seq !== 'number') throw new Error('Missing sequence number');
+                if (res.body.data) throw new Error('Update should not echo classroom state');
+            })
+            .end(done);
     });
 
     it('should return initial classroom layout', (done) => {
@@ -27,4 +37,135 @@ describe('Frontend API Integration Tests', () => {
             })
             .end(done);
     });
+
+    it('should apply a batch of seat updates and return only versions', (done) => {
+        request(app)
+            .post('/api/classroom/updates')
+            .send({
+                updates: [
+                    { classroomId: 'classroom1', seatId: 'seat1', studentId: 'stu1', name: 'Ann Lee', confidence: 0.9 },
+                    { classroomId: 'classroom1', seatId: 'table2-seat6', studentId: 'stu2', name: 'Ben Ode', confidence: 0.8 }
+                ]
+            })
+            .expect(200)
+            .expect((res) => {
+                if (res.body.status !== 'success') throw new Error('Batch not acknowledged');
+                if (typeof res.body.versions.classroom1 !== 'number') throw new Error('Missing classroom version');
+                if (res.body.data || res.body.tables) throw new Error('Batch should not echo classroom state');
+            })
+            .end(done);
+    });
+
+    it('should reject the whole batch if any update is invalid', (done) => {
+        request(app)
+            .post('/api/classroom/updates')
+            .send({
+                updates: [
+                    { classroomId: 'classroom1', seatId: 'seat3', studentId: 'stu3', name: 'Cy Park' },
+                    { classroomId: 'classroom1', seatId: 'seat99', studentId: 'stu4', name: 'Di Ray' }
+                ]
+            })
+            .expect(400)
+            .end((err, res) => {
+                if (err) return done(err);
+                if (res.body.errors[0].index !== 1) return done(new Error('Wrong invalid index'));
+                request(app)
+                    .get('/api/classroom')
+                    .expect((res) => {
+                        if (res.body.tables[0].seats[2].student !== null) {
+                            throw new Error('Partial batch was applied');
+                        }
+                    })
+                    .end(done);
+            });
+    });
+
+    it('should stream seat deltas after the requested sequence number', (done) => {
+        const server = app.listen(0, () => {
+            const { port } = server.address();
+            request(app).get('/api/classroom').end((err, res) => {
+                if (err) return done(err);
+                const { seq: since, epoch } = res.body;
+
+                const req = http.get(
+                    { port, path: '/api/classroom/stream', headers: { 'Last-Event-ID': `${epoch}:${since}` } },
+                    (stream) => {
+                        let received = '';
+                        stream.on('data', (chunk) => {
+                            received += chunk;
+                            if (!received.includes('event: seat')) return;
+                            req.destroy();
+                            server.close();
+                            if (received.includes('event: snapshot')) {
+                                return done(new Error('Resumed stream should not resend a snapshot'));
+                            }
+                            if (!received.includes(`id: ${epoch}:${since + 1}`)) {
+                                return done(new Error('Delta has the wrong sequence number'));
+                            }
+                            done();
+                        });
+                        request(app)
+                            .post('/api/classroom/update')
+                            .send({ studentId: 'stu456', name: 'Bob Smith', seatId: 'seat2', confidence: 0.9 })
+                            .end(() => {});
+                    }
+                );
+            });
+        });
+    });
+
+    it('should send a snapshot when resuming from another server epoch', (done) => {
+        const server = app.listen(0, () => {
+            const { port } = server.address();
+            // A seq from before a restart: the seq itself is still in range.
+            const req = http.get(
+                { port, path: '/api/classroom/stream', headers: { 'Last-Event-ID': '0123456789abcdef:0' } },
+                (stream) => {
+                    let received = '';
+                    stream.on('data', (chunk) => {
+                        received += chunk;
+                        const event = received.indexOf('event:');
+                        if (event < 0 || !received.includes('\n\n', event)) return;
+                        req.destroy();
+                        server.close();
+                        if (!received.includes('event: snapshot')) {
+                            return done(new Error('Stale epoch should get a snapshot'));
+                        }
+                        done();
+                    });
+                }
+            );
+        });
+    });
+
+    it('should record seat updates as spans of the camera\'s trace', (done) => {
+        const traceFile = path.join(fs.mkdtempSync(path.join(os.tmpdir(), 'spans-')), 'spans.jsonl');
+        process.env.TRACE_FILE = traceFile;
+        request(app)
+            .post('/api/classroom/updates')
+            .set('traceparent', '00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01')
+            .send({ updates: [{ seatId: 'seat3', studentId: 'stu123', name: 'Alice Johnson', confidence: 0.9 }] })
+            .expect(200)
+            .end((err) => {
+                if (err) {
+                    delete process.env.TRACE_FILE;
+                    return done(err);
+                }
+                // Spans are buffered and written by the export timer; flush now.
+                tracing.flush(() => {
+                    delete process.env.TRACE_FILE;
+                    const span = JSON.parse(fs.readFileSync(traceFile, 'utf8').trim());
+                    if (span.name !== 'seat_update' || span.service !== 'frontend') {
+                        return done(new Error('Unexpected span ' + span.name));
+                    }
+                    if (span.traceId !== '4bf92f3577b34da6a3ce929d0e0e4736' || span.parentSpanId !== '00f067aa0ba902b7') {
+                        return done(new Error('Span is not part of the caller\'s trace'));
+                    }
+                    if (span.attributes.status !== 200 || span.attributes.updates !== 1) {
+                        return done(new Error('Missing span attributes'));
+                    }
+                    done();
+                });
+            });
+    });
 });
@@ -0,0 +1,185 @@
+// Request tracing for the frontend, compatible with the Python services'
+// tracing.py. Requests that carry a W3C traceparent header (the camera's seat
+// updates) are recorded as spans of the caller's trace. Finished spans are
+// appended to TRACE_FILE, one JSON object per line, and/or POSTed in batches
+// to TRACE_OTLP_ENDPOINT as OTLP/HTTP JSON. Both are buffered and written
+// every EXPORT_INTERVAL_MS, off the request path; the file through one
+// append-mode write stream.
+const crypto = require('crypto');
+const fs = require('fs');
+const http = require('http');
+const https = require('https');
+
+const SERVICE_NAME = process.env.TRACE_SERVICE_NAME || 'frontend';
+const EXPORT_INTERVAL_MS = 1000;
+const MAX_BATCH = 512;
+const MAX_QUEUE = 10000;
+
+let otlpQueue = [];
+let fileLines = [];
+let fileStream = null;
+let exportTimer = null;
+
+function parseTraceparent(header) {
+    const match = /^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})/.exec(
+        (header || '').trim().toLowerCase()
+    );
+    if (!match || /^0+$/.test(match[2]) || /^0+$/.test(match[3])) {
+        return null;
+    }
+    return { traceId: match[2], parentSpanId: match[3], sampled: (parseInt(match[4], 16) & 1) === 1 };
+}
+
+// Start a span continuing the trace in traceparent, or a new trace.
+function startSpan(name, traceparent, attributes = {}) {
+    const parent = parseTraceparent(traceparent);
+    return {
+        name,
+        traceId: parent ? parent.traceId : crypto.randomBytes(16).toString('hex'),
+        spanId: crypto.randomBytes(8).toString('hex'),
+        parentSpanId: parent ? parent.parentSpanId : null,
+        sampled: parent ? parent.sampled : true,
+        attributes,
+        error: null,
+        startTimeUnixNano: BigInt(Date.now()) * 1000000n,
+        started: process.hrtime.bigint()
+    };
+}
+
+function endSpan(span) {
+    const durationNs = process.hrtime.bigint() - span.started;
+    span.endTimeUnixNano = span.startTimeUnixNano + durationNs;
+    span.durationMs = Number(durationNs) / 1e6;
+    if (!span.sampled) {
+        return;
+    }
+    if (process.env.TRACE_FILE && fileLines.length < MAX_QUEUE) {
+        fileLines.push(JSON.stringify({
+            traceId: span.traceId,
+            spanId: span.spanId,
+            parentSpanId: span.parentSpanId,
+            service: SERVICE_NAME,
+            name: span.name,
+            startTimeUnixNano: Number(span.startTimeUnixNano),
+            durationMs: Math.round(span.durationMs * 1000) / 1000,
+            attributes: span.attributes,
+            error: span.error
+        }) + '\n');
+    }
+    if (process.env.TRACE_OTLP_ENDPOINT && otlpQueue.length < MAX_QUEUE) {
+        otlpQueue.push(span);
+    }
+    if (!exportTimer && (fileLines.length || otlpQueue.length)) {
+        exportTimer = setInterval(flush, EXPORT_INTERVAL_MS);
+        exportTimer.unref();
+    }
+}
+
+// The append stream for TRACE_FILE, reopened if the variable changes.
+function traceFileStream(path) {
+    if (fileStream && fileStream.path === path) {
+        return fileStream;
+    }
+    if (fileStream) {
+        fileStream.end();
+    }
+    const stream = fs.createWriteStream(path, { flags: 'a' });
+    stream.on('error', err => {
+        console.warn(`Could not write spans to ${path}: ${err.message}`);
+        if (fileStream === stream) {
+            fileStream = null;
+        }
+    });
+    fileStream = stream;
+    return stream;
+}
+
+function otlpValue(value) {
+    if (typeof value === 'boolean') return { boolValue: value };
+    if (Number.isInteger(value)) return { intValue: String(value) };
+    if (typeof value === 'number') return { doubleValue: value };
+    return { stringValue: String(value) };
+}
+
+function otlpPayload(spans) {
+    return {
+        resourceSpans: [{
+            resource: { attributes: [{ key: 'service.name', value: { stringValue: SERVICE_NAME } }] },
+            scopeSpans: [{
+                scope: { name: 'classroom' },
+                spans: spans.map(span => ({
+                    traceId: span.traceId,
+                    spanId: span.spanId,
+                    ...(span.parentSpanId ? { parentSpanId: span.parentSpanId } : {}),
+                    name: span.name,
+                    kind: 2,
+                    startTimeUnixNano: String(span.startTimeUnixNano),
+                    endTimeUnixNano: String(span.endTimeUnixNano),
+                    attributes: Object.entries(span.attributes)
+                        .filter(([, value]) => value !== undefined && value !== null)
+                        .map(([key, value]) => ({ key, value: otlpValue(value) })),
+                    status: span.error ? { code: 2, message: span.error } : {}
+                }))
+            }]
+        }]
+    };
+}
+
+// Write buffered spans to TRACE_FILE and send queued ones to
+// TRACE_OTLP_ENDPOINT. callback, if given, runs once the file write is done.
+function flush(callback) {
+    const done = typeof callback === 'function' ? callback : () => {};
+    flushOtlp();
+    if (!fileLines.length || !process.env.TRACE_FILE) {
+        fileLines = [];
+        return done();
+    }
+    const data = fileLines.join('');
+    fileLines = [];
+    traceFileStream(process.env.TRACE_FILE).write(data, () => done());
+}
+
+function flushOtlp() {
+    while (otlpQueue.length && process.env.TRACE_OTLP_ENDPOINT) {
+        const batch = otlpQueue.splice(0, MAX_BATCH);
+        const url = new URL(process.env.TRACE_OTLP_ENDPOINT);
+        const body = JSON.stringify(otlpPayload(batch));
+        const req = (url.protocol === 'https:' ? https : http).request(url, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json', 'Content-Length': Buffer.byteLength(body) },
+            timeout: 5000
+        });
+        req.on('error', err => console.warn(`Dropped ${batch.length} spans, collector unreachable: ${err.message}`));
+        req.on('timeout', () => req.destroy(new Error('timeout')));
+        req.on('response', res => res.resume());
+        req.end(body);
+    }
+}
+
+// Spans still buffered when the process exits are written synchronously;
+// there is no event loop left for the stream.
+process.on('exit', () => {
+    if (fileLines.length && process.env.TRACE_FILE) {
+        try {
+            fs.appendFileSync(process.env.TRACE_FILE, fileLines.join(''));
+        } catch (err) {
+            console.warn(`Could not write spans to ${process.env.TRACE_FILE}: ${err.message}`);
+        }
+    }
+});
+
+// Express middleware: records the request as a span named name and exposes it
+// as req.span, so handlers can add attributes and log the trace ID.
+function traced(name) {
+    return (req, res, next) => {
+        const span = startSpan(name, req.get('traceparent'));
+        req.span = span;
+        res.on('finish', () => {
+            span.attributes.status = res.statusCode;
+            endSpan(span);
+        });
+        next();
+    };
+}
+
+module.exports = { parseTraceparent, startSpan, endSpan, otlpPayload, flush, traced };
@@ -1,59 +1,479 @@
 # app.py
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 import os
 import logging
-from utils import display_decoded_image, save_decoded_image, decode_image_to_rgb
-from face_recognition import FaceRecognizer
+import threading
+from urllib.parse import urlsplit
+import numpy as np
+from utils import save_decoded_image, decode_image_to_rgb
+from jobs import JobQueue, JobWorkerPool, QueueFull
+from student_sync import StudentDirectory
+from frame_transport import FrameServer
+import recognizer_config
+from recognizer_config import shard_count, shard_index, shard_top_k, shard_urls
+import profiling
+import tracing
 
+# Adds trace_id to log records, so it must come before the log format uses it.
+tracing.configure("ml_service")
 logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - [%(trace_id)s] %(message)s",
 )
 
 app = Flask(__name__)
 
-reference_dir = os.environ.get("REFERENCE_FACES_DIR", "reference_faces")
-similarity_threshold = float(os.environ.get("SIMILARITY_THRESHOLD", "0.6"))
+# Before anything is loaded, so the gallery and model weights are attributed.
+profiling.start_memory_tracing_from_env()
 
-database_url = os.environ.get("DATABASE_URL", "http://database:5002")
+# With STUDENT_SYNC_INTERVAL > 0, student details are served from a local copy
+# kept current from the database service's change feed.
+student_sync_interval = float(os.environ.get("STUDENT_SYNC_INTERVAL", "0"))
 
-face_recognizer = FaceRecognizer(
-    reference_dir=reference_dir,
-    similarity_threshold=similarity_threshold,
-    database_url=database_url,
-)
+# Large JPEGs can be decoded at 1/2, 1/4 or 1/8 scale while the longest side
+# stays at least REDUCED_DECODE_MIN_SIDE (0 disables).
+reduced_decode_min_side = int(os.environ.get("REDUCED_DECODE_MIN_SIDE", "0"))
 
+# Asynchronous predictions: jobs are stored in a local SQLite file and drained
+# by JOB_WORKERS threads in every process serving the app.
+job_queue_path = os.environ.get("JOB_QUEUE_PATH", "jobs.db")
+job_workers = int(os.environ.get("JOB_WORKERS", "2"))
+job_queue_max_depth = int(os.environ.get("JOB_QUEUE_MAX_DEPTH", "1000"))
+job_lease_seconds = float(os.environ.get("JOB_LEASE_SECONDS", "300"))
+job_max_attempts = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+job_retention_seconds = float(os.environ.get("JOB_RETENTION_SECONDS", "3600"))
+job_retry_after = os.environ.get("RETRY_AFTER_SECONDS", "1")
+# URL prefixes a job's CallbackUrl must start with (comma-separated). Without
+# any, callbacks are refused, so a client cannot make the service POST to an
+# arbitrary internal address.
+job_callback_urls = [
+    url for url in os.environ.get("JOB_CALLBACK_URLS", "").split(",") if url
+]
 
-@app.route("/api/predict", methods=["POST"])
-def predict():
+# A camera on the same host can send raw frames through shared memory, with
+# only a small header on this Unix socket (see frame_transport.py).
+frame_socket_path = os.environ.get("FRAME_SOCKET_PATH")
+
+_face_recognizer = None
+_student_directory = None
+_frame_server = None
+_face_recognizer_lock = threading.Lock()
+_job_queue = None
+_job_pool = None
+_job_lock = threading.Lock()
+
+
+def build_face_recognizer(**overrides):
+    """
+    Build a FaceRecognizer from the environment (see recognizer_config.py),
+    with student details synced from the database service's change feed when
+    STUDENT_SYNC_INTERVAL is set.
+    """
+    global _student_directory
+    directory = None
+    if student_sync_interval > 0 and overrides.get("student_lookup") is None:
+        directory = StudentDirectory(
+            overrides.get("database_url", recognizer_config.database_url),
+            student_sync_interval,
+        )
+        overrides["student_lookup"] = directory.get
+    face_recognizer = recognizer_config.build_face_recognizer(**overrides)
+    if directory is not None:
+        if face_recognizer.collections is not None:
+            directory.on_change = face_recognizer.collections.invalidate
+        directory.start()
+        _student_directory = directory
+    return face_recognizer
+
+
+def get_face_recognizer():
+    """
+    Build the recognizer (backend models + reference gallery) on first use, so
+    importing the app and serving /api/health stay cheap.
+    """
+    global _face_recognizer
+    if _face_recognizer is None:
+        with _face_recognizer_lock:
+            if _face_recognizer is None:
+                _face_recognizer = build_face_recognizer()
+    return _face_recognizer
+
+
+def get_job_queue():
+    """
+    Open the job queue and start its worker pool on first use.
+    """
+    global _job_queue, _job_pool
+    if _job_queue is None:
+        with _job_lock:
+            if _job_queue is None:
+                queue = JobQueue(
+                    job_queue_path,
+                    lease_seconds=job_lease_seconds,
+                    max_attempts=job_max_attempts,
+                    max_depth=job_queue_max_depth,
+                    retention_seconds=job_retention_seconds,
+                )
+                _job_pool = JobWorkerPool(queue, handle_job, workers=job_workers)
+                _job_pool.start()
+                _job_queue = queue
+    return _job_queue
+
+
+def preload():
+    get_face_recognizer()
+    # Drains jobs that were still queued when the service last stopped.
+    get_job_queue()
+
+
+def start_frame_server():
+    """
+    Serve FRAME_SOCKET_PATH from this process, unless it is unset or another
+    worker already does. Called from the server's startup hooks (see
+    gunicorn.conf.py, asgi.py and __main__ below), not on import, so the
+    camera's embedded mode and the shards do not open the socket. A socket
+    that cannot be bound is logged and the service runs without it; cameras
+    then fall back to HTTP.
+    """
+    global _frame_server
+    if not frame_socket_path or _frame_server is not None:
+        return
+    server = FrameServer(frame_socket_path, handle_frame)
+    try:
+        started = server.start()
+    except OSError as e:
+        app.logger.error(f"Cannot serve local frames on {frame_socket_path}: {e}")
+        return
+    if started:
+        _frame_server = server
+
+
+# Build the gallery in the background right after (worker) startup instead of
+# on the first request.
+if os.environ.get("PRELOAD_RECOGNIZER", "false").lower() == "true":
+    threading.Thread(target=preload, daemon=True).start()
+
+
+def handle_predict(data):
+    """
+    Run one /api/predict request body through decode + recognition.
+    Returns (response body, HTTP status); shared by the Flask and ASGI apps.
+    """
+    session = profiling.active_session()
+    if session is not None:
+        return session.run(run_predict, data)
+    return run_predict(data)
+
+
+def traced(name, traceparent, handler, *args):
+    """
+    Run handler(*args) -> (body, status) in a server span continuing the
+    caller's trace.
+    """
+    with tracing.span(name, traceparent) as span:
+        body, status = handler(*args)
+        span.set("status", status)
+        if status >= 500 and isinstance(body, dict):
+            span.error = body.get("error")
+        return body, status
+
+
+def run_predict(data):
     try:
-        data = request.get_json()
-        encoded_image = data.get("Image", {}).get("Bytes")
+        encoded_image = (data or {}).get("Image", {}).get("Bytes")
 
         if not encoded_image:
             app.logger.error("No image data found in the request.")
-            return jsonify({"error": "No image data provided"}), 400
+            return {"error": "No image data provided"}, 400
 
-        saved_path = save_decoded_image(encoded_image)
+        with tracing.span("inspection_copy"):
+            saved_path = save_decoded_image(encoded_image)
         if saved_path:
             app.logger.info(f"Image saved for inspection at: {saved_path}")
 
-        img_rgb = decode_image_to_rgb(encoded_image)
+        with tracing.span("decode", bytes=len(encoded_image)) as span:
+            img_rgb = decode_image_to_rgb(
+                encoded_image, min_side=reduced_decode_min_side
+            )
+            if img_rgb is not None:
+                span.set("shape", f"{img_rgb.shape[1]}x{img_rgb.shape[0]}")
         if img_rgb is None:
-            return jsonify({"error": "Failed to decode image"}), 400
+            return {"error": "Failed to decode image"}, 400
+
+        return run_recognition(img_rgb, data)
+
+    except Exception as e:
+        app.logger.error(f"Error in prediction: {str(e)}")
+        return {"error": str(e)}, 500
 
-        result = face_recognizer.recognize_face(img_rgb)
 
-        return jsonify(result)
+def handle_frame(img_rgb, data):
+    """
+    Recognize a frame that arrived through the local frame socket, already
+    decoded. Returns (response body, HTTP status) like handle_predict.
+    """
+    with tracing.span("predict", data.get("traceparent"), transport="shm") as span:
+        session = profiling.active_session()
+        if session is not None:
+            body, status = session.run(run_recognition, img_rgb, data)
+        else:
+            body, status = run_recognition(img_rgb, data)
+        span.set("status", status)
+        return body, status
+
+
+def handle_job(payload):
+    """Run a queued prediction in the trace of the request that submitted it."""
+    return traced("predict", payload.get("TraceParent"), handle_predict, payload)
+
+
+def run_recognition(img_rgb, data):
+    try:
+        face_recognizer = get_face_recognizer()
+        collection_id = data.get("CollectionId")
+        if not face_recognizer.has_collection(collection_id):
+            return {"error": f"Unknown collection: {collection_id}"}, 404
+
+        result = face_recognizer.recognize_face(
+            img_rgb, collection_id=collection_id, source_id=data.get("SourceId")
+        )
+
+        return result, 200
 
     except Exception as e:
         app.logger.error(f"Error in prediction: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+        return {"error": str(e)}, 500
+
+
+def callback_allowed(url):
+    """True if url is under one of the JOB_CALLBACK_URLS prefixes."""
+    target = urlsplit(url)
+    for allowed in job_callback_urls:
+        prefix = urlsplit(allowed)
+        if (
+            target.scheme == prefix.scheme
+            and target.netloc.lower() == prefix.netloc.lower()
+            and target.path.startswith(prefix.path)
+        ):
+            return True
+    return False
+
+
+def handle_submit_job(data):
+    """
+    Queue an /api/predict request body for the worker pool. The response is
+    sent as soon as the frame is stored, without waiting for recognition.
+    """
+    if not (data or {}).get("Image", {}).get("Bytes"):
+        return {"error": "No image data provided"}, 400
+
+    callback_url = data.get("CallbackUrl")
+    if callback_url and not callback_allowed(callback_url):
+        app.logger.warning(f"Rejecting prediction job callback to {callback_url}")
+        return {"error": "CallbackUrl is not an allowed callback address"}, 400
+    payload = {key: value for key, value in data.items() if key != "CallbackUrl"}
+    span = tracing.current_span()
+    if span is not None and span.parent_id:
+        # The submitter is tracing: the worker continues its trace.
+        payload["TraceParent"] = span.traceparent
+    try:
+        job_id = get_job_queue().enqueue(payload, callback_url=callback_url)
+    except QueueFull as e:
+        app.logger.warning(f"Rejecting prediction job: {e}")
+        return {"error": "Job queue is full, retry later"}, 503
+    _job_pool.notify()
+    return {"jobId": job_id, "status": "queued"}, 202
+
+
+def job_response_headers(body, status):
+    if status == 202:
+        return {"Location": f"/api/predict/jobs/{body['jobId']}"}
+    if status == 503:
+        return {"Retry-After": job_retry_after}
+    return {}
+
+
+def handle_get_job(job_id):
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return {"error": f"Unknown job: {job_id}"}, 404
+    return job, 200
+
+
+def handle_shard_search(data):
+    embedding = data.get("embedding") if data else None
+    if not embedding:
+        return {"error": "No embedding provided"}, 400
+
+    face_recognizer = get_face_recognizer()
+    model_id = data.get("modelId")
+    if model_id and model_id != face_recognizer.model_id:
+        return {
+            "error": f"Embedding model mismatch: query is {model_id}, "
+            f"shard gallery is {face_recognizer.model_id}"
+        }, 409
+
+    try:
+        top_k = profiling.number_param(data, "topK", shard_top_k)
+        query = np.asarray(embedding, dtype=np.float32)
+    except (TypeError, ValueError) as e:
+        return {"error": f"Invalid shard search: {e}"}, 400
+    if query.ndim != 1 or not np.isfinite(query).all():
+        return {"error": "embedding must be a flat list of numbers"}, 400
+
+    if face_recognizer.gallery is None:
+        return {"matches": [], "shardIndex": shard_index}, 200
+
+    dimension = face_recognizer.gallery.embeddings.shape[1]
+    if len(query) != dimension:
+        return {
+            "error": f"embedding has {len(query)} values, "
+            f"shard gallery has {dimension}"
+        }, 400
+    matches = face_recognizer.gallery.search(query, top_k=top_k)
+    return {"matches": matches, "shardIndex": shard_index}, 200
+
+
+def handle_admin(action, token, params=None):
+    """
+    Profiling and memory inspection, guarded by ADMIN_TOKEN. Returns
+    (body, status); a str body is plain-text profiler output.
+    """
+    error = profiling.check_admin_token(token)
+    if error:
+        return error
+    params = params or {}
+    if action == "profile_start":
+        return profiling.start_session(params)
+    if action == "profile_result":
+        return profiling.session_result()
+    if action == "memory_stop":
+        return profiling.stop_memory_tracing(), 200
+    try:
+        if action == "memory_start":
+            frames = profiling.number_param(params, "frames", 10, minimum=1)
+            return profiling.start_memory_tracing(frames), 200
+        limit = profiling.number_param(params, "limit", 20)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    report = profiling.memory_report(limit=limit, face_recognizer=_face_recognizer)
+    return report, 200
+
+
+def health_status():
+    face_recognizer = _face_recognizer
+    if face_recognizer is None:
+        # Not built yet (no PRELOAD_RECOGNIZER and no predict so far). The
+        # size stays an integer; gallery_loaded tells this apart from an empty
+        # gallery.
+        return {
+            "status": "ok",
+            "database_size": 0,
+            "model_loaded": False,
+            "gallery_loaded": False,
+        }
+
+    status = {
+        "status": "ok",
+        "database_size": len(face_recognizer.db_student_ids),
+        "model_id": face_recognizer.model_id,
+        "model_loaded": True,
+        "gallery_loaded": True,
+    }
+    if shard_urls:
+        status["shards"] = face_recognizer.gallery.health()
+        status["database_size"] = sum(
+            shard.get("database_size") or 0 for shard in status["shards"]
+        )
+        # Shards that are down or have not built their gallery yet do not count.
+        status["shards_loaded"] = sum(
+            bool(shard.get("gallery_loaded")) for shard in status["shards"]
+        )
+    elif shard_index is not None:
+        status["shard_index"] = shard_index
+        status["shard_count"] = shard_count
+    preprocessor = face_recognizer.preprocessor
+    if preprocessor is not None and preprocessor.roi_cache is not None:
+        status["roi"] = preprocessor.roi_cache.stats()
+    if _student_directory is not None:
+        status["students_synced"] = _student_directory.ready
+        status["students_seq"] = _student_directory.last_seq
+    if face_recognizer.collections is not None:
+        status["collections"] = {
+            "configured": len(face_recognizer.collections.rosters),
+            "loaded": face_recognizer.collections.loaded(),
+        }
+    if _job_queue is not None:
+        status["jobs_pending"] = _job_queue.depth()
+    if _frame_server is not None:
+        status["local_frames"] = _frame_server.requests
+    return status
+
+
+@app.route("/api/predict", methods=["POST"])
+def predict():
+    body, status = traced(
+        "predict",
+        request.headers.get("traceparent"),
+        handle_predict,
+        request.get_json(),
+    )
+    return jsonify(body), status
+
+
+@app.route("/api/predict/jobs", methods=["POST"])
+def submit_job():
+    body, status = traced(
+        "submit_job",
+        request.headers.get("traceparent"),
+        handle_submit_job,
+        request.get_json(),
+    )
+    return jsonify(body), status, job_response_headers(body, status)
+
+
+@app.route("/api/predict/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    body, status = handle_get_job(job_id)
+    return jsonify(body), status
+
+
+@app.route("/api/shard/search", methods=["POST"])
+def shard_search():
+    body, status = traced(
+        "shard_search",
+        request.headers.get("traceparent"),
+        handle_shard_search,
+        request.get_json(),
+    )
+    return jsonify(body), status
+
+
+ADMIN_ACTIONS = {
+    ("/api/admin/profile", "POST"): "profile_start",
+    ("/api/admin/profile", "GET"): "profile_result",
+    ("/api/admin/memory", "POST"): "memory_start",
+    ("/api/admin/memory", "GET"): "memory",
+    ("/api/admin/memory", "DELETE"): "memory_stop",
+}
+
+
+@app.route("/api/admin/profile", methods=["GET", "POST"])
+@app.route("/api/admin/memory", methods=["GET", "POST", "DELETE"])
+def admin():
+    action = ADMIN_ACTIONS[(request.path, request.method)]
+    params = request.get_json(silent=True) or request.args.to_dict()
+    body, status = handle_admin(action, request.headers.get("X-Admin-Token"), params)
+    if isinstance(body, str):
+        return Response(body, status=status, mimetype="text/plain")
+    return jsonify(body), status
 
 
 @app.route("/api/health", methods=["GET"])
 def health():
-    return jsonify({"status": "ok", "database_size": len(face_recognizer.db_names)})
+    return jsonify(health_status())
 
 
 if __name__ == "__main__":
+    start_frame_server()
     app.run(host="0.0.0.0", port=8000)
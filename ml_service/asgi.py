@@ -0,0 +1,244 @@
+"""
+Async (ASGI) serving mode for the ML service.
+
+Serves the same /api/predict, /api/predict/jobs, /api/shard/search and
+/api/health contracts as the Flask app, but on an event loop: request bodies
+are read asynchronously, recognition runs on a bounded thread pool, and admission control rejects work
+with 503 + Retry-After once MAX_IN_FLIGHT requests are running and
+MAX_QUEUE_DEPTH more are waiting.
+
+Run with:
+    uvicorn asgi:app --host 0.0.0.0 --port 8000
+or under gunicorn:
+    gunicorn -k uvicorn.workers.UvicornWorker -b 0.0.0.0:8000 asgi:app
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Route
+
+import app as service
+import tracing
+
+inference_workers = int(os.environ.get("INFERENCE_WORKERS", "2"))
+max_in_flight = int(os.environ.get("MAX_IN_FLIGHT", str(inference_workers)))
+if max_in_flight < inference_workers:
+    # Fewer slots than threads would leave inference threads idle.
+    logging.warning(
+        f"MAX_IN_FLIGHT={max_in_flight} is below INFERENCE_WORKERS="
+        f"{inference_workers}; using {inference_workers}"
+    )
+    max_in_flight = inference_workers
+max_queue_depth = int(os.environ.get("MAX_QUEUE_DEPTH", "8"))
+queue_timeout = float(os.environ.get("QUEUE_TIMEOUT_SECONDS", "10"))
+retry_after = int(os.environ.get("RETRY_AFTER_SECONDS", "1"))
+
+
+class Overloaded(Exception):
+    pass
+
+
+class AdmissionController:
+    """
+    Bounds concurrent inference to max_in_flight, with at most max_queue_depth
+    requests waiting for a slot. Anything beyond that is rejected immediately
+    rather than queued without limit.
+    """
+
+    def __init__(self, max_in_flight, max_queue_depth, queue_timeout):
+        self.max_in_flight = max_in_flight
+        self.max_queue_depth = max_queue_depth
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self._slots = None
+
+    def overloaded(self) -> bool:
+        return (
+            self.in_flight >= self.max_in_flight
+            and self.waiting >= self.max_queue_depth
+        )
+
+    async def acquire(self):
+        if self._slots is None:
+            # Created lazily so it binds to the running event loop.
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+        if self.overloaded():
+            raise Overloaded()
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise Overloaded()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+
+    def release(self):
+        self.in_flight -= 1
+        self._slots.release()
+
+    async def run(self, executor, fn, *args):
+        """
+        Run fn(*args) on executor in a slot taken with acquire(), keeping the
+        current trace span. The slot is released when fn finishes, not when
+        the caller stops waiting: a client that disconnects cancels the
+        await, but the thread keeps running fn and still holds the slot.
+        """
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        try:
+            future = executor.submit(context.run, fn, *args)
+        except BaseException:
+            self.release()
+            raise
+
+        def done(_):
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(self.release)
+
+        future.add_done_callback(done)
+        return await asyncio.wrap_future(future)
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+
+executor = ThreadPoolExecutor(
+    max_workers=inference_workers, thread_name_prefix="inference"
+)
+admission = AdmissionController(max_in_flight, max_queue_depth, queue_timeout)
+
+
+def overloaded_response():
+    return JSONResponse(
+        {"error": "Service overloaded, retry later"},
+        status_code=503,
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
+def run_in_context(executor, fn, *args):
+    """run_in_executor that keeps the current trace span for fn."""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return loop.run_in_executor(executor, context.run, fn, *args)
+
+
+async def run_admitted(request, handler, span_name):
+    # Fail fast before reading the body so overload does not buffer uploads.
+    if admission.overloaded():
+        return overloaded_response()
+
+    try:
+        data = await request.json()
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        data = None
+
+    # The span includes the wait for an inference slot.
+    with tracing.span(span_name, request.headers.get("traceparent")) as span:
+        try:
+            await admission.acquire()
+        except Overloaded:
+            logging.warning(
+                f"Rejecting request: {admission.in_flight} in flight, "
+                f"{admission.waiting} waiting"
+            )
+            span.set("status", 503)
+            return overloaded_response()
+        span.set("queued_ms", round(span.elapsed_ms, 3))
+        body, status = await admission.run(executor, handler, data)
+        span.set("status", status)
+    return JSONResponse(body, status_code=status)
+
+
+async def predict(request):
+    return await run_admitted(request, service.handle_predict, "predict")
+
+
+async def submit_job(request):
+    # Queued jobs are drained by the job worker pool, not the inference
+    # executor, so submission skips admission control; the queue has its own
+    # depth limit.
+    try:
+        data = await request.json()
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        data = None
+    with tracing.span("submit_job", request.headers.get("traceparent")):
+        body, status = await run_in_context(None, service.handle_submit_job, data)
+    return JSONResponse(
+        body, status_code=status, headers=service.job_response_headers(body, status)
+    )
+
+
+async def get_job(request):
+    loop = asyncio.get_running_loop()
+    body, status = await loop.run_in_executor(
+        None, service.handle_get_job, request.path_params["job_id"]
+    )
+    return JSONResponse(body, status_code=status)
+
+
+async def shard_search(request):
+    return await run_admitted(request, service.handle_shard_search, "shard_search")
+
+
+async def admin(request):
+    action = service.ADMIN_ACTIONS[(request.url.path, request.method)]
+    try:
+        params = await request.json()
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        params = dict(request.query_params)
+    loop = asyncio.get_running_loop()
+    body, status = await loop.run_in_executor(
+        None,
+        service.handle_admin,
+        action,
+        request.headers.get("X-Admin-Token"),
+        params,
+    )
+    if isinstance(body, str):
+        return PlainTextResponse(body, status_code=status)
+    return JSONResponse(body, status_code=status)
+
+
+async def health(request):
+    loop = asyncio.get_running_loop()
+    # Coordinator health fans out to shards over HTTP; keep it off the loop.
+    status = await loop.run_in_executor(None, service.health_status)
+    status["in_flight"] = admission.in_flight
+    status["queued"] = admission.waiting
+    return JSONResponse(status)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    service.start_frame_server()
+    yield
+
+
+app = Starlette(
+    routes=[
+        Route("/api/predict", predict, methods=["POST"]),
+        Route("/api/predict/jobs", submit_job, methods=["POST"]),
+        Route("/api/predict/jobs/{job_id}", get_job, methods=["GET"]),
+        Route("/api/shard/search", shard_search, methods=["POST"]),
+        Route("/api/admin/profile", admin, methods=["GET", "POST"]),
+        Route("/api/admin/memory", admin, methods=["GET", "POST", "DELETE"]),
+        Route("/api/health", health, methods=["GET"]),
+    ],
+    lifespan=lifespan,
+)
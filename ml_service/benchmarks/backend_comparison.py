@@ -0,0 +1,151 @@
+"""
+Accuracy vs. latency comparison of the configurable detector/embedding backends.
+
+Every image in --reference-dir is enrolled, then perturbed copies (mirrored,
+darkened, brightened, downscaled) are used as probes. For each backend the
+script reports import+load time, mean and p95 per-probe embedding latency and
+top-1 identification accuracy. Model files are passed on the command line;
+backends whose models are missing are skipped.
+
+Usage (from ml_service/):
+    python benchmarks/backend_comparison.py \\
+        --reference-dir ../database/db_images \\
+        --yunet models/face_detection_yunet_2023mar.onnx \\
+        --sface models/face_recognition_sface_2021dec.onnx \\
+        --onnx models/arcface_r50.onnx
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from gallery import FloatGallery  # noqa: E402
+
+
+def load_references(reference_dir):
+    references = {}
+    for filename in sorted(os.listdir(reference_dir)):
+        if filename.lower().endswith((".jpg", ".jpeg", ".png")):
+            img = cv2.imread(os.path.join(reference_dir, filename))
+            if img is not None:
+                references[os.path.splitext(filename)[0]] = cv2.cvtColor(
+                    img, cv2.COLOR_BGR2RGB
+                )
+    return references
+
+
+def perturbations(img_rgb):
+    height, width = img_rgb.shape[:2]
+    yield "mirror", np.ascontiguousarray(img_rgb[:, ::-1])
+    yield "dark", cv2.convertScaleAbs(img_rgb, alpha=0.6, beta=0)
+    yield "bright", cv2.convertScaleAbs(img_rgb, alpha=1.2, beta=30)
+    small = cv2.resize(img_rgb, (width // 2, height // 2), interpolation=cv2.INTER_AREA)
+    yield "half-res", cv2.resize(small, (width, height))
+
+
+def run_backend(name, options, references):
+    started = time.perf_counter()
+    from face_recognition import create_backend
+
+    backend = create_backend(name, **options)
+    # Warm-up also forces lazy model loading into the load time.
+    backend.extract_embedding(next(iter(references.values())))
+    load_seconds = time.perf_counter() - started
+
+    ids, embeddings = [], []
+    for student_id, img_rgb in references.items():
+        try:
+            embeddings.append(backend.extract_embedding(img_rgb))
+            ids.append(student_id)
+        except Exception as e:
+            logging.warning(f"{name}: could not enroll {student_id}: {e}")
+    gallery = FloatGallery(ids, np.array(embeddings), model_id=backend.model_id)
+
+    latencies, correct, total = [], 0, 0
+    for student_id in ids:
+        for _, probe in perturbations(references[student_id]):
+            total += 1
+            started = time.perf_counter()
+            try:
+                embedding = backend.extract_embedding(probe)
+            except Exception:
+                continue
+            finally:
+                latencies.append(time.perf_counter() - started)
+            correct += gallery.search(embedding, top_k=1)[0][0] == student_id
+
+    latencies_ms = 1000 * np.array(latencies)
+    return {
+        "model_id": backend.model_id,
+        "load_s": load_seconds,
+        "enrolled": f"{len(ids)}/{len(references)}",
+        "accuracy": correct / total if total else 0.0,
+        "mean_ms": float(latencies_ms.mean()) if len(latencies_ms) else 0.0,
+        "p95_ms": float(np.percentile(latencies_ms, 95)) if len(latencies_ms) else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--reference-dir", default="../database/db_images")
+    parser.add_argument("--deepface-models", default="ArcFace")
+    parser.add_argument("--detector-backend", default="opencv")
+    parser.add_argument("--yunet", help="YuNet detector ONNX file")
+    parser.add_argument("--sface", help="SFace recognizer ONNX file")
+    parser.add_argument("--onnx", help="ArcFace-style embedding ONNX file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    references = load_references(args.reference_dir)
+    if not references:
+        sys.exit(f"No reference images in {args.reference_dir}")
+
+    runs = []
+    if args.yunet and args.sface:
+        runs.append(
+            (
+                "opencv",
+                {"detector_model_path": args.yunet, "sface_model_path": args.sface},
+            )
+        )
+    if args.yunet and args.onnx:
+        runs.append(
+            ("onnx", {"detector_model_path": args.yunet, "onnx_model_path": args.onnx})
+        )
+    # DeepFace runs last so the TF-free backends are timed without TensorFlow loaded.
+    for model_name in filter(None, args.deepface_models.split(",")):
+        runs.append(
+            (
+                "deepface",
+                {"model_name": model_name, "detector_backend": args.detector_backend},
+            )
+        )
+
+    print(
+        f"{len(references)} identities x 4 perturbed probes from {args.reference_dir}"
+    )
+    print(
+        f"{'backend':<40}{'load s':>8}{'enrolled':>10}"
+        f"{'top-1':>8}{'mean ms':>9}{'p95 ms':>9}"
+    )
+    for name, options in runs:
+        try:
+            result = run_backend(name, options, references)
+        except Exception as e:
+            print(f"{name:<40} skipped: {e}")
+            continue
+        print(
+            f"{result['model_id']:<40}{result['load_s']:>8.2f}{result['enrolled']:>10}"
+            f"{result['accuracy']:>8.3f}{result['mean_ms']:>9.1f}{result['p95_ms']:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
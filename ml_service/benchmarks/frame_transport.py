@@ -0,0 +1,125 @@
+"""
+Per-frame transport overhead: HTTP /api/predict vs the local frame socket.
+
+Both paths run against this service in a separate process, with a recognizer
+that returns immediately, so only the cost of getting a frame from the camera
+to recognition is timed:
+
+  http  camera: JPEG encode (quality 95) + base64 + JSON POST; service: JSON
+        parse, decode for the inspection copy, decode to RGB
+  shm   camera: BGR->RGB copy into shared memory + JSON header over a Unix
+        socket; service: map the segment as a numpy array
+
+Usage (from ml_service/):
+    python benchmarks/frame_transport.py --repeats 50
+"""
+
+import argparse
+import base64
+import os
+import subprocess
+import sys
+import logging
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(HERE, ".."))
+# Only for frame_client; the camera has its own app.py.
+sys.path.append(os.path.join(HERE, "..", "..", "camera"))
+
+import app as service  # noqa: E402
+from frame_client import FrameClient  # noqa: E402
+from frame_transport import FrameServer  # noqa: E402
+
+RESOLUTIONS = {"720p": (1280, 720), "1080p": (1920, 1080), "4K": (3840, 2160)}
+
+
+class NullRecognizer:
+    """Skips recognition so only the transport is timed."""
+
+    def has_collection(self, collection_id):
+        return True
+
+    def recognize_face(self, img_rgb, collection_id=None, source_id=None):
+        return {"match": False, "shape": list(img_rgb.shape)}
+
+
+def synthetic_frame(width, height, seed=0):
+    """A camera-like frame: smooth noise, so JPEG sizes are realistic."""
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(40, 210, size=(height, width, 3), dtype=np.uint8)
+    return cv2.GaussianBlur(frame, (0, 0), 2)
+
+
+def timed(fn, repeats):
+    """Median and 95th percentile wall time in ms over repeats calls."""
+    fn()  # Connections, segments and buffers are set up outside the timing.
+    times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    return 1000 * float(np.median(times)), 1000 * float(np.percentile(times, 95))
+
+
+def http_predict(session, url, frame):
+    ok, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 95])
+    image_data = base64.b64encode(encoded.tobytes()).decode("utf-8")
+    response = session.post(url, json={"Image": {"Bytes": image_data}})
+    response.raise_for_status()
+
+
+def serve(socket_path):
+    """Run both transports and print the HTTP port for the parent process."""
+    from werkzeug.serving import make_server
+
+    logging.disable(logging.INFO)
+    service._face_recognizer = NullRecognizer()
+    os.environ.setdefault("IMAGE_OUTPUT_DIR", tempfile.mkdtemp())
+    FrameServer(socket_path, service.handle_frame).start()
+    http_server = make_server("127.0.0.1", 0, service.app, threaded=True)
+    print(http_server.server_port, flush=True)
+    http_server.serve_forever()
+
+
+def main():
+    import requests
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=30)
+    parser.add_argument("--serve", metavar="SOCKET", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        return serve(args.serve)
+
+    socket_path = os.path.join(tempfile.mkdtemp(), "frames.sock")
+    server = subprocess.Popen(
+        [sys.executable, __file__, "--serve", socket_path], stdout=subprocess.PIPE
+    )
+    url = f"http://127.0.0.1:{int(server.stdout.readline())}/api/predict"
+    session = requests.Session()
+    client = FrameClient(socket_path)
+
+    print(f"median / p95 of {args.repeats} frames, recognition skipped")
+    print(f"{'input':<8}{'http ms':>16}{'shm ms':>16}{'speedup':>10}")
+    try:
+        for label, (width, height) in RESOLUTIONS.items():
+            frame = synthetic_frame(width, height)
+            http_ms = timed(lambda: http_predict(session, url, frame), args.repeats)
+            shm_ms = timed(lambda: client.predict(frame, {}), args.repeats)
+            print(
+                f"{label:<8}{http_ms[0]:>9.1f} / {http_ms[1]:<5.1f}"
+                f"{shm_ms[0]:>9.1f} / {shm_ms[1]:<5.1f}"
+                f"{http_ms[0] / shm_ms[0]:>9.1f}x"
+            )
+    finally:
+        client.close()
+        server.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Memory vs. recall report for the gallery storage modes on a synthetic gallery.
+
+Identities are drawn around shared cluster centres so that near neighbours
+exist, and probes are noisy copies of the enrolled embedding. Recall@1 is
+measured against the true identity and agreement against the exact float
+search.
+
+Usage (from ml_service/):
+    python benchmarks/gallery_quantization.py --identities 100000 --queries 1000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from gallery import FloatGallery, Int8Gallery, normalize_embeddings  # noqa: E402
+
+
+def make_gallery(identities, dim, clusters, spread, rng):
+    centres = rng.standard_normal((clusters, dim))
+    assignment = rng.integers(0, clusters, identities)
+    embeddings = centres[assignment] + spread * rng.standard_normal((identities, dim))
+    return normalize_embeddings(embeddings)
+
+
+def make_probes(gallery, queries, noise, rng):
+    truth = rng.integers(0, len(gallery), queries)
+    probes = gallery[truth] + noise * rng.standard_normal((queries, gallery.shape[1]))
+    return normalize_embeddings(probes), truth
+
+
+def evaluate(gallery, probes, truth, exact_top1):
+    hits = agree = 0
+    started = time.perf_counter()
+    for probe, expected, exact in zip(probes, truth, exact_top1):
+        best = int(np.argmax(gallery.scores(probe)))
+        hits += best == expected
+        agree += best == exact
+    elapsed = time.perf_counter() - started
+    return hits / len(probes), agree / len(probes), 1000 * elapsed / len(probes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--identities", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--clusters", type=int, default=2000)
+    parser.add_argument("--spread", type=float, default=0.2)
+    parser.add_argument("--noise", type=float, default=0.08)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    embeddings = make_gallery(
+        args.identities, args.dim, args.clusters, args.spread, rng
+    )
+    probes, truth = make_probes(embeddings, args.queries, args.noise, rng)
+    ids = [str(i) for i in range(args.identities)]
+
+    exact = FloatGallery(ids, embeddings)
+    exact_top1 = [int(np.argmax(exact.scores(p))) for p in probes]
+
+    float64_bytes = embeddings.astype(np.float64).nbytes
+    rows = [("float64 (previous)", float64_bytes, None)]
+    rows.append(("float32", exact.nbytes, exact))
+    for rerank in (0, 10, 50):
+        gallery = Int8Gallery(ids, embeddings, rerank_top_k=rerank)
+        rows.append((f"int8, rerank top {rerank}", gallery.nbytes, gallery))
+
+    print(
+        f"{args.identities} identities x {args.dim}-d, {args.queries} probes "
+        f"(clusters={args.clusters}, spread={args.spread}, noise={args.noise})"
+    )
+    print(
+        f"{'storage':<24}{'resident MB':>12}{'vs f64':>8}"
+        f"{'recall@1':>10}{'agree':>8}{'ms/query':>10}"
+    )
+    for name, nbytes, gallery in rows:
+        ratio = float64_bytes / nbytes
+        if gallery is None:
+            print(f"{name:<24}{nbytes / 1e6:>12.1f}{ratio:>7.1f}x")
+            continue
+        recall, agreement, latency = evaluate(gallery, probes, truth, exact_top1)
+        print(
+            f"{name:<24}{nbytes / 1e6:>12.1f}{ratio:>7.1f}x"
+            f"{recall:>10.4f}{agreement:>8.4f}{latency:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Measure how long `import app` takes and which modules dominate it.
+
+Runs a fresh interpreter with `python -X importtime` (so nothing is cached in
+sys.modules), repeats it --runs times, and prints the median wall time plus
+the slowest top-level imports by cumulative time from the last run.
+
+Usage (from ml_service/):
+    python benchmarks/import_time.py --runs 5 --top 15
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SERVICE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def run_once(module):
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SERVICE_DIR,
+        capture_output=True,
+        text=True,
+    )
+    elapsed = time.perf_counter() - started
+    if completed.returncode != 0:
+        sys.exit(completed.stderr)
+    return elapsed, completed.stderr
+
+
+def parse_importtime(stderr):
+    """
+    Yield (cumulative_us, depth, module) for each `import time:` line.
+    """
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        yield int(cumulative), depth, name.strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    timings = []
+    for _ in range(args.runs):
+        elapsed, stderr = run_once(args.module)
+        timings.append(elapsed)
+
+    entries = list(parse_importtime(stderr))
+    # Depth 0 is the module itself; depth 1 are the imports it triggers directly.
+    direct = sorted((entry for entry in entries if entry[1] == 1), reverse=True)[
+        : args.top
+    ]
+
+    print(
+        f"import {args.module}: median {statistics.median(timings):.3f}s "
+        f"over {args.runs} runs (min {min(timings):.3f}s, max {max(timings):.3f}s)"
+    )
+    print(f"{'cumulative ms':>14}  imported by {args.module}")
+    for cumulative, _, name in direct:
+        print(f"{cumulative / 1000:>14.1f}  {name}")
+    heavy = [
+        name
+        for name in ("tensorflow", "deepface", "matplotlib", "sklearn", "requests")
+        if any(entry[2] == name for entry in entries)
+    ]
+    print(f"heavy modules imported: {', '.join(heavy) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Per-frame latency of the recognition front end at 720p, 1080p and 4K.
+
+A reference face is pasted into a noisy frame at each resolution and JPEG
+encoded, the way the camera sends it. Each frame is then run through three
+pipelines:
+
+  full      decode at full size, detect + embed on the full frame (old path)
+  downsize  decode at full size, detect on a DETECTION_MAX_SIDE copy,
+            embed the face cropped from the full frame
+  reduced   like downsize, but large JPEGs are decoded with
+            IMREAD_REDUCED_* down to REDUCED_DECODE_MIN_SIDE
+
+Decode time is always reported. Detection and embedding need a backend, set
+up with the same options as backend_comparison.py. If no backend can be
+built, only the decode and resize stages are timed.
+
+Usage (from ml_service/):
+    python benchmarks/preprocessing_latency.py --backend deepface
+    python benchmarks/preprocessing_latency.py --backend opencv \\
+        --yunet models/face_detection_yunet_2023mar.onnx \\
+        --sface models/face_recognition_sface_2021dec.onnx
+"""
+
+import argparse
+import base64
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from preprocessing import Preprocessor  # noqa: E402
+from utils import decode_image_to_rgb  # noqa: E402
+
+RESOLUTIONS = {"720p": (1280, 720), "1080p": (1920, 1080), "4K": (3840, 2160)}
+
+
+def synthetic_frame(face_bgr, width, height, seed=0):
+    """Paste the face into a noisy frame so it fills about half the height."""
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(60, 190, size=(height, width, 3), dtype=np.uint8)
+    frame = cv2.GaussianBlur(frame, (0, 0), 3)
+    face_h = height // 2
+    face_w = face_h * face_bgr.shape[1] // face_bgr.shape[0]
+    face = cv2.resize(face_bgr, (face_w, face_h), interpolation=cv2.INTER_CUBIC)
+    y, x = height // 4, (width - face_w) // 2
+    frame[y : y + face_h, x : x + face_w] = face
+    ok, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return base64.b64encode(encoded.tobytes()).decode("ascii")
+
+
+def timed(fn, repeats):
+    """Median wall time in ms over repeats calls, and the last result."""
+    times, result = [], None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - started)
+    return 1000 * float(np.median(times)), result
+
+
+def build_backend(args):
+    from face_recognition import create_backend
+
+    options = {
+        "model_name": args.model_name,
+        "detector_backend": args.detector_backend,
+        "detector_model_path": args.yunet,
+        "sface_model_path": args.sface,
+        "onnx_model_path": args.onnx,
+    }
+    backend = create_backend(args.backend, **options)
+    # Load models outside the timed region.
+    warmup = np.zeros((240, 320, 3), dtype=np.uint8)
+    backend.detect_faces(warmup)
+    return backend
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--face", default="../database/db_images/sarah.jpg")
+    parser.add_argument("--detection-max-side", type=int, default=640)
+    parser.add_argument("--reduced-decode-min-side", type=int, default=960)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--backend", help="deepface, opencv or onnx")
+    parser.add_argument("--model-name", default="ArcFace")
+    parser.add_argument("--detector-backend", default="opencv")
+    parser.add_argument("--yunet", help="YuNet detector ONNX file")
+    parser.add_argument("--sface", help="SFace recognizer ONNX file")
+    parser.add_argument("--onnx", help="ArcFace-style embedding ONNX file")
+    args = parser.parse_args()
+
+    face = cv2.imread(args.face)
+    if face is None:
+        sys.exit(f"Could not read {args.face}")
+
+    backend = None
+    if args.backend:
+        try:
+            backend = build_backend(args)
+        except Exception as e:
+            print(f"backend {args.backend} unavailable ({e}); timing decode only")
+
+    preprocessor = Preprocessor(args.detection_max_side)
+    pipelines = {
+        "full": (None, None),
+        "downsize": (None, preprocessor),
+        "reduced": (args.reduced_decode_min_side, preprocessor),
+    }
+
+    print(
+        f"detection max side {args.detection_max_side}, reduced decode min side "
+        f"{args.reduced_decode_min_side}, median of {args.repeats} runs"
+    )
+    header = f"{'input':<8}{'pipeline':<10}{'decoded':>11}{'decode ms':>11}"
+    header += f"{'resize ms':>11}"
+    if backend is not None:
+        header += f"{'detect ms':>11}{'embed ms':>10}{'total ms':>10}"
+    print(header)
+
+    for label, (width, height) in RESOLUTIONS.items():
+        encoded = synthetic_frame(face, width, height)
+        for name, (min_side, stage) in pipelines.items():
+            decode_ms, img_rgb = timed(
+                lambda: decode_image_to_rgb(encoded, min_side=min_side),
+                args.repeats,
+            )
+            decoded = f"{img_rgb.shape[1]}x{img_rgb.shape[0]}"
+            resize_ms = 0.0
+            scale = stage.detection_scale(img_rgb.shape) if stage else 1.0
+            if scale < 1.0:
+                size = (
+                    round(img_rgb.shape[1] * scale),
+                    round(img_rgb.shape[0] * scale),
+                )
+                resize_ms, _ = timed(
+                    lambda: cv2.resize(img_rgb, size, interpolation=cv2.INTER_AREA),
+                    args.repeats,
+                )
+            row = f"{label:<8}{name:<10}{decoded:>11}{decode_ms:>11.1f}"
+            row += f"{resize_ms:>11.1f}"
+
+            if backend is not None:
+                detector = stage or Preprocessor(detection_max_side=0)
+                detect_ms, boxes = timed(
+                    lambda: detector.detect(backend, img_rgb), args.repeats
+                )
+                if boxes:
+                    total_ms, _ = timed(
+                        lambda: (
+                            detector.extract_embedding(backend, img_rgb)
+                            if stage
+                            else backend.extract_embedding(img_rgb)
+                        ),
+                        args.repeats,
+                    )
+                    embed_ms = total_ms - detect_ms
+                    row += f"{detect_ms:>11.1f}{embed_ms:>10.1f}"
+                    row += f"{decode_ms + total_ms:>10.1f}"
+                else:
+                    row += f"{detect_ms:>11.1f}{'no face':>10}{'-':>10}"
+            print(row)
+
+
+if __name__ == "__main__":
+    main()
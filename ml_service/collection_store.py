@@ -0,0 +1,268 @@
+"""
+Named face collections (per school, per class section) with their own galleries.
+
+A rosters file maps each CollectionId to the student IDs it contains:
+
+    {
+      "lincoln-high/period-1": ["jayvin", "enrique", "michelle"],
+      "lincoln-high/period-2": ["sarah", "steven"]
+    }
+
+A collection's gallery is built the first time it is queried, from the
+reference images of its roster only, so a query searches ~30 candidates
+instead of every enrolled student. A collection none of whose students has a
+usable reference image is remembered as empty until its roster or one of its
+students changes, so queries to it do not rebuild it every time. Galleries that have not been used for
+idle_seconds, or that fall out of the max_loaded most recently used, are
+dropped from memory and rebuilt on the next query. With cache_dir set,
+per-student embeddings are kept on disk, so rebuilding a gallery does not
+re-run the embedding model.
+
+The default collection (the CollectionId the camera sends unless configured
+otherwise) contains every reference image unless the rosters file defines it.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from face_recognition import reference_images, student_reference_images
+from gallery import build_gallery
+
+
+class UnknownCollection(KeyError):
+    pass
+
+
+class CollectionStore:
+    def __init__(
+        self,
+        recognizer,
+        rosters_path: str,
+        default_collection="student-gallery",
+        max_loaded=8,
+        idle_seconds=600.0,
+        cache_dir: Optional[str] = None,
+    ):
+        self.recognizer = recognizer
+        self.rosters_path = rosters_path
+        self.default_collection = default_collection
+        self.max_loaded = max_loaded
+        self.idle_seconds = idle_seconds
+        self.cache_dir = None
+        if cache_dir:
+            safe_model_id = re.sub(r"[^A-Za-z0-9_.-]", "_", recognizer.model_id)
+            self.cache_dir = os.path.join(cache_dir, safe_model_id)
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+        self.rosters: Dict[str, List[str]] = {}
+        self._rosters_mtime = None
+        self._loaded = OrderedDict()  # collection id -> (gallery, last used)
+        self._empty = set()  # collection ids whose build found no usable faces
+        # Bumped whenever a collection's inputs change, so a build that was
+        # already running when they changed is not kept.
+        self._generations: Dict[str, int] = {}
+        self._build_locks = {}
+        self._lock = threading.Lock()
+        self.reload_rosters()
+
+    def reload_rosters(self) -> None:
+        """Re-read the rosters file if it changed; drops galleries it affects."""
+        try:
+            mtime = os.path.getmtime(self.rosters_path)
+        except OSError:
+            if self._rosters_mtime is None:
+                logging.warning(f"Rosters file not found: {self.rosters_path}")
+                self._rosters_mtime = 0
+            return
+        if mtime == self._rosters_mtime:
+            return
+
+        with open(self.rosters_path) as f:
+            rosters = json.load(f)
+        with self._lock:
+            changed = {
+                cid
+                for cid in set(rosters) | set(self.rosters)
+                if rosters.get(cid) != self.rosters.get(cid)
+            }
+            for cid in changed:
+                self._loaded.pop(cid, None)
+                self._empty.discard(cid)
+                self._generations[cid] = self._generations.get(cid, 0) + 1
+            self.rosters = rosters
+            self._rosters_mtime = mtime
+        logging.info(
+            f"Loaded {len(rosters)} collection rosters from {self.rosters_path}"
+        )
+
+    def __contains__(self, collection_id) -> bool:
+        return collection_id in self.rosters or collection_id == self.default_collection
+
+    def get(self, collection_id: Optional[str] = None):
+        """
+        The gallery for collection_id (None means the default collection),
+        built on first use. Returns None if none of its students has a usable
+        reference image. Raises UnknownCollection for unknown IDs.
+        """
+        collection_id = collection_id or self.default_collection
+        self.reload_rosters()
+        if collection_id not in self:
+            raise UnknownCollection(collection_id)
+
+        with self._lock:
+            # Idle galleries are dropped on every query, not only after builds.
+            self.evict(keep=collection_id)
+            if collection_id in self._empty:
+                return None
+            entry = self._loaded.get(collection_id)
+            if entry is not None:
+                self._loaded[collection_id] = (entry[0], time.time())
+                self._loaded.move_to_end(collection_id)
+                return entry[0]
+            build_lock = self._build_locks.setdefault(collection_id, threading.Lock())
+
+        # One build per collection at a time; other collections build in parallel.
+        with build_lock:
+            while True:
+                with self._lock:
+                    if collection_id in self._empty:
+                        return None
+                    entry = self._loaded.get(collection_id)
+                    generation = self._generations.get(collection_id, 0)
+                if entry is not None:
+                    return entry[0]
+                gallery = self.build(collection_id)
+                with self._lock:
+                    if self._generations.get(collection_id, 0) != generation:
+                        # Invalidated while building: the result may use old
+                        # reference images.
+                        logging.info(f"Rebuilding collection {collection_id}")
+                        continue
+                    if gallery is None:
+                        # Takes no memory, so it is not subject to eviction.
+                        self._empty.add(collection_id)
+                        return None
+                    self._loaded[collection_id] = (gallery, time.time())
+                    self._loaded.move_to_end(collection_id)
+                    self.evict(keep=collection_id)
+                return gallery
+
+    def evict(self, keep=None) -> None:
+        """Drop idle galleries and those beyond max_loaded. Caller holds _lock."""
+        now = time.time()
+        for cid, (_, last_used) in list(self._loaded.items()):
+            if cid != keep and now - last_used > self.idle_seconds:
+                del self._loaded[cid]
+                logging.info(f"Evicted idle collection {cid}")
+        while len(self._loaded) > self.max_loaded:
+            cid = next(iter(self._loaded))
+            if cid == keep:
+                self._loaded.move_to_end(cid)
+                continue
+            del self._loaded[cid]
+            logging.info(f"Evicted least recently used collection {cid}")
+
+    def invalidate(self, student_ids) -> None:
+        """
+        Drop loaded galleries that may include any of student_ids, so they are
+        rebuilt with the current reference images on their next query. Empty
+        collections they may belong to are built again too.
+        """
+        student_ids = set(student_ids)
+        with self._lock:
+            # Includes collections being built right now.
+            candidates = set(self.rosters) | {self.default_collection}
+            for cid in candidates | set(self._loaded) | self._empty:
+                roster = self.rosters.get(cid)
+                if roster is None or student_ids.intersection(roster):
+                    self._generations[cid] = self._generations.get(cid, 0) + 1
+                    self._empty.discard(cid)
+                    if self._loaded.pop(cid, None) is not None:
+                        logging.info(
+                            f"Reloading collection {cid} after student changes"
+                        )
+
+    def loaded(self) -> List[str]:
+        with self._lock:
+            return list(self._loaded)
+
+    def roster(self, collection_id: str) -> List[str]:
+        if collection_id in self.rosters:
+            return list(self.rosters[collection_id])
+        # Default collection without a roster: every reference image.
+        reference_dir = self.recognizer.reference_dir
+        if not os.path.isdir(reference_dir):
+            return []
+        return sorted({student_id for student_id, _ in reference_images(reference_dir)})
+
+    def embedding(self, student_id: str, path: str) -> Optional[np.ndarray]:
+        cache_path = None
+        if self.cache_dir:
+            # Keyed by the photo's path under reference_dir (with extension),
+            # its mtime in nanoseconds and its size, so a replaced photo is
+            # re-embedded even if copying kept its mtime to the second.
+            stat = os.stat(path)
+            relative = os.path.relpath(path, self.recognizer.reference_dir)
+            key = f"{relative}\0{stat.st_mtime_ns}\0{stat.st_size}"
+            digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+            name = re.sub(r"[^A-Za-z0-9_.-]", "_", relative)
+            cache_path = os.path.join(self.cache_dir, f"{name}-{digest}.npy")
+            if os.path.exists(cache_path):
+                return np.load(cache_path)
+
+        img = cv2.imread(path)
+        if img is None:
+            logging.error(f"Failed to load image: {path}")
+            return None
+        try:
+            embedding = self.recognizer.extract_embedding(
+                cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+            )
+        except Exception as e:
+            logging.error(f"Error processing {path}: {str(e)}")
+            return None
+
+        if cache_path:
+            np.save(cache_path, np.asarray(embedding, dtype=np.float32))
+        return embedding
+
+    def build(self, collection_id: str):
+        started = time.time()
+        student_ids, embeddings = [], []
+        reference_dir = self.recognizer.reference_dir
+        for student_id in self.roster(collection_id):
+            paths = student_reference_images(reference_dir, student_id)
+            if not paths:
+                logging.warning(f"No reference image for {student_id}")
+            for path in paths:
+                embedding = self.embedding(student_id, path)
+                if embedding is not None:
+                    student_ids.append(student_id)
+                    embeddings.append(embedding)
+        if not embeddings:
+            logging.warning(f"Collection {collection_id} has no usable reference faces")
+            return None
+
+        gallery = build_gallery(
+            student_ids,
+            np.array(embeddings),
+            storage=self.recognizer.embedding_storage,
+            rerank_top_k=self.recognizer.rerank_top_k,
+            model_id=self.recognizer.model_id,
+            template_top_k=self.recognizer.template_top_k,
+        )
+        logging.info(
+            f"Loaded collection {collection_id}: {len(gallery)} people "
+            f"in {time.time() - started:.2f}s"
+        )
+        return gallery
@@ -1,11 +1,256 @@
 import os
 import numpy as np
 import cv2
-from deepface import DeepFace
-from sklearn.metrics.pairwise import cosine_similarity
 import logging
-import requests
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
+from gallery import build_gallery
+import tracing
+
+# Face box in image coordinates: (x, y, w, h)
+Box = Tuple[int, int, int, int]
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+# Five-point landmark template for 112x112 ArcFace crops (eyes, nose, mouth corners).
+ARCFACE_TEMPLATE = np.array(
+    [
+        [38.2946, 51.6963],
+        [73.5318, 51.5014],
+        [56.0252, 71.7366],
+        [41.5493, 92.3655],
+        [70.7299, 92.2041],
+    ],
+    dtype=np.float32,
+)
+
+
+class DeepFaceBackend:
+    """
+    DeepFace detector + embedding model. Imports TensorFlow on first use.
+    """
+
+    def __init__(
+        self,
+        model_name="ArcFace",
+        detector_backend="opencv",
+        align=True,
+        enforce_detection=True,
+    ):
+        self.model_name = model_name
+        self.detector_backend = detector_backend
+        self.align = align
+        self.enforce_detection = enforce_detection
+        self.model_id = f"deepface:{model_name}"
+
+    def extract_embedding(self, img_rgb: np.ndarray) -> np.ndarray:
+        from deepface import DeepFace
+
+        result = DeepFace.represent(
+            img_path=img_rgb,
+            model_name=self.model_name,
+            detector_backend=self.detector_backend,
+            enforce_detection=self.enforce_detection,
+            align=self.align,
+        )
+        return np.array(result[0]["embedding"])
+
+    def detect_faces(self, img_rgb: np.ndarray) -> List[Box]:
+        from deepface import DeepFace
+
+        faces = DeepFace.extract_faces(
+            img_path=img_rgb,
+            detector_backend=self.detector_backend,
+            enforce_detection=False,
+            align=False,
+        )
+        boxes = []
+        for face in faces:
+            area = face["facial_area"]
+            # DeepFace reports the whole image when nothing was detected.
+            if face.get("confidence", 0) > 0:
+                boxes.append((area["x"], area["y"], area["w"], area["h"]))
+        return boxes
+
+    def embed_face(self, face_rgb: np.ndarray) -> np.ndarray:
+        from deepface import DeepFace
+
+        result = DeepFace.represent(
+            img_path=face_rgb,
+            model_name=self.model_name,
+            detector_backend="skip",
+            enforce_detection=False,
+            align=False,
+        )
+        return np.array(result[0]["embedding"])
+
+
+class YuNetDetector:
+    """
+    OpenCV DNN face detector (YuNet ONNX model). Returns boxes with 5 landmarks.
+    """
+
+    def __init__(self, model_path: str, score_threshold: float = 0.7):
+        if not model_path or not os.path.exists(model_path):
+            raise FileNotFoundError(f"YuNet model not found: {model_path}")
+        self.detector = cv2.FaceDetectorYN.create(
+            model_path, "", (320, 320), score_threshold
+        )
+
+    def detect(self, img_bgr: np.ndarray) -> np.ndarray:
+        height, width = img_bgr.shape[:2]
+        self.detector.setInputSize((width, height))
+        _, faces = self.detector.detect(img_bgr)
+        if faces is None:
+            return np.empty((0, 15), dtype=np.float32)
+        # Largest face first, matching DeepFace's ordering.
+        return faces[np.argsort(-(faces[:, 2] * faces[:, 3]))]
+
+
+class OpenCVBackend:
+    """
+    YuNet detection + SFace embeddings, both run by OpenCV DNN on the CPU.
+    Does not import TensorFlow.
+    """
+
+    def __init__(
+        self, detector_model_path: str, sface_model_path: str, score_threshold=0.7
+    ):
+        if not sface_model_path or not os.path.exists(sface_model_path):
+            raise FileNotFoundError(f"SFace model not found: {sface_model_path}")
+        self.detector = YuNetDetector(detector_model_path, score_threshold)
+        self.recognizer = cv2.FaceRecognizerSF.create(sface_model_path, "")
+        self.model_id = f"opencv:{os.path.basename(sface_model_path)}"
+
+    def _faces(self, img_rgb: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        img_bgr = cv2.cvtColor(img_rgb, cv2.COLOR_RGB2BGR)
+        return img_bgr, self.detector.detect(img_bgr)
+
+    def extract_embedding(self, img_rgb: np.ndarray) -> np.ndarray:
+        img_bgr, faces = self._faces(img_rgb)
+        if len(faces) == 0:
+            raise ValueError("Face could not be detected in the image")
+        aligned = self.recognizer.alignCrop(img_bgr, faces[0])
+        return self.recognizer.feature(aligned).flatten()
+
+    def detect_faces(self, img_rgb: np.ndarray) -> List[Box]:
+        _, faces = self._faces(img_rgb)
+        return [tuple(int(v) for v in face[:4]) for face in faces]
+
+    def embed_face(self, face_rgb: np.ndarray) -> np.ndarray:
+        face_bgr = cv2.cvtColor(face_rgb, cv2.COLOR_RGB2BGR)
+        return self.recognizer.feature(cv2.resize(face_bgr, (112, 112))).flatten()
+
+
+class OnnxBackend:
+    """
+    YuNet detection + an ArcFace-style ONNX embedding model run by ONNX Runtime.
+    Faces are aligned to the standard 112x112 five-point template.
+    """
+
+    def __init__(self, detector_model_path: str, model_path: str, score_threshold=0.7):
+        import onnxruntime
+
+        if not model_path or not os.path.exists(model_path):
+            raise FileNotFoundError(f"ONNX embedding model not found: {model_path}")
+        self.detector = YuNetDetector(detector_model_path, score_threshold)
+        self.session = onnxruntime.InferenceSession(
+            model_path, providers=["CPUExecutionProvider"]
+        )
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.channels_last = model_input.shape[-1] == 3
+        self.model_id = f"onnx:{os.path.basename(model_path)}"
+
+    def _run(self, face_rgb: np.ndarray) -> np.ndarray:
+        blob = (face_rgb.astype(np.float32) - 127.5) / 127.5
+        if not self.channels_last:
+            blob = blob.transpose(2, 0, 1)
+        output = self.session.run(None, {self.input_name: blob[np.newaxis]})[0]
+        return output.flatten()
+
+    def extract_embedding(self, img_rgb: np.ndarray) -> np.ndarray:
+        faces = self.detector.detect(cv2.cvtColor(img_rgb, cv2.COLOR_RGB2BGR))
+        if len(faces) == 0:
+            raise ValueError("Face could not be detected in the image")
+        landmarks = faces[0][4:14].reshape(5, 2)
+        transform, _ = cv2.estimateAffinePartial2D(landmarks, ARCFACE_TEMPLATE)
+        aligned = cv2.warpAffine(img_rgb, transform, (112, 112))
+        return self._run(aligned)
+
+    def detect_faces(self, img_rgb: np.ndarray) -> List[Box]:
+        faces = self.detector.detect(cv2.cvtColor(img_rgb, cv2.COLOR_RGB2BGR))
+        return [tuple(int(v) for v in face[:4]) for face in faces]
+
+    def embed_face(self, face_rgb: np.ndarray) -> np.ndarray:
+        return self._run(cv2.resize(face_rgb, (112, 112)))
+
+
+def is_image(filename: str) -> bool:
+    return filename.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def reference_images(reference_dir: str) -> List[Tuple[str, str]]:
+    """
+    (studentId, path) for every reference image in reference_dir. A student
+    has <studentId>.jpg and/or a <studentId>/ directory of further photos;
+    each image becomes one template of that student.
+    """
+    images = []
+    for name in sorted(os.listdir(reference_dir)):
+        path = os.path.join(reference_dir, name)
+        if os.path.isdir(path):
+            images.extend(
+                (name, os.path.join(path, filename))
+                for filename in sorted(os.listdir(path))
+                if is_image(filename)
+            )
+        elif is_image(name):
+            images.append((os.path.splitext(name)[0], path))
+    return images
+
+
+def student_reference_images(reference_dir: str, student_id: str) -> List[str]:
+    """Paths of one student's reference images (see reference_images)."""
+    paths = [
+        os.path.join(reference_dir, student_id + ext)
+        for ext in IMAGE_EXTENSIONS + tuple(ext.upper() for ext in IMAGE_EXTENSIONS)
+    ]
+    paths = [path for path in paths if os.path.isfile(path)]
+    directory = os.path.join(reference_dir, student_id)
+    if os.path.isdir(directory):
+        paths.extend(
+            os.path.join(directory, filename)
+            for filename in sorted(os.listdir(directory))
+            if is_image(filename)
+        )
+    return paths
+
+
+def create_backend(name="deepface", **options):
+    """
+    Build a detector/embedding backend by name: "deepface", "opencv" or "onnx".
+    """
+    score_threshold = float(options.get("detection_score_threshold", 0.7))
+    if name == "deepface":
+        return DeepFaceBackend(
+            model_name=options.get("model_name", "ArcFace"),
+            detector_backend=options.get("detector_backend", "opencv"),
+            align=options.get("align", True),
+            enforce_detection=options.get("enforce_detection", True),
+        )
+    if name == "opencv":
+        return OpenCVBackend(
+            options.get("detector_model_path"),
+            options.get("sface_model_path"),
+            score_threshold,
+        )
+    if name == "onnx":
+        return OnnxBackend(
+            options.get("detector_model_path"),
+            options.get("onnx_model_path"),
+            score_threshold,
+        )
+    raise ValueError(f"Unknown embedding backend: {name}")
 
 
 class FaceRecognizer:
@@ -15,13 +260,62 @@ class FaceRecognizer:
         reference_dir="reference_faces",
         similarity_threshold=0.4,
         database_url="http://localhost:5002",
+        embedding_storage="float",
+        rerank_top_k=10,
+        template_top_k=10,
+        shard_index=None,
+        shard_count=1,
+        shard_urls=None,
+        shard_top_k=10,
+        backend=None,
+        preprocessor=None,
+        student_lookup=None,
+        collections_file=None,
+        default_collection="student-gallery",
+        max_loaded_collections=8,
+        collection_idle_seconds=600.0,
+        embedding_cache_dir=None,
     ):
+        self.backend = backend or DeepFaceBackend()
+        self.preprocessor = preprocessor
+        # Optional in-process replacement for the database service lookup.
+        self.student_lookup = student_lookup
+        self.model_id = self.backend.model_id
         self.reference_dir = reference_dir
         self.similarity_threshold = similarity_threshold
         self.database_url = database_url
+        self.embedding_storage = embedding_storage
+        self.rerank_top_k = rerank_top_k
+        self.template_top_k = template_top_k
         self.db_embeddings = []
         self.db_student_ids = []
-        self.build_reference_database()
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self.gallery = None
+        self.collections = None
+
+        if shard_urls:
+            from sharding import ShardedGallery
+
+            # Coordinator: the gallery lives in the shard processes.
+            self.gallery = ShardedGallery(
+                shard_urls, top_k=shard_top_k, model_id=self.model_id
+            )
+            logging.info(f"Searching gallery across {len(shard_urls)} shards")
+        elif collections_file:
+            from collection_store import CollectionStore
+
+            # Per-collection galleries, each built on its first query.
+            self.collections = CollectionStore(
+                self,
+                collections_file,
+                default_collection=default_collection,
+                max_loaded=max_loaded_collections,
+                idle_seconds=collection_idle_seconds,
+                cache_dir=embedding_cache_dir,
+            )
+        else:
+            self.build_reference_database()
 
     def build_reference_database(self) -> None:
         logging.info(f"Building face database from: {self.reference_dir}")
@@ -31,50 +325,78 @@ class FaceRecognizer:
             logging.warning(f"Created empty reference directory: {self.reference_dir}")
             return
 
-        for filename in os.listdir(self.reference_dir):
-            if filename.lower().endswith((".jpg", ".jpeg", ".png")):
-                student_id = os.path.splitext(filename)[0]
-                img_path = os.path.join(self.reference_dir, filename)
+        for student_id, img_path in reference_images(self.reference_dir):
+            if not self.owns_student(student_id):
+                continue
 
-                try:
-                    img = cv2.imread(img_path)
-                    if img is None:
-                        logging.error(f"Failed to load image: {img_path}")
-                        continue
+            try:
+                img = cv2.imread(img_path)
+                if img is None:
+                    logging.error(f"Failed to load image: {img_path}")
+                    continue
 
-                    img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-                    embedding = self.extract_embedding(img_rgb)
-                    self.db_embeddings.append(embedding)
-                    self.db_student_ids.append(student_id)
-                    logging.info(f"Added {student_id} to face database")
+                img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+                embedding = self.extract_embedding(img_rgb)
+                self.db_embeddings.append(embedding)
+                self.db_student_ids.append(student_id)
+                logging.info(f"Added {img_path} to face database as {student_id}")
 
-                except Exception as e:
-                    logging.error(f"Error processing {img_path}: {str(e)}")
+            except Exception as e:
+                logging.error(f"Error processing {img_path}: {str(e)}")
 
         if self.db_embeddings:
-            self.db_embeddings = np.array(self.db_embeddings)
-            logging.info(f"Face database built with {len(self.db_student_ids)} people")
+            self.gallery = build_gallery(
+                self.db_student_ids,
+                np.array(self.db_embeddings),
+                storage=self.embedding_storage,
+                rerank_top_k=self.rerank_top_k,
+                model_id=self.model_id,
+                template_top_k=self.template_top_k,
+            )
+            # The gallery owns the (possibly quantized) matrix from here on.
+            self.db_embeddings = self.gallery.embeddings
+            self.db_student_ids = self.gallery.student_ids
+            logging.info(
+                f"Face database built with {len(self.db_student_ids)} people "
+                f"({self.model_id}, {self.embedding_storage} storage, "
+                f"{self.gallery.nbytes} bytes)"
+            )
         else:
             logging.warning("No valid reference faces found in directory")
 
-    def extract_embedding(self, img_rgb: np.ndarray) -> np.ndarray:
+    def owns_student(self, student_id: str) -> bool:
+        if self.shard_index is None or self.shard_count <= 1:
+            return True
+        from sharding import shard_for
+
+        return shard_for(student_id, self.shard_count) == self.shard_index
+
+    def extract_embedding(
+        self, img_rgb: np.ndarray, source_id: Optional[str] = None
+    ) -> np.ndarray:
         if img_rgb.dtype != np.uint8:
             img_rgb = (img_rgb * 255).astype(np.uint8)
 
-        result = DeepFace.represent(
-            img_path=img_rgb,
-            model_name="ArcFace",
-            detector_backend="opencv",
-            enforce_detection=True,
-            align=True,
-        )
-
-        return np.array(result[0]["embedding"])
+        if self.preprocessor is not None:
+            return self.preprocessor.extract_embedding(self.backend, img_rgb, source_id)
+        with tracing.span("detect_embed"):
+            return self.backend.extract_embedding(img_rgb)
 
     def get_student_info(self, student_id: str) -> Optional[Dict[str, Any]]:
+        if self.student_lookup is not None:
+            with tracing.span("student_lookup", student_id=student_id, local=True):
+                return self.student_lookup(student_id)
+
+        with tracing.span("student_lookup", student_id=student_id, local=False):
+            return self.fetch_student_info(student_id)
+
+    def fetch_student_info(self, student_id: str) -> Optional[Dict[str, Any]]:
+        import requests
+
         try:
             response = requests.get(
-                f"{self.database_url}/api/student?studentId={student_id}"
+                f"{self.database_url}/api/student?studentId={student_id}",
+                headers=tracing.headers(),
             )
             if response.status_code == 200:
                 return response.json()
@@ -85,29 +407,53 @@ class FaceRecognizer:
             logging.error(f"Error connecting to database service: {e}")
             return None
 
-    def recognize_face(self, img_rgb: np.ndarray) -> Dict[str, Any]:
-        if len(self.db_embeddings) == 0 or not self.db_student_ids:
-            return {"match": False, "error": "No reference faces available in database"}
+    def gallery_for(self, collection_id: Optional[str] = None):
+        """
+        The gallery to search for a CollectionId. Without a rosters file every
+        CollectionId searches the whole gallery.
+        """
+        if self.collections is None:
+            return self.gallery
+        return self.collections.get(collection_id)
 
+    def has_collection(self, collection_id: Optional[str]) -> bool:
+        if self.collections is None or not collection_id:
+            return True
+        self.collections.reload_rosters()
+        return collection_id in self.collections
+
+    def recognize_face(
+        self,
+        img_rgb: np.ndarray,
+        collection_id: Optional[str] = None,
+        source_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Match the largest face in img_rgb against collection_id's gallery.
+        source_id names the camera or seat the frame came from, so its last
+        face position can be reused for detection.
+        """
         try:
-            query_embedding = self.extract_embedding(img_rgb)
+            gallery = self.gallery_for(collection_id)
+        except KeyError:
+            return {"match": False, "error": f"Unknown collection: {collection_id}"}
+        if gallery is None:
+            return {"match": False, "error": "No reference faces available in database"}
 
-            similarities = cosine_similarity([query_embedding], self.db_embeddings)[0]
+        try:
+            query_embedding = self.extract_embedding(img_rgb, source_id)
 
-            best_match_idx = np.argmax(similarities)
-            best_match_score = similarities[best_match_idx]
+            with tracing.span("search", collection=collection_id):
+                matches = gallery.search(query_embedding)
+            student_id, best_match_score = matches[0]
 
-            all_scores = {
-                student_id: float(score)
-                for student_id, score in zip(self.db_student_ids, similarities)
-            }
+            all_scores = {match_id: score for match_id, score in matches}
 
             if best_match_score >= self.similarity_threshold:
-                student_id = self.db_student_ids[best_match_idx]
 
                 student_info = self.get_student_info(student_id)
 
-                return {
+                result = {
                     "match": True,
                     "similarity": float(best_match_score * 100),
                     "studentId": student_id,
@@ -115,12 +461,21 @@ class FaceRecognizer:
                     "allScores": all_scores,
                 }
             else:
-                return {
+                result = {
                     "match": False,
                     "similarity": float(best_match_score * 100),
                     "message": "No face matched above the similarity threshold",
                     "allScores": all_scores,
                 }
+            missing_shards = getattr(matches, "missing_shards", None)
+            if missing_shards:
+                # Sharded gallery mode answered without some shards.
+                result["shardCoverage"] = {
+                    "searched": matches.shard_count - len(missing_shards),
+                    "total": matches.shard_count,
+                    "missing": missing_shards,
+                }
+            return result
 
         except Exception as e:
             logging.error(f"Error in face recognition: {str(e)}")
@@ -0,0 +1,244 @@
+"""
+Local frame transport for a camera running on the same host as this service.
+
+Instead of a JPEG, base64 and JSON over HTTP, the camera writes the raw RGB
+frame into a shared-memory segment (multiprocessing.shared_memory) and sends
+only a small header over a Unix domain socket:
+
+    {"shm": "<segment name>", "shape": [height, width, 3],
+     "CollectionId": ..., "SourceId": ...}
+
+The server maps the segment and wraps it in a numpy array without copying,
+runs recognition on it and replies with {"status": <HTTP status>, "body":
+<the /api/predict response body>}. Every message is a JSON document prefixed
+with its length as a 4-byte big-endian integer.
+
+The camera owns the segment: it creates it, reuses it for every frame on the
+connection and unlinks it when done. It waits for each reply before writing
+the next frame, so the server can read the frame in place. Both processes
+need the same /dev/shm, e.g. containers started with --ipc=host.
+"""
+
+import errno
+import fcntl
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct(">I")
+MAX_MESSAGE_BYTES = 1024 * 1024
+
+
+def send_message(sock, message):
+    data = json.dumps(message).encode("utf-8")
+    sock.sendall(HEADER.pack(len(data)) + data)
+
+
+def recv_message(sock):
+    """The next message on sock, or None if the peer closed the connection."""
+    header = _recv_exactly(sock, HEADER.size)
+    if header is None:
+        return None
+    (length,) = HEADER.unpack(header)
+    if length > MAX_MESSAGE_BYTES:
+        raise ValueError(f"Message of {length} bytes is too large")
+    data = _recv_exactly(sock, length)
+    if data is None:
+        raise ConnectionError("Connection closed in the middle of a message")
+    return json.loads(data)
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            if chunks:
+                raise ConnectionError("Connection closed in the middle of a message")
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def attach_segment(name):
+    """
+    Map an existing segment without taking ownership of it. Before Python
+    3.13 attaching registers the segment with this process's resource
+    tracker, which would unlink it (and warn) when the service exits.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        segment = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(segment._name, "shared_memory")
+        return segment
+
+
+def close_segment(segment):
+    try:
+        segment.close()
+    except BufferError:
+        # Something still holds a view of the frame; the mapping is released
+        # when that is garbage collected.
+        logger.warning(f"Shared memory segment {segment.name} is still in use")
+
+
+def frame_view(segment, shape):
+    """The frame in segment as a uint8 array, sharing its memory."""
+    shape = tuple(int(side) for side in shape)
+    if len(shape) != 3 or shape[2] != 3 or min(shape) <= 0:
+        raise ValueError(f"Expected an RGB frame shape, got {list(shape)}")
+    if int(np.prod(shape)) > segment.size:
+        raise ValueError(
+            f"Frame of shape {list(shape)} does not fit a {segment.size} byte segment"
+        )
+    return np.ndarray(shape, dtype=np.uint8, buffer=segment.buf)
+
+
+class FrameServer:
+    """
+    Serves recognition requests on a Unix domain socket, one thread per
+    connection. handler(img_rgb, request) returns (body, status), like the
+    HTTP handlers in app.py.
+    """
+
+    def __init__(self, socket_path, handler, backlog=16):
+        self.socket_path = socket_path
+        self.handler = handler
+        self.backlog = backlog
+        self.requests = 0
+        self._sock = None
+        self._thread = None
+
+    def bind(self):
+        """
+        Bind the socket. Returns False if another process is already serving
+        on socket_path (e.g. another worker of the same service).
+
+        Workers starting together would race between finding a stale socket
+        file, unlinking it and binding: one could unlink the socket another
+        has just bound. An exclusive lock on socket_path + ".lock" makes the
+        probe, unlink and bind one step across processes.
+        """
+        directory = os.path.dirname(self.socket_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.socket_path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if os.path.exists(self.socket_path):
+                    if self._is_served():
+                        return False
+                    # Left behind by a process that has exited.
+                    os.unlink(self.socket_path)
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                try:
+                    sock.bind(self.socket_path)
+                    sock.listen(self.backlog)
+                except OSError as e:
+                    sock.close()
+                    if e.errno == errno.EADDRINUSE:
+                        # Bound by a process that does not take the lock.
+                        return False
+                    raise
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        self._sock = sock
+        return True
+
+    def _is_served(self):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.socket_path)
+            return True
+        except OSError:
+            return False
+        finally:
+            probe.close()
+
+    def start(self):
+        if self._sock is None and not self.bind():
+            logger.info(f"Frame socket {self.socket_path} is served by another process")
+            return False
+        self._thread = threading.Thread(
+            target=self._accept, name="frame-server", daemon=True
+        )
+        self._thread.start()
+        logger.info(f"Serving local frames on {self.socket_path}")
+        return True
+
+    def stop(self):
+        sock, self._sock = self._sock, None
+        if sock is not None:
+            # Wakes the accept() in the server thread; close() alone does not.
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+            try:
+                os.unlink(self.socket_path)
+            except FileNotFoundError:
+                pass
+        if self._thread is not None:
+            self._thread.join()
+
+    def _accept(self):
+        while self._sock is not None:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                break
+            threading.Thread(
+                target=self._serve, args=(conn,), name="frame-conn", daemon=True
+            ).start()
+
+    def _serve(self, conn):
+        segments = {}
+        try:
+            while True:
+                request = recv_message(conn)
+                if request is None:
+                    break
+                body, status = self.handle(request, segments)
+                send_message(conn, {"status": status, "body": body})
+        except (OSError, ValueError) as e:
+            logger.warning(f"Local frame connection failed: {e}")
+        finally:
+            conn.close()
+            for segment in segments.values():
+                close_segment(segment)
+
+    def handle(self, request, segments):
+        """
+        Run one request. Segments are attached once per connection and kept
+        in segments, since the camera reuses its segment for every frame.
+        """
+        self.requests += 1
+        name = request.get("shm")
+        if not name or "shape" not in request:
+            return {"error": "No frame provided"}, 400
+        try:
+            if name not in segments:
+                # A camera that outgrew its segment moves to a new one.
+                for old in segments.values():
+                    close_segment(old)
+                segments.clear()
+                segments[name] = attach_segment(name)
+            img_rgb = frame_view(segments[name], request["shape"])
+        except (OSError, ValueError) as e:
+            return {"error": f"Cannot read frame: {e}"}, 400
+        try:
+            return self.handler(img_rgb, request)
+        finally:
+            # The segment can only be closed once no array refers to it.
+            del img_rgb
@@ -0,0 +1,329 @@
+import logging
+import os
+import tempfile
+import weakref
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def normalize_embeddings(embeddings: np.ndarray) -> np.ndarray:
+    """
+    L2-normalize embeddings row-wise so that cosine similarity becomes a dot product.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if embeddings.ndim == 1:
+        embeddings = embeddings[np.newaxis, :]
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return embeddings / norms
+
+
+class FloatGallery:
+    """
+    Reference embeddings kept as a dense float32 matrix (one row per identity).
+
+    model_id records which embedding model produced the rows; vectors from
+    different models are not comparable and must never be searched together.
+    """
+
+    def __init__(
+        self,
+        student_ids: Sequence[str],
+        embeddings: np.ndarray,
+        model_id: Optional[str] = None,
+    ):
+        self.student_ids = list(student_ids)
+        self.embeddings = normalize_embeddings(embeddings)
+        self.model_id = model_id
+
+    def __len__(self) -> int:
+        return len(self.student_ids)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.embeddings.nbytes)
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        return self.embeddings @ normalize_embeddings(query)[0]
+
+    def group_max(self, starts: np.ndarray, ends: np.ndarray, query: np.ndarray):
+        """
+        The best similarity among rows starts[i]:ends[i], for each i.
+        query must already be normalized.
+        """
+        rows, bounds = _group_rows(starts, ends)
+        return np.maximum.reduceat(self.embeddings[rows] @ query, bounds)
+
+    def search(
+        self, query: np.ndarray, top_k: Optional[int] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        Return (studentId, cosine similarity) pairs sorted best first.
+        All identities are returned when top_k is None.
+        """
+        scores = self.scores(query)
+        order = _top_indices(scores, top_k)
+        return [(self.student_ids[i], float(scores[i])) for i in order]
+
+
+class Int8Gallery(FloatGallery):
+    """
+    Reference embeddings stored as int8 codes with one float32 scale per row.
+
+    The full-precision rows are written to a .npy file and memory-mapped, so
+    they are only paged in for the top candidates that get re-ranked. Without
+    float_store_path the file is a temporary one, removed as soon as it is
+    mapped (or, where a mapped file cannot be removed, with the gallery).
+    """
+
+    def __init__(
+        self,
+        student_ids: Sequence[str],
+        embeddings: np.ndarray,
+        rerank_top_k: int = 10,
+        float_store_path: Optional[str] = None,
+        model_id: Optional[str] = None,
+    ):
+        self.student_ids = list(student_ids)
+        self.model_id = model_id
+        self.rerank_top_k = rerank_top_k
+        self.block_rows = 4096
+
+        normalized = normalize_embeddings(embeddings)
+        self.codes, self.scales = quantize_int8(normalized)
+
+        temporary = float_store_path is None
+        if temporary:
+            handle, float_store_path = tempfile.mkstemp(
+                prefix="gallery-", suffix=".npy"
+            )
+            os.close(handle)
+        np.save(float_store_path, normalized)
+        self.float_store_path = float_store_path
+        self.embeddings = np.load(float_store_path, mmap_mode="r")
+        logging.info(
+            f"Quantized {len(self.student_ids)} embeddings to int8 "
+            f"({self.nbytes} bytes resident, float copy at {float_store_path})"
+        )
+        if temporary:
+            try:
+                # The mapping stays readable after the file is unlinked.
+                os.unlink(float_store_path)
+            except OSError:
+                weakref.finalize(self, _remove_file, float_store_path)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.codes.nbytes + self.scales.nbytes)
+
+    def approximate_scores(self, query: np.ndarray) -> np.ndarray:
+        # Dequantize in blocks so a query never materializes a float copy
+        # of the whole gallery.
+        query = normalize_embeddings(query)[0]
+        scores = np.empty(len(self.codes), dtype=np.float32)
+        for start in range(0, len(self.codes), self.block_rows):
+            block = self.codes[start : start + self.block_rows]
+            scores[start : start + len(block)] = block.astype(np.float32) @ query
+        return scores * self.scales
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        """
+        Approximate scores for every identity, with the best rerank_top_k
+        candidates replaced by their exact float similarity.
+        """
+        scores = self.approximate_scores(query)
+        if self.rerank_top_k > 0:
+            candidates = _top_indices(scores, self.rerank_top_k)
+            candidates = np.sort(candidates)
+            exact = np.asarray(self.embeddings[candidates]) @ (
+                normalize_embeddings(query)[0]
+            )
+            scores[candidates] = exact
+        return scores
+
+    def group_max(self, starts: np.ndarray, ends: np.ndarray, query: np.ndarray):
+        """
+        Picks the best row of each group by its int8 score, and returns that
+        row's exact similarity, so only one float row per group is read from
+        the memory-mapped copy.
+        """
+        rows, bounds = _group_rows(starts, ends)
+        approximate = (self.codes[rows].astype(np.float32) @ query) * self.scales[rows]
+        best = [
+            rows[start + np.argmax(approximate[start:end])]
+            for start, end in zip(bounds, np.append(bounds[1:], len(rows)))
+        ]
+        return np.asarray(self.embeddings[best]) @ query
+
+
+def _group_rows(starts: np.ndarray, ends: np.ndarray):
+    """All row indices of the groups, and where each group begins among them."""
+    rows = np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)])
+    bounds = np.concatenate([[0], np.cumsum(np.subtract(ends, starts))[:-1]])
+    return rows, bounds.astype(np.intp)
+
+
+def _remove_file(path: str) -> None:
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+class TemplateGallery:
+    """
+    Several reference embeddings (templates) per identity.
+
+    Each identity is summarized by the normalized mean of its templates. A
+    query is scored against these centroids first (in float or int8 storage,
+    like a one-template gallery), and only the best template_top_k identities
+    are re-scored as the maximum similarity over their own templates. A search
+    therefore costs one centroid pass plus a few small template products,
+    however many photos each student has.
+
+    The templates use the same storage as the centroids. With int8 storage
+    they are an Int8Gallery of their own, whose float copy goes next to
+    float_store_path (as <name>.templates.npy) or to a temporary file.
+    """
+
+    def __init__(
+        self,
+        template_ids: Sequence[str],
+        embeddings: np.ndarray,
+        template_top_k: int = 10,
+        storage: str = "float",
+        rerank_top_k: int = 10,
+        float_store_path: Optional[str] = None,
+        model_id: Optional[str] = None,
+    ):
+        self.model_id = model_id
+        self.template_top_k = template_top_k
+
+        normalized = normalize_embeddings(embeddings)
+        rows = {}
+        for row, student_id in enumerate(template_ids):
+            rows.setdefault(student_id, []).append(row)
+        self.student_ids = list(rows)
+
+        # Templates grouped by identity: identity i owns rows offsets[i]:offsets[i + 1].
+        order = [row for student_rows in rows.values() for row in student_rows]
+        normalized = normalized[order]
+        counts = [len(student_rows) for student_rows in rows.values()]
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+
+        centroids = np.add.reduceat(normalized, self.offsets[:-1], axis=0)
+        template_student_ids = [template_ids[row] for row in order]
+        if storage == "int8":
+            template_store_path = None
+            if float_store_path is not None:
+                root, ext = os.path.splitext(float_store_path)
+                template_store_path = f"{root}.templates{ext or '.npy'}"
+            self.templates = Int8Gallery(
+                template_student_ids,
+                normalized,
+                rerank_top_k=0,
+                float_store_path=template_store_path,
+                model_id=model_id,
+            )
+        else:
+            self.templates = FloatGallery(
+                template_student_ids, normalized, model_id=model_id
+            )
+        del normalized
+        self.centroids = build_gallery(
+            self.student_ids,
+            centroids,
+            storage=storage,
+            rerank_top_k=rerank_top_k,
+            float_store_path=float_store_path,
+            model_id=model_id,
+        )
+        self.embeddings = self.centroids.embeddings
+        logging.info(
+            f"Template gallery: {len(self.templates)} templates for "
+            f"{len(self.student_ids)} identities"
+        )
+
+    def __len__(self) -> int:
+        return len(self.student_ids)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.centroids.nbytes + self.templates.nbytes)
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        """
+        Centroid scores for every identity, with the best template_top_k
+        candidates replaced by their best single-template similarity.
+        """
+        scores = np.array(self.centroids.scores(query), dtype=np.float32)
+        if self.template_top_k <= 0:
+            return scores
+        query = normalize_embeddings(query)[0]
+        candidates = _top_indices(scores, self.template_top_k)
+        scores[candidates] = self.templates.group_max(
+            self.offsets[candidates], self.offsets[candidates + 1], query
+        )
+        return scores
+
+    def search(
+        self, query: np.ndarray, top_k: Optional[int] = None
+    ) -> List[Tuple[str, float]]:
+        scores = self.scores(query)
+        order = _top_indices(scores, top_k)
+        return [(self.student_ids[i], float(scores[i])) for i in order]
+
+
+def quantize_int8(embeddings: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Symmetric per-row scalar quantization: row ~= codes * scale.
+    """
+    max_abs = np.abs(embeddings).max(axis=1)
+    max_abs[max_abs == 0] = 1.0
+    scales = (max_abs / 127.0).astype(np.float32)
+    codes = np.clip(np.rint(embeddings / scales[:, np.newaxis]), -127, 127)
+    return codes.astype(np.int8), scales
+
+
+def build_gallery(
+    student_ids: Sequence[str],
+    embeddings: np.ndarray,
+    storage: str = "float",
+    rerank_top_k: int = 10,
+    float_store_path: Optional[str] = None,
+    model_id: Optional[str] = None,
+    template_top_k: int = 10,
+):
+    """
+    Build a gallery from one embedding per row. A student ID that appears on
+    several rows has several templates, and gets a TemplateGallery.
+    """
+    if len(set(student_ids)) < len(student_ids):
+        return TemplateGallery(
+            student_ids,
+            embeddings,
+            template_top_k=template_top_k,
+            storage=storage,
+            rerank_top_k=rerank_top_k,
+            float_store_path=float_store_path,
+            model_id=model_id,
+        )
+    if storage == "float":
+        return FloatGallery(student_ids, embeddings, model_id=model_id)
+    if storage == "int8":
+        return Int8Gallery(
+            student_ids,
+            embeddings,
+            rerank_top_k=rerank_top_k,
+            float_store_path=float_store_path,
+            model_id=model_id,
+        )
+    raise ValueError(f"Unknown embedding storage: {storage}")
+
+
+def _top_indices(scores: np.ndarray, top_k: Optional[int]) -> np.ndarray:
+    if top_k is None or top_k >= len(scores):
+        return np.argsort(-scores, kind="stable")
+    candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
@@ -0,0 +1,13 @@
+"""
+Gunicorn settings for the Flask app (gunicorn -c gunicorn.conf.py app:app).
+
+The local frame socket is opened once a worker is up rather than when app.py
+is imported, so importing the module has no such side effect. With several
+workers, the first to start serves the socket and the others skip it.
+"""
+
+
+def post_worker_init(worker):
+    import app
+
+    app.start_frame_server()
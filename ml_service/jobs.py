@@ -0,0 +1,360 @@
+"""
+Durable job queue for asynchronous predictions.
+
+Jobs are rows in a local SQLite file, so frames accepted by
+POST /api/predict/jobs survive a restart of the ML service. A pool of worker
+threads claims jobs with a lease: a job whose worker died (process restart,
+crash) becomes claimable again once its lease expires, and is given up after
+max_attempts. Results are kept for polling and can also be POSTed to a
+callback URL supplied with the job.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional, Tuple
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    payload TEXT,
+    callback_url TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_expires_at REAL,
+    result TEXT,
+    status_code INTEGER,
+    error TEXT,
+    created_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+"""
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobQueue:
+    """
+    SQLite-backed FIFO of prediction jobs. Safe to share between threads and
+    between processes using the same file (e.g. several gunicorn workers).
+    """
+
+    def __init__(
+        self,
+        path="jobs.db",
+        lease_seconds=300.0,
+        max_attempts=3,
+        max_depth=1000,
+        retention_seconds=3600.0,
+    ):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.max_depth = max_depth
+        self.retention_seconds = retention_seconds
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, payload: Dict[str, Any], callback_url: str = None) -> str:
+        job_id = uuid.uuid4().hex
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            (depth,) = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)
+            ).fetchone()
+            if depth >= self.max_depth:
+                raise QueueFull(f"{depth} jobs pending")
+            conn.execute(
+                "INSERT INTO jobs (id, status, payload, callback_url, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (job_id, QUEUED, json.dumps(payload), callback_url, time.time()),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return job_id
+
+    def claim(self) -> Optional[Tuple[str, Dict[str, Any], Optional[str], int]]:
+        """
+        Take the oldest queued job, or a running job whose lease has expired.
+        Returns (job_id, payload, callback_url, attempt), or None if there is
+        no work. attempt identifies this lease: pass it back to complete() and
+        retry_or_fail() so a worker whose lease expired, and whose job was
+        claimed again, cannot overwrite the new worker's result.
+        """
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Jobs whose workers died too often are given up.
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, payload = NULL, "
+                "finished_at = ? WHERE status = ? AND lease_expires_at < ? "
+                "AND attempts >= ?",
+                (
+                    FAILED,
+                    "Worker lease expired too many times",
+                    now,
+                    RUNNING,
+                    now,
+                    self.max_attempts,
+                ),
+            )
+            row = conn.execute(
+                "SELECT id, payload, callback_url, attempts FROM jobs "
+                "WHERE status = ? OR (status = ? AND lease_expires_at < ?) "
+                "ORDER BY created_at LIMIT 1",
+                (QUEUED, RUNNING, now),
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, "
+                    "lease_expires_at = ? WHERE id = ?",
+                    (RUNNING, now + self.lease_seconds, row["id"]),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        attempt = row["attempts"] + 1
+        return row["id"], json.loads(row["payload"]), row["callback_url"], attempt
+
+    def complete(
+        self, job_id: str, result: Dict[str, Any], status_code: int, attempt: int
+    ) -> bool:
+        """
+        Store the result of a job still held under the given lease. Returns
+        False, and leaves the job alone, if the lease was lost.
+        """
+        # The frame is dropped once processed; only the result is kept.
+        cursor = self._connect().execute(
+            "UPDATE jobs SET status = ?, result = ?, status_code = ?, "
+            "payload = NULL, finished_at = ? "
+            "WHERE id = ? AND status = ? AND attempts = ?",
+            (
+                DONE,
+                json.dumps(result),
+                status_code,
+                time.time(),
+                job_id,
+                RUNNING,
+                attempt,
+            ),
+        )
+        if cursor.rowcount == 0:
+            logging.warning(
+                f"Prediction job {job_id} lost its lease (attempt {attempt}); "
+                "result discarded"
+            )
+            return False
+        return True
+
+    def retry_or_fail(self, job_id: str, error: str, attempt: int) -> Optional[str]:
+        """
+        Put a job whose handler failed back in the queue, or mark it failed
+        once it has used max_attempts. Returns the job's new status, or None
+        if the lease was lost and the job was left alone.
+        """
+        # One statement, so a concurrent re-claim sees either outcome whole.
+        cursor = self._connect().execute(
+            "UPDATE jobs SET status = CASE WHEN attempts < ? THEN ? ELSE ? END, "
+            "error = ?, lease_expires_at = NULL, "
+            "payload = CASE WHEN attempts < ? THEN payload END, "
+            "finished_at = CASE WHEN attempts < ? THEN NULL ELSE ? END "
+            "WHERE id = ? AND status = ? AND attempts = ?",
+            (
+                self.max_attempts,
+                QUEUED,
+                FAILED,
+                error,
+                self.max_attempts,
+                self.max_attempts,
+                time.time(),
+                job_id,
+                RUNNING,
+                attempt,
+            ),
+        )
+        if cursor.rowcount == 0:
+            logging.warning(
+                f"Prediction job {job_id} lost its lease (attempt {attempt}); "
+                "failure not recorded"
+            )
+            return None
+        return self.get(job_id)["status"]
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = (
+            self._connect()
+            .execute(
+                "SELECT id, status, attempts, result, status_code, error, "
+                "created_at, finished_at FROM jobs WHERE id = ?",
+                (job_id,),
+            )
+            .fetchone()
+        )
+        if row is None:
+            return None
+        job = {
+            "jobId": row["id"],
+            "status": row["status"],
+            "attempts": row["attempts"],
+            "createdAt": row["created_at"],
+        }
+        if row["finished_at"] is not None:
+            job["finishedAt"] = row["finished_at"]
+        if row["result"] is not None:
+            job["result"] = json.loads(row["result"])
+            job["statusCode"] = row["status_code"]
+        if row["error"] is not None:
+            job["error"] = row["error"]
+        return job
+
+    def depth(self) -> int:
+        (depth,) = (
+            self._connect()
+            .execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)
+            )
+            .fetchone()
+        )
+        return depth
+
+    def purge(self) -> int:
+        """Delete finished jobs older than retention_seconds."""
+        cursor = self._connect().execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+            (DONE, FAILED, time.time() - self.retention_seconds),
+        )
+        return cursor.rowcount
+
+
+class JobWorkerPool:
+    """
+    Worker threads that drain a JobQueue through handler(payload), which
+    returns (response body, HTTP status) like the /api/predict handler.
+    5xx results and exceptions are retried up to the queue's max_attempts.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        handler: Callable[[Dict[str, Any]], Tuple[Dict[str, Any], int]],
+        workers=2,
+        poll_interval=0.5,
+        callback_timeout=5.0,
+    ):
+        self.queue = queue
+        self.handler = handler
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.callback_timeout = callback_timeout
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+
+    def start(self) -> None:
+        for index in range(self.workers):
+            thread = threading.Thread(
+                target=self._run, name=f"job-worker-{index}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        logging.info(f"Started {self.workers} prediction job workers")
+
+    def stop(self, timeout=5.0) -> None:
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def notify(self) -> None:
+        """Wake idle workers after a job has been enqueued."""
+        self._wakeup.set()
+
+    def _run(self) -> None:
+        last_purge = 0.0
+        while not self._stopping.is_set():
+            try:
+                if time.time() - last_purge > 60:
+                    self.queue.purge()
+                    last_purge = time.time()
+                claimed = self.queue.claim()
+                if claimed is not None:
+                    self.process(*claimed)
+                    continue
+            except Exception as e:
+                # E.g. "database is locked" while completing a job. The job's
+                # lease expires and it is claimed again; the worker carries on.
+                logging.error(f"Job worker error: {e}")
+
+            # Other processes may enqueue too, so wake up periodically.
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def process(
+        self,
+        job_id: str,
+        payload: Dict[str, Any],
+        callback_url: Optional[str],
+        attempt: int,
+    ):
+        try:
+            body, status_code = self.handler(payload)
+        except Exception as e:
+            body, status_code = {"error": str(e)}, 500
+
+        if status_code >= 500:
+            status = self.queue.retry_or_fail(
+                job_id, body.get("error", "error"), attempt
+            )
+            logging.warning(f"Prediction job {job_id} failed ({status}): {body}")
+            if status != FAILED:
+                return
+        elif not self.queue.complete(job_id, body, status_code, attempt):
+            return
+
+        if callback_url:
+            self.send_callback(callback_url, self.queue.get(job_id))
+
+    def send_callback(self, callback_url: str, job: Dict[str, Any]) -> None:
+        import requests
+
+        try:
+            response = requests.post(
+                callback_url, json=job, timeout=self.callback_timeout
+            )
+            if response.status_code >= 400:
+                logging.error(
+                    f"Callback for job {job['jobId']} returned "
+                    f"{response.status_code}: {response.text}"
+                )
+        except requests.RequestException as e:
+            # The result is still available by polling.
+            logging.error(f"Callback for job {job['jobId']} failed: {e}")
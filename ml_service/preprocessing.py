@@ -0,0 +1,248 @@
+"""
+Resolution-aware preprocessing in front of face detection.
+
+Detector cost grows with the number of pixels it scans, so large camera frames
+are downsized before detection and the detected boxes are mapped back to the
+original frame. The face itself is cropped from the full-resolution frame, so
+the embedding model still sees every pixel of the face.
+
+For very large JPEGs the decode itself can be reduced: libjpeg can decode at
+1/2, 1/4 or 1/8 scale (cv2.IMREAD_REDUCED_COLOR_*) much faster than a full
+decode followed by a resize.
+
+Fixed classroom cameras see the same face in the same place frame after
+frame. With a RoiCache, the face box found for a source (camera or seat) is
+remembered, and the next frames from that source only run the backend on an
+expanded region around it. Full-frame detection runs again on a miss, every
+refresh_frames frames and after ttl_seconds.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+import tracing
+from face_recognition import Box
+
+# Largest reduction first, so the cheapest decode that is still big enough wins.
+REDUCED_DECODE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+# JPEG start-of-frame markers, which carry the image dimensions.
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7}
+_SOF_MARKERS |= {0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def jpeg_size(img_bytes: bytes) -> Optional[Tuple[int, int]]:
+    """
+    Read (width, height) from a JPEG header without decoding the image.
+    Returns None for anything that is not a well-formed JPEG.
+    """
+    if img_bytes[:2] != b"\xff\xd8":
+        return None
+    offset = 2
+    while offset + 9 < len(img_bytes):
+        if img_bytes[offset] != 0xFF:
+            return None
+        marker = img_bytes[offset + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker.
+            offset += 1
+            continue
+        length = int.from_bytes(img_bytes[offset + 2 : offset + 4], "big")
+        if marker in _SOF_MARKERS:
+            height = int.from_bytes(img_bytes[offset + 5 : offset + 7], "big")
+            width = int.from_bytes(img_bytes[offset + 7 : offset + 9], "big")
+            return width, height
+        offset += 2 + length
+    return None
+
+
+def reduced_imread_flag(img_bytes: bytes, min_side: int) -> int:
+    """
+    Pick the smallest IMREAD_REDUCED_COLOR_* decode whose longest side is still
+    at least min_side. Non-JPEG input and small images decode at full size.
+    """
+    size = jpeg_size(img_bytes) if min_side else None
+    if size is None:
+        return cv2.IMREAD_COLOR
+    longest = max(size)
+    for factor, flag in REDUCED_DECODE_FLAGS:
+        if longest // factor >= min_side:
+            return flag
+    return cv2.IMREAD_COLOR
+
+
+class RoiCache:
+    """
+    Last full-frame face box per source, for at most max_sources sources
+    (least recently used are forgotten).
+    """
+
+    def __init__(self, refresh_frames=10, ttl_seconds=30.0, max_sources=1024):
+        self.refresh_frames = refresh_frames
+        self.ttl_seconds = ttl_seconds
+        self.max_sources = max_sources
+        self.hits = 0
+        self.misses = 0
+        self._boxes = OrderedDict()  # source -> [box, frames since detection, time]
+        self._lock = threading.Lock()
+
+    def get(self, source: Hashable) -> Optional[Box]:
+        """The cached box, or None when a full-frame detection is due."""
+        with self._lock:
+            entry = self._boxes.get(source)
+            if entry is None:
+                return None
+            box, frames, detected_at = entry
+            if frames >= self.refresh_frames or (
+                time.time() - detected_at > self.ttl_seconds
+            ):
+                return None
+            self._boxes.move_to_end(source)
+            return box
+
+    def put(self, source: Hashable, box: Box) -> None:
+        with self._lock:
+            self._boxes[source] = [box, 0, time.time()]
+            self._boxes.move_to_end(source)
+            while len(self._boxes) > self.max_sources:
+                self._boxes.popitem(last=False)
+
+    def hit(self, source: Hashable) -> None:
+        with self._lock:
+            self.hits += 1
+            if source in self._boxes:
+                self._boxes[source][1] += 1
+
+    def miss(self, source: Hashable) -> None:
+        with self._lock:
+            self.misses += 1
+            self._boxes.pop(source, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sources": len(self._boxes),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+class Preprocessor:
+    """
+    Downsizes frames for detection and crops the detected face from the
+    original frame. Frames that already fit in detection_max_side are passed
+    to the backend unchanged, unless their box is being cached for ROI reuse.
+    """
+
+    def __init__(
+        self,
+        detection_max_side: int = 640,
+        crop_margin: float = 0.25,
+        roi_cache: Optional[RoiCache] = None,
+        roi_margin: float = 0.5,
+    ):
+        self.detection_max_side = detection_max_side
+        self.crop_margin = crop_margin
+        self.roi_cache = roi_cache
+        self.roi_margin = roi_margin
+
+    def detection_scale(self, shape) -> float:
+        longest = max(shape[:2])
+        if not self.detection_max_side or longest <= self.detection_max_side:
+            return 1.0
+        return self.detection_max_side / longest
+
+    def detect(self, backend, img_rgb: np.ndarray) -> List[Box]:
+        """
+        Detect faces on a downsized copy; boxes are in img_rgb coordinates.
+        """
+        scale = self.detection_scale(img_rgb.shape)
+        if scale == 1.0:
+            return backend.detect_faces(img_rgb)
+
+        height, width = img_rgb.shape[:2]
+        small = cv2.resize(
+            img_rgb,
+            (max(1, round(width * scale)), max(1, round(height * scale))),
+            interpolation=cv2.INTER_AREA,
+        )
+        boxes = []
+        for x, y, w, h in backend.detect_faces(small):
+            x0, y0 = max(0, round(x / scale)), max(0, round(y / scale))
+            x1 = min(width, round((x + w) / scale))
+            y1 = min(height, round((y + h) / scale))
+            if x1 > x0 and y1 > y0:
+                boxes.append((x0, y0, x1 - x0, y1 - y0))
+        return boxes
+
+    def crop(self, img_rgb: np.ndarray, box: Box, margin: float = None) -> np.ndarray:
+        margin = self.crop_margin if margin is None else margin
+        height, width = img_rgb.shape[:2]
+        x, y, w, h = box
+        pad_x, pad_y = round(w * margin), round(h * margin)
+        x0, y0 = max(0, x - pad_x), max(0, y - pad_y)
+        x1, y1 = min(width, x + w + pad_x), min(height, y + h + pad_y)
+        return np.ascontiguousarray(img_rgb[y0:y1, x0:x1])
+
+    def extract_embedding(
+        self, backend, img_rgb: np.ndarray, source: Optional[Hashable] = None
+    ) -> np.ndarray:
+        """
+        Embedding of the largest face in img_rgb. With a source and a RoiCache,
+        the backend first runs on the region around that source's last face.
+        """
+        if source is None or self.roi_cache is None:
+            if self.detection_scale(img_rgb.shape) == 1.0:
+                with tracing.span("detect_embed"):
+                    return backend.extract_embedding(img_rgb)
+            return self.embed_largest_face(backend, img_rgb)
+
+        box = self.roi_cache.get(source)
+        if box is not None:
+            try:
+                # The backend's own detection on the small region replaces
+                # the full-frame detect step.
+                with tracing.span("detect_embed", roi=True):
+                    embedding = backend.extract_embedding(
+                        self.crop(img_rgb, box, margin=self.roi_margin)
+                    )
+                self.roi_cache.hit(source)
+                return embedding
+            except ValueError:
+                logging.debug(f"No face in cached ROI for {source}, detecting again")
+                self.roi_cache.miss(source)
+        return self.embed_largest_face(backend, img_rgb, source)
+
+    def embed_largest_face(
+        self, backend, img_rgb: np.ndarray, source: Optional[Hashable] = None
+    ) -> np.ndarray:
+        with tracing.span("detect", scale=self.detection_scale(img_rgb.shape)) as span:
+            boxes = self.detect(backend, img_rgb)
+            span.set("faces", len(boxes))
+        if not boxes:
+            if getattr(backend, "enforce_detection", True):
+                raise ValueError("Face could not be detected in the image")
+            with tracing.span("embed"):
+                return backend.extract_embedding(img_rgb)
+
+        box = max(boxes, key=lambda b: b[2] * b[3])
+        with tracing.span("embed"):
+            # Detecting again on the padded crop is cheap and lets the backend
+            # align the face the same way it does for reference images. If it
+            # finds no face there, the downscaled detection was a false
+            # positive: an unaligned crop would not be comparable with the
+            # gallery, so that is reported as no face too.
+            embedding = backend.extract_embedding(self.crop(img_rgb, box))
+        if source is not None and self.roi_cache is not None:
+            self.roi_cache.put(source, box)
+        return embedding
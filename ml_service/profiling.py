@@ -0,0 +1,365 @@
+"""
+On-demand profiling for a running ML service.
+
+Two kinds of CPU profile can be started through the admin endpoints:
+
+  cprofile  deterministic profile (cProfile) of the next N /api/predict
+            calls, or of every call in the next T seconds; output is pstats
+            text
+  sample    statistical profile of every thread, sampled from
+            sys._current_frames() every few milliseconds for T seconds;
+            output is collapsed stacks ("a;b;c 42") for flame graph tools
+
+Nothing is hooked while no session is running: handle_predict only checks
+whether a session is active. tracemalloc is likewise only started on request,
+unless TRACEMALLOC_FRAMES is set, which starts it when the service is imported
+so the gallery and model weights are attributed too.
+"""
+
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Dict, Optional
+
+# Leaf frames of threads that are parked, not working. Dropped from samples.
+IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    ("socket.py", "accept"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("base_events.py", "_run_once"),
+    ("sync.py", "wait"),
+}
+
+SERVICE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Where tracemalloc attributes an allocation, by the innermost matching frame:
+# (category, modules of this service, third-party packages).
+MEMORY_CATEGORIES = (
+    ("gallery", {"gallery.py", "sharding.py", "collection_store.py"}, ()),
+    (
+        "model",
+        {"face_recognition.py"},
+        ("deepface", "tensorflow", "keras", "onnxruntime", "h5py"),
+    ),
+    (
+        "request",
+        {"utils.py", "preprocessing.py", "app.py", "asgi.py", "jobs.py"},
+        ("werkzeug", "flask", "starlette"),
+    ),
+)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def active_session():
+    """The running cProfile session, or None. Cheap enough for every request."""
+    return _session if _session is not None and _session.accepting() else None
+
+
+def check_admin_token(token: Optional[str]) -> Optional[tuple]:
+    """
+    Returns an error (body, status) unless ADMIN_TOKEN is set and matches.
+    Without ADMIN_TOKEN the admin endpoints do not exist.
+    """
+    expected = os.environ.get("ADMIN_TOKEN")
+    if not expected:
+        return {"error": "Not found"}, 404
+    if not token or not hmac.compare_digest(token, expected):
+        return {"error": "Invalid admin token"}, 403
+    return None
+
+
+class CProfileSession:
+    """
+    cProfile over the next max_requests predict calls, or until seconds have
+    passed, whichever comes first.
+    """
+
+    mode = "cprofile"
+
+    def __init__(self, max_requests=20, seconds=60.0, sort="cumulative", limit=60):
+        self.max_requests = max_requests
+        self.deadline = time.time() + seconds
+        self.sort = sort
+        self.limit = limit
+        self.started_at = time.time()
+        self.started = 0
+        self.finished = 0
+        self._stats = None
+        self._lock = threading.Lock()
+
+    def accepting(self) -> bool:
+        return self.started < self.max_requests and time.time() < self.deadline
+
+    def run(self, fn, *args):
+        with self._lock:
+            if not self.accepting():
+                return fn(*args)
+            self.started += 1
+        # cProfile only sees the thread it is enabled in, so each request gets
+        # its own profiler and the results are merged.
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+ allows one active profiler per process; concurrent
+            # requests run unprofiled.
+            with self._lock:
+                self.started -= 1
+            return fn(*args)
+        try:
+            return fn(*args)
+        finally:
+            profile.disable()
+            with self._lock:
+                if self._stats is None:
+                    self._stats = pstats.Stats(profile)
+                else:
+                    self._stats.add(profile)
+                self.finished += 1
+
+    def done(self) -> bool:
+        return not self.accepting() and self.finished == self.started
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "done": self.done(),
+            "requests": self.finished,
+            "maxRequests": self.max_requests,
+            "secondsLeft": max(0.0, round(self.deadline - time.time(), 1)),
+        }
+
+    def output(self) -> str:
+        with self._lock:
+            if self._stats is None:
+                return "No requests were profiled\n"
+            stream = io.StringIO()
+            self._stats.stream = stream
+            self._stats.sort_stats(self.sort).print_stats(self.limit)
+            return stream.getvalue()
+
+
+class SamplingSession:
+    """Samples every thread's Python stack for a fixed number of seconds."""
+
+    mode = "sample"
+
+    def __init__(self, seconds=10.0, interval=0.005, include_idle=False):
+        self.seconds = seconds
+        self.interval = interval
+        self.include_idle = include_idle
+        self.deadline = time.time() + seconds
+        self.samples = 0
+        self.stacks = Counter()
+        self._thread = threading.Thread(
+            target=self._run, name="profiling-sampler", daemon=True
+        )
+        self._thread.start()
+
+    def accepting(self) -> bool:
+        # Never hooks requests; the sampler thread does all the work.
+        return False
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while time.time() < self.deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                code = frame.f_code
+                leaf = (os.path.basename(code.co_filename), code.co_name)
+                if not self.include_idle and leaf in IDLE_LEAVES:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f"{code.co_name} ({os.path.basename(code.co_filename)}:"
+                        f"{code.co_firstlineno})"
+                    )
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+            time.sleep(self.interval)
+
+    def done(self) -> bool:
+        return not self._thread.is_alive()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "done": self.done(),
+            "samples": self.samples,
+            "secondsLeft": max(0.0, round(self.deadline - time.time(), 1)),
+        }
+
+    def output(self) -> str:
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self.stacks.most_common()
+        )
+
+
+def number_param(params: Dict[str, Any], name: str, default, cast=int, minimum=0):
+    """
+    params[name] (a JSON value or query string) as cast, or default. Raises
+    ValueError, with a message for the client, if it is not a number of at
+    least minimum.
+    """
+    value = params.get(name, default)
+    try:
+        number = cast(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a number, got {value!r}")
+    if number != value and isinstance(value, float):
+        raise ValueError(f"{name} must be a whole number, got {value!r}")
+    if number < minimum:
+        raise ValueError(f"{name} must be at least {minimum}")
+    return number
+
+
+def flag_param(params: Dict[str, Any], name: str) -> bool:
+    value = params.get(name, False)
+    if isinstance(value, str):
+        return value.lower() in ("1", "true", "yes")
+    return bool(value)
+
+
+def start_session(params: Dict[str, Any]):
+    """
+    Start a profiling session unless one is still running. Returns (body, status).
+    """
+    mode = params.get("mode", "cprofile")
+    try:
+        return _start_session(mode, params)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+
+def _start_session(mode, params):
+    global _session
+    seconds = number_param(
+        params, "seconds", 60 if mode == "cprofile" else 10, cast=float
+    )
+    with _session_lock:
+        if _session is not None and not _session.done():
+            return {"error": "A profiling session is already running"}, 409
+        if mode == "cprofile":
+            sort = params.get("sort", "cumulative")
+            if sort not in {key.value for key in pstats.SortKey}:
+                return {"error": f"Unknown pstats sort key: {sort}"}, 400
+            _session = CProfileSession(
+                max_requests=number_param(params, "requests", 20, minimum=1),
+                seconds=seconds,
+                sort=sort,
+                limit=number_param(params, "limit", 60, minimum=1),
+            )
+        elif mode == "sample":
+            _session = SamplingSession(
+                seconds=seconds,
+                interval=number_param(params, "intervalMs", 5, cast=float, minimum=0.1)
+                / 1000,
+                include_idle=flag_param(params, "includeIdle"),
+            )
+        else:
+            return {"error": f"Unknown profiling mode: {mode}"}, 400
+    return _session.status(), 202
+
+
+def session_result():
+    """
+    Returns (pstats/collapsed text, 200) once the session is done, or its
+    status with 202 while it is still running.
+    """
+    session = _session
+    if session is None:
+        return {"error": "No profiling session has been started"}, 404
+    if not session.done():
+        return session.status(), 202
+    return session.output(), 200
+
+
+def start_memory_tracing_from_env():
+    """
+    Start tracemalloc with TRACEMALLOC_FRAMES deep tracebacks, if set. Called
+    before the recognizer is built, so startup allocations are traced.
+    """
+    frames = int(os.environ.get("TRACEMALLOC_FRAMES", "0"))
+    if frames > 0:
+        start_memory_tracing(frames)
+
+
+def start_memory_tracing(frames=10):
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    return {"tracing": True, "frames": tracemalloc.get_traceback_limit()}
+
+
+def stop_memory_tracing():
+    tracemalloc.stop()
+    return {"tracing": False}
+
+
+def categorize(traceback) -> str:
+    # Innermost frame first: numpy or cv2 internals are skipped until a frame
+    # of ours (or of the model libraries) explains the allocation.
+    for frame in reversed(traceback):
+        directory, module = os.path.split(frame.filename)
+        for category, modules, packages in MEMORY_CATEGORIES:
+            if directory == SERVICE_DIR and module in modules:
+                return category
+            if any(
+                f"{os.sep}{package}{os.sep}" in frame.filename for package in packages
+            ):
+                return category
+    return "other"
+
+
+def memory_report(limit=20, face_recognizer=None) -> Dict[str, Any]:
+    report = {"tracing": tracemalloc.is_tracing()}
+    if face_recognizer is not None and face_recognizer.gallery is not None:
+        gallery = face_recognizer.gallery
+        report["gallery"] = {
+            "type": type(gallery).__name__,
+            "size": len(gallery),
+            "nbytes": getattr(gallery, "nbytes", None),
+            "model_id": face_recognizer.model_id,
+        }
+    if not report["tracing"]:
+        return report
+
+    snapshot = tracemalloc.take_snapshot().filter_traces(
+        [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ]
+    )
+    current, peak = tracemalloc.get_traced_memory()
+    categories = Counter()
+    for stat in snapshot.statistics("traceback"):
+        categories[categorize(stat.traceback)] += stat.size
+
+    report["traced_bytes"] = current
+    report["peak_bytes"] = peak
+    report["categories"] = dict(categories)
+    report["top"] = [
+        {
+            "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+            "bytes": stat.size,
+            "count": stat.count,
+        }
+        for stat in snapshot.statistics("lineno")[:limit]
+    ]
+    return report
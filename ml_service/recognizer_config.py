@@ -0,0 +1,101 @@
+"""
+The ML service's recognizer configuration, read from the environment, and
+build_face_recognizer() to build a FaceRecognizer from it.
+
+Importing this module has no side effects: it starts no threads, opens no
+sockets and builds no Flask app. app.py serves the recognizer it builds. The
+camera's embedded mode imports this module to run the same recognizer
+in-process.
+"""
+
+import os
+
+from face_recognition import FaceRecognizer, create_backend
+from preprocessing import Preprocessor, RoiCache
+
+reference_dir = os.environ.get("REFERENCE_FACES_DIR", "reference_faces")
+similarity_threshold = float(os.environ.get("SIMILARITY_THRESHOLD", "0.6"))
+
+database_url = os.environ.get("DATABASE_URL", "http://database:5002")
+embedding_storage = os.environ.get("EMBEDDING_STORAGE", "float")
+rerank_top_k = int(os.environ.get("RERANK_TOP_K", "10"))
+# Students with several reference photos: how many of the best centroid matches
+# are re-scored against their individual photos.
+template_top_k = int(os.environ.get("TEMPLATE_TOP_K", "10"))
+
+# Sharded mode: a shard process sets SHARD_INDEX/SHARD_COUNT and loads only its
+# partition; the coordinator sets SHARD_URLS and fans queries out to the shards.
+shard_index = os.environ.get("SHARD_INDEX")
+shard_index = int(shard_index) if shard_index is not None else None
+shard_count = int(os.environ.get("SHARD_COUNT", "1"))
+shard_urls = [url for url in os.environ.get("SHARD_URLS", "").split(",") if url]
+shard_top_k = int(os.environ.get("SHARD_TOP_K", "10"))
+
+# Per-class galleries: COLLECTIONS_FILE maps each CollectionId to its roster of
+# student IDs. Galleries load on first use and are evicted when idle.
+collections_file = os.environ.get("COLLECTIONS_FILE")
+default_collection = os.environ.get("DEFAULT_COLLECTION", "student-gallery")
+max_loaded_collections = int(os.environ.get("MAX_LOADED_COLLECTIONS", "8"))
+collection_idle_seconds = float(os.environ.get("COLLECTION_IDLE_SECONDS", "600"))
+embedding_cache_dir = os.environ.get("EMBEDDING_CACHE_DIR")
+
+embedding_backend = os.environ.get("EMBEDDING_BACKEND", "deepface")
+backend_options = {
+    "model_name": os.environ.get("EMBEDDING_MODEL", "ArcFace"),
+    "detector_backend": os.environ.get("DETECTOR_BACKEND", "opencv"),
+    "align": os.environ.get("FACE_ALIGN", "true").lower() == "true",
+    "enforce_detection": os.environ.get("ENFORCE_DETECTION", "true").lower() == "true",
+    "detector_model_path": os.environ.get("YUNET_MODEL_PATH"),
+    "sface_model_path": os.environ.get("SFACE_MODEL_PATH"),
+    "onnx_model_path": os.environ.get("ONNX_MODEL_PATH"),
+    "detection_score_threshold": os.environ.get("DETECTION_SCORE_THRESHOLD", "0.7"),
+}
+
+# Frames are downsized to DETECTION_MAX_SIDE for detection (0 disables).
+detection_max_side = int(os.environ.get("DETECTION_MAX_SIDE", "640"))
+crop_margin = float(os.environ.get("CROP_MARGIN", "0.25"))
+
+# Requests with a SourceId (camera or seat) first look for the face around
+# where that source's last face was, with full-frame detection on a miss and
+# every ROI_REFRESH_FRAMES frames or ROI_TTL_SECONDS.
+roi_reuse = os.environ.get("ROI_REUSE", "true").lower() == "true"
+roi_margin = float(os.environ.get("ROI_MARGIN", "0.5"))
+roi_refresh_frames = int(os.environ.get("ROI_REFRESH_FRAMES", "10"))
+roi_ttl_seconds = float(os.environ.get("ROI_TTL_SECONDS", "30"))
+
+
+def build_face_recognizer(**overrides):
+    """
+    Build a FaceRecognizer from this configuration. Keyword arguments
+    override FaceRecognizer options (e.g. student_lookup, shard settings).
+    """
+    preprocessor = None
+    if detection_max_side > 0 or roi_reuse:
+        roi_cache = None
+        if roi_reuse:
+            roi_cache = RoiCache(roi_refresh_frames, roi_ttl_seconds)
+        preprocessor = Preprocessor(
+            detection_max_side, crop_margin, roi_cache=roi_cache, roi_margin=roi_margin
+        )
+    options = {
+        "reference_dir": reference_dir,
+        "similarity_threshold": similarity_threshold,
+        "database_url": database_url,
+        "embedding_storage": embedding_storage,
+        "rerank_top_k": rerank_top_k,
+        "template_top_k": template_top_k,
+        "shard_index": shard_index,
+        "shard_count": shard_count,
+        "shard_urls": shard_urls,
+        "shard_top_k": shard_top_k,
+        "preprocessor": preprocessor,
+        "collections_file": collections_file,
+        "default_collection": default_collection,
+        "max_loaded_collections": max_loaded_collections,
+        "collection_idle_seconds": collection_idle_seconds,
+        "embedding_cache_dir": embedding_cache_dir,
+    }
+    options.update(overrides)
+    if "backend" not in options:
+        options["backend"] = create_backend(embedding_backend, **backend_options)
+    return FaceRecognizer(**options)
@@ -0,0 +1,107 @@
+"""
+Run the reference gallery as N local ml_service shard processes and keep them up.
+
+Each shard is a gunicorn process started with SHARD_INDEX/SHARD_COUNT, so it only
+embeds and holds the students that hash to it. A shard that exits is restarted
+with exponential backoff; the coordinator retries and tolerates it meanwhile.
+
+Usage (from ml_service/):
+    python shard_supervisor.py --shards 4 --base-port 8100
+    SHARD_URLS=http://127.0.0.1:8100,...,http://127.0.0.1:8103 \\
+        gunicorn -b 0.0.0.0:8000 app:app
+"""
+
+import argparse
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger("shard_supervisor")
+
+
+def start_shard(index, count, port, workers):
+    env = dict(os.environ, SHARD_INDEX=str(index), SHARD_COUNT=str(count))
+    # Settings that only make sense for the coordinator: a shard serves its
+    # partition of the full gallery, not per-class collections, and must not
+    # try to take over the coordinator's local frame socket.
+    for name in ("SHARD_URLS", "COLLECTIONS_FILE", "FRAME_SOCKET_PATH"):
+        env.pop(name, None)
+    command = [
+        sys.executable,
+        "-m",
+        "gunicorn",
+        "-w",
+        str(workers),
+        "-b",
+        f"127.0.0.1:{port}",
+        "app:app",
+    ]
+    logger.info(f"Starting shard {index}/{count} on port {port}")
+    return subprocess.Popen(command, env=env)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run local gallery shards")
+    parser.add_argument("--shards", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--base-port", type=int, default=8100)
+    parser.add_argument(
+        "--workers", type=int, default=1, help="gunicorn workers per shard"
+    )
+    parser.add_argument("--max-backoff", type=float, default=30.0)
+    args = parser.parse_args()
+
+    ports = [args.base_port + i for i in range(args.shards)]
+    urls = ",".join(f"http://127.0.0.1:{port}" for port in ports)
+    logger.info(f"Coordinator should use SHARD_URLS={urls}")
+
+    processes = [
+        start_shard(i, args.shards, port, args.workers) for i, port in enumerate(ports)
+    ]
+    backoff = [1.0] * args.shards
+    restart_at = [None] * args.shards
+    started_at = [time.monotonic()] * args.shards
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while not stopping:
+        now = time.monotonic()
+        for i, process in enumerate(processes):
+            if restart_at[i] is not None:
+                if now >= restart_at[i]:
+                    processes[i] = start_shard(i, args.shards, ports[i], args.workers)
+                    restart_at[i] = None
+                    started_at[i] = now
+                continue
+            code = process.poll()
+            if code is None:
+                if now - started_at[i] > 60:
+                    backoff[i] = 1.0
+            else:
+                logger.error(
+                    f"Shard {i} exited with code {code}, restarting in {backoff[i]:.0f}s"
+                )
+                restart_at[i] = now + backoff[i]
+                backoff[i] = min(backoff[i] * 2, args.max_backoff)
+        time.sleep(0.5)
+
+    for process in processes:
+        if process.poll() is None:
+            process.terminate()
+    for process in processes:
+        process.wait()
+
+
+if __name__ == "__main__":
+    main()
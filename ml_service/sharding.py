@@ -0,0 +1,218 @@
+"""
+Sharded gallery mode: the coordinator's client for gallery shard processes.
+
+A shard that fails a query (connection refused after a few quick retries,
+a timeout, a 5xx, or a model mismatch) is marked failed and skipped by later
+queries, so they are not slowed down by its retries or timeouts. A
+background health probe, at most every probe_interval seconds, brings it
+back once it answers and uses the same embedding model as the coordinator.
+Matches from a query that skipped shards say which ones, so callers can
+tell a partial answer from a complete one.
+"""
+
+import heapq
+import logging
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import requests
+
+import tracing
+
+
+def shard_for(student_id: str, shard_count: int) -> int:
+    """
+    Stable shard assignment for a student, identical across processes and restarts.
+    """
+    return zlib.crc32(student_id.encode("utf-8")) % shard_count
+
+
+class ShardModelMismatch(Exception):
+    """A shard's gallery was built with a different embedding model."""
+
+
+class ShardMatches(list):
+    """
+    Merged (studentId, score) matches, plus the shards that were not
+    searched, so a partial answer can be reported as such.
+    """
+
+    def __init__(self, matches, missing_shards: Sequence[str], shard_count: int):
+        super().__init__(matches)
+        self.missing_shards = list(missing_shards)
+        self.shard_count = shard_count
+
+
+class ShardedGallery:
+    """
+    Coordinator-side view of a gallery partitioned across ml_service shard processes.
+
+    Each query embedding is sent to every healthy shard's /api/shard/search
+    endpoint in parallel and the per-shard top-k lists are merged. A refused
+    connection (e.g. a shard being restarted) is retried with a short
+    backoff; after that, or after a timeout or error response, the shard is
+    skipped until a health probe succeeds.
+    """
+
+    def __init__(
+        self,
+        shard_urls: Sequence[str],
+        top_k: int = 10,
+        timeout: float = 5.0,
+        retries: int = 3,
+        backoff: float = 0.5,
+        model_id: Optional[str] = None,
+        probe_interval: float = 5.0,
+    ):
+        self.model_id = model_id
+        self.shard_urls = [url.rstrip("/") for url in shard_urls]
+        self.top_k = top_k
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.probe_interval = probe_interval
+        self.failed_shards = set()
+        self._next_probe: Dict[str, float] = {}
+        self._probing = set()
+        self._lock = threading.Lock()
+        # Room for a query to every shard plus a probe of each.
+        self.executor = ThreadPoolExecutor(max_workers=2 * len(self.shard_urls))
+
+    def __len__(self) -> int:
+        return sum(status.get("database_size", 0) for status in self.health())
+
+    def search(self, query: np.ndarray, top_k: Optional[int] = None) -> ShardMatches:
+        top_k = top_k or self.top_k
+        payload = {
+            "embedding": np.asarray(query, dtype=float).tolist(),
+            "topK": top_k,
+            "modelId": self.model_id,
+        }
+
+        with self._lock:
+            failed = set(self.failed_shards)
+        for url in failed:
+            self._schedule_probe(url)
+
+        # Pool threads do not see the caller's span, so pass it on explicitly.
+        headers = tracing.headers()
+        futures = {
+            url: self.executor.submit(self._search_shard, url, payload, headers)
+            for url in self.shard_urls
+            if url not in failed
+        }
+
+        per_shard = []
+        missing = sorted(failed)
+        for url, future in futures.items():
+            try:
+                per_shard.append(future.result())
+            except (requests.RequestException, ShardModelMismatch) as e:
+                logging.error(f"Shard {url} failed, skipping it until it recovers: {e}")
+                self._mark_failed(url)
+                missing.append(url)
+
+        if not per_shard:
+            raise RuntimeError("No gallery shards available")
+        if missing:
+            logging.warning(
+                f"Answered from {len(per_shard)} of {len(self.shard_urls)} shards, "
+                f"missing {', '.join(missing)}"
+            )
+
+        merged = heapq.merge(*per_shard, key=lambda match: -match[1])
+        return ShardMatches(
+            [match for _, match in zip(range(top_k), merged)],
+            missing,
+            len(self.shard_urls),
+        )
+
+    def _mark_failed(self, url: str) -> None:
+        with self._lock:
+            self.failed_shards.add(url)
+            self._next_probe.setdefault(url, time.monotonic() + self.probe_interval)
+
+    def _schedule_probe(self, url: str) -> None:
+        with self._lock:
+            due = time.monotonic() >= self._next_probe.get(url, 0.0)
+            if not due or url in self._probing:
+                return
+            self._probing.add(url)
+        self.executor.submit(self._probe, url)
+
+    def _probe(self, url: str) -> None:
+        """Bring a failed shard back if its health check passes."""
+        healthy, reason = False, "probe failed"
+        try:
+            healthy, reason = self._check_health(url)
+        finally:
+            with self._lock:
+                self._probing.discard(url)
+                if healthy:
+                    self.failed_shards.discard(url)
+                    self._next_probe.pop(url, None)
+                else:
+                    self._next_probe[url] = time.monotonic() + self.probe_interval
+        if healthy:
+            logging.info(f"Shard {url} is healthy again")
+        else:
+            logging.debug(f"Shard {url} still unavailable: {reason}")
+
+    def _check_health(self, url: str) -> Tuple[bool, str]:
+        try:
+            response = requests.get(f"{url}/api/health", timeout=self.timeout)
+            status = response.json()
+        except (requests.RequestException, ValueError) as e:
+            return False, str(e)
+        if response.status_code != 200:
+            return False, f"health returned {response.status_code}"
+        shard_model = status.get("model_id")
+        if self.model_id and shard_model and shard_model != self.model_id:
+            return False, f"model {shard_model}, coordinator uses {self.model_id}"
+        return True, "ok"
+
+    def _search_shard(
+        self, url: str, payload: Dict[str, Any], headers: Optional[Dict] = None
+    ) -> List[Tuple[str, float]]:
+        for attempt in range(self.retries + 1):
+            try:
+                response = requests.post(
+                    f"{url}/api/shard/search",
+                    json=payload,
+                    timeout=self.timeout,
+                    headers=headers,
+                )
+                if response.status_code == 409:
+                    # A configuration error; retrying cannot fix it.
+                    raise ShardModelMismatch(response.json().get("error"))
+                if response.status_code == 503 and attempt < self.retries:
+                    # Shard is up but still building its gallery.
+                    raise requests.ConnectionError("Shard not ready")
+                response.raise_for_status()
+                return [
+                    (student_id, float(score))
+                    for student_id, score in response.json()["matches"]
+                ]
+            except requests.ConnectionError:
+                # Refused connections fail fast, so they are worth a few
+                # quick retries; a timeout is not retried.
+                if attempt == self.retries:
+                    raise
+                time.sleep(self.backoff * (2**attempt))
+
+    def health(self) -> List[Dict[str, Any]]:
+        statuses = []
+        for url in self.shard_urls:
+            try:
+                response = requests.get(f"{url}/api/health", timeout=self.timeout)
+                status = response.json()
+                status["ok"] = response.status_code == 200
+            except (requests.RequestException, ValueError) as e:
+                status = {"ok": False, "error": str(e)}
+            status["url"] = url
+            statuses.append(status)
+        return statuses
@@ -0,0 +1,138 @@
+"""
+Local copy of the database service's students table, kept current from its
+change feed (GET /api/changes?since=N) instead of one HTTP request per match.
+
+A background thread asks for the changes after the last applied seq every
+poll_interval seconds. Until the first sync has succeeded, lookups fall back
+to the per-student endpoint. If the feed's epoch changes, the database was
+recreated and its seqs started over, so the copy is dropped and synced again
+from the beginning.
+"""
+
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, Optional
+
+import tracing
+
+
+class StudentDirectory:
+    def __init__(
+        self,
+        database_url: str,
+        poll_interval: float = 5.0,
+        page_size: int = 500,
+        timeout: float = 5.0,
+        on_change: Optional[Callable[[Iterable[str]], None]] = None,
+    ):
+        self.database_url = database_url
+        self.poll_interval = poll_interval
+        self.page_size = page_size
+        self.timeout = timeout
+        self.on_change = on_change
+        self.students: Dict[str, Dict[str, Any]] = {}
+        self.last_seq = 0
+        self.epoch = None
+        self.ready = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def apply(self, changes) -> None:
+        changed = set()
+        with self._lock:
+            for change in changes:
+                student_id = change["studentId"]
+                if change["op"] == "delete" or change.get("student") is None:
+                    self.students.pop(student_id, None)
+                else:
+                    self.students[student_id] = change["student"]
+                self.last_seq = change["seq"]
+                changed.add(student_id)
+        if changed and self.on_change is not None:
+            self.on_change(changed)
+
+    def sync(self) -> int:
+        """Fetch and apply every change after last_seq. Returns how many."""
+        import requests
+
+        applied = 0
+        while True:
+            response = requests.get(
+                f"{self.database_url}/api/changes",
+                params={"since": self.last_seq, "limit": self.page_size},
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+            page = response.json()
+            epoch = page.get("epoch")
+            if epoch != self.epoch:
+                if self.epoch is not None:
+                    logging.warning("Student change feed was recreated, resyncing")
+                    self.reset()
+                    self.epoch = epoch
+                    continue
+                self.epoch = epoch
+            self.apply(page["changes"])
+            applied += len(page["changes"])
+            if not page.get("hasMore"):
+                break
+        if not self.ready:
+            logging.info(
+                f"Synced {len(self.students)} students up to change {self.last_seq}"
+            )
+        self.ready = True
+        return applied
+
+    def reset(self) -> None:
+        """Forget every student; lookups fall back until the next full sync."""
+        with self._lock:
+            dropped = set(self.students)
+            self.students = {}
+            self.last_seq = 0
+            self.ready = False
+        if dropped and self.on_change is not None:
+            self.on_change(dropped)
+
+    def get(self, student_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            student = self.students.get(student_id)
+        if student is not None or self.ready:
+            return student
+        return self.fetch(student_id)
+
+    def fetch(self, student_id: str) -> Optional[Dict[str, Any]]:
+        import requests
+
+        try:
+            response = requests.get(
+                f"{self.database_url}/api/student",
+                params={"studentId": student_id},
+                timeout=self.timeout,
+                headers=tracing.headers(),
+            )
+            if response.status_code == 200:
+                return response.json()
+            logging.error(f"Failed to fetch student {student_id}: {response.text}")
+        except requests.RequestException as e:
+            logging.error(f"Error connecting to database service: {e}")
+        return None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(
+            target=self._run, name="student-sync", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.sync()
+            except Exception as e:
+                logging.warning(f"Student change sync failed: {e}")
+            self._stop.wait(self.poll_interval)
@@ -1,3 +1,7 @@
+import os
+import subprocess
+import sys
+
 import pytest
 from app import app
 
@@ -31,3 +35,70 @@ def test_predict_endpoint(client):
     }
     assert response.status_code == 200
     assert data == expected
+
+
+def test_import_does_not_load_heavy_modules():
+    code = (
+        "import sys, app; "
+        "print(sorted(m for m in ('tensorflow', 'deepface', 'matplotlib', "
+        "'sklearn', 'requests') if m in sys.modules))"
+    )
+    output = subprocess.check_output(
+        [sys.executable, "-c", code],
+        cwd=os.path.join(os.path.dirname(__file__), ".."),
+    )
+    assert output.strip() == b"[]"
+
+
+def test_health_does_not_build_recognizer(client, monkeypatch):
+    monkeypatch.setattr("app._face_recognizer", None)
+    response = client.get("/api/health")
+    assert response.status_code == 200
+    assert response.get_json() == {
+        "status": "ok",
+        "database_size": 0,
+        "model_loaded": False,
+        "gallery_loaded": False,
+    }
+
+
+def test_health_distinguishes_empty_gallery_from_not_loaded(client, monkeypatch):
+    class Recognizer:
+        db_student_ids = []
+        model_id = "fake:model"
+        preprocessor = None
+        collections = None
+
+    monkeypatch.setattr("app._face_recognizer", Recognizer())
+    data = client.get("/api/health").get_json()
+    assert data["database_size"] == 0 and data["gallery_loaded"] is True
+
+
+def test_shard_search_rejects_malformed_queries(client, monkeypatch):
+    import numpy as np
+
+    from gallery import FloatGallery
+
+    class Recognizer:
+        model_id = "fake:model"
+        gallery = FloatGallery(["stu1", "stu2"], np.eye(2, 4), model_id="fake:model")
+
+    monkeypatch.setattr("app._face_recognizer", Recognizer())
+
+    def search(body):
+        return client.post("/api/shard/search", json=body)
+
+    response = search({"embedding": [1, 0, 0, 0], "topK": 1})
+    assert response.status_code == 200
+    assert response.get_json()["matches"] == [["stu1", 1.0]]
+
+    for body in (
+        {"embedding": [1, 0, 0, 0], "topK": "many"},
+        {"embedding": [1, 0, 0, 0], "topK": -1},
+        {"embedding": [1, 0, 0, 0], "topK": 1.5},
+        {"embedding": ["a", "b", "c", "d"]},
+        {"embedding": [[1, 0], [0, 1]]},
+        {"embedding": [1, 0]},
+        {"embedding": {"x": 1}},
+    ):
+        assert search(body).status_code == 400, body
@@ -0,0 +1,125 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from starlette.testclient import TestClient
+
+import asgi
+from asgi import AdmissionController, Overloaded
+
+
+@pytest.fixture
+def client():
+    with TestClient(asgi.app) as client:
+        yield client
+
+
+def test_health_contract(client, monkeypatch):
+    monkeypatch.setattr("app._face_recognizer", None)
+    response = client.get("/api/health")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["status"] == "ok"
+    assert data["database_size"] == 0 and data["gallery_loaded"] is False
+
+
+def test_predict_missing_image(client):
+    response = client.post("/api/predict", json={"CollectionId": "student-gallery"})
+    assert response.status_code == 400
+    assert response.json() == {"error": "No image data provided"}
+
+
+def test_predict_runs_shared_handler(client, monkeypatch):
+    monkeypatch.setattr(
+        "app.handle_predict", lambda data: ({"match": False, "similarity": 12.5}, 200)
+    )
+    response = client.post("/api/predict", json={"Image": {"Bytes": "abc"}})
+    assert response.status_code == 200
+    assert response.json() == {"match": False, "similarity": 12.5}
+
+
+def test_predict_rejects_when_overloaded(client, monkeypatch):
+    full = AdmissionController(max_in_flight=1, max_queue_depth=0, queue_timeout=1)
+    full.in_flight = 1
+    monkeypatch.setattr(asgi, "admission", full)
+    response = client.post("/api/predict", json={"Image": {"Bytes": "abc"}})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(asgi.retry_after)
+
+
+def test_admission_controller_bounds_queue():
+    async def scenario():
+        controller = AdmissionController(1, 1, queue_timeout=1)
+        release = asyncio.Event()
+
+        async def hold():
+            async with controller:
+                await release.wait()
+
+        running = asyncio.create_task(hold())
+        await asyncio.sleep(0.01)
+        queued = asyncio.create_task(hold())
+        await asyncio.sleep(0.01)
+        assert (controller.in_flight, controller.waiting) == (1, 1)
+
+        with pytest.raises(Overloaded):
+            async with controller:
+                pass
+
+        release.set()
+        await asyncio.gather(running, queued)
+        assert (controller.in_flight, controller.waiting) == (0, 0)
+
+    asyncio.run(scenario())
+
+
+def test_admission_controller_times_out_waiting():
+    async def scenario():
+        controller = AdmissionController(1, 5, queue_timeout=0.01)
+        async with controller:
+            with pytest.raises(Overloaded):
+                async with controller:
+                    pass
+        assert controller.waiting == 0
+
+    asyncio.run(scenario())
+
+
+def test_slot_is_held_until_cancelled_work_finishes():
+    async def scenario():
+        controller = AdmissionController(1, 0, queue_timeout=0.01)
+        started, finish = threading.Event(), threading.Event()
+
+        def slow():
+            started.set()
+            finish.wait(5)
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            await controller.acquire()
+            task = asyncio.create_task(controller.run(executor, slow))
+            await asyncio.get_running_loop().run_in_executor(None, started.wait)
+            task.cancel()  # the client went away
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            # The thread is still busy, so the slot is still taken.
+            assert controller.in_flight == 1
+            with pytest.raises(Overloaded):
+                await controller.acquire()
+
+            finish.set()
+            for _ in range(100):
+                if controller.in_flight == 0:
+                    break
+                await asyncio.sleep(0.01)
+            assert controller.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_submit_job_missing_image(client):
+    response = client.post(
+        "/api/predict/jobs", json={"CollectionId": "student-gallery"}
+    )
+    assert response.status_code == 400
+    assert response.json() == {"error": "No image data provided"}
@@ -0,0 +1,264 @@
+import json
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+import app as service
+import collection_store
+from collection_store import UnknownCollection
+from face_recognition import FaceRecognizer
+
+COLOURS = {  # BGR, as written by cv2.imwrite
+    "red": (0, 0, 255),
+    "green": (0, 255, 0),
+    "blue": (255, 0, 0),
+}
+
+
+class CountingBackend:
+    """Mean-colour embeddings; counts how often the model runs."""
+
+    model_id = "fake:mean-colour"
+
+    def __init__(self):
+        self.calls = 0
+
+    def extract_embedding(self, img_rgb):
+        self.calls += 1
+        return img_rgb.reshape(-1, 3).mean(axis=0) - 127.5
+
+
+@pytest.fixture
+def reference_dir(tmp_path):
+    directory = tmp_path / "faces"
+    directory.mkdir()
+    for name, colour in COLOURS.items():
+        img = np.zeros((32, 32, 3), dtype=np.uint8)
+        img[:] = colour
+        cv2.imwrite(str(directory / f"{name}.png"), img)
+    return str(directory)
+
+
+def write_rosters(path, rosters):
+    with open(path, "w") as f:
+        json.dump(rosters, f)
+    # Make the change visible even within the filesystem's mtime resolution.
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 1))
+
+
+def make_recognizer(reference_dir, rosters_path, backend=None, **options):
+    recognizer = FaceRecognizer(
+        reference_dir=reference_dir,
+        backend=backend or CountingBackend(),
+        collections_file=str(rosters_path),
+        **options,
+    )
+    recognizer.get_student_info = lambda student_id: None
+    return recognizer
+
+
+def probe(rgb):
+    img = np.zeros((16, 16, 3), dtype=np.uint8)
+    img[:] = rgb
+    return img
+
+
+def test_search_is_restricted_to_roster(reference_dir, tmp_path):
+    rosters = tmp_path / "rosters.json"
+    write_rosters(rosters, {"period-1": ["green", "blue"]})
+    recognizer = make_recognizer(reference_dir, rosters)
+
+    # The red student is enrolled but not in period-1.
+    result = recognizer.recognize_face(probe((250, 5, 5)), collection_id="period-1")
+    assert set(result["allScores"]) == {"green", "blue"}
+
+    result = recognizer.recognize_face(probe((250, 5, 5)))
+    assert result["match"] is True
+    assert result["studentId"] == "red"
+
+
+def test_galleries_load_lazily_and_idle_ones_are_evicted(reference_dir, tmp_path):
+    rosters = tmp_path / "rosters.json"
+    write_rosters(rosters, {"a": ["red"], "b": ["green"], "c": ["blue"]})
+    backend = CountingBackend()
+    recognizer = make_recognizer(
+        reference_dir, rosters, backend=backend, max_loaded_collections=2
+    )
+    store = recognizer.collections
+    assert store.loaded() == [] and backend.calls == 0
+
+    store.get("a")
+    store.get("b")
+    store.get("a")
+    store.get("c")
+    # b was least recently used.
+    assert store.loaded() == ["a", "c"]
+
+    store.idle_seconds = 0
+    store.get("b")
+    assert store.loaded() == ["b"]
+
+    with pytest.raises(UnknownCollection):
+        store.get("period-9")
+
+
+def test_embedding_cache_avoids_recomputing(reference_dir, tmp_path):
+    rosters = tmp_path / "rosters.json"
+    write_rosters(rosters, {"a": ["red", "green"], "b": ["green"]})
+    backend = CountingBackend()
+    recognizer = make_recognizer(
+        reference_dir,
+        rosters,
+        backend=backend,
+        max_loaded_collections=1,
+        embedding_cache_dir=str(tmp_path / "cache"),
+    )
+    store = recognizer.collections
+
+    store.get("a")
+    store.get("b")
+    store.get("a")
+    assert backend.calls == 2
+
+
+def test_roster_changes_are_picked_up(reference_dir, tmp_path):
+    rosters = tmp_path / "rosters.json"
+    write_rosters(rosters, {"a": ["red"]})
+    recognizer = make_recognizer(reference_dir, rosters)
+    assert len(recognizer.collections.get("a")) == 1
+
+    write_rosters(rosters, {"a": ["red", "blue"]})
+    assert recognizer.has_collection("a")
+    assert len(recognizer.collections.get("a")) == 2
+
+
+def test_predict_returns_404_for_unknown_collection(
+    reference_dir, tmp_path, monkeypatch
+):
+    rosters = tmp_path / "rosters.json"
+    write_rosters(rosters, {"a": ["red"]})
+    monkeypatch.setattr(
+        service, "_face_recognizer", make_recognizer(reference_dir, rosters)
+    )
+    monkeypatch.setattr(service, "decode_image_to_rgb", lambda *a, **kw: probe(0))
+    monkeypatch.setattr(service, "save_decoded_image", lambda encoded: None)
+
+    body, status = service.handle_predict(
+        {"CollectionId": "nope", "Image": {"Bytes": "abc"}}
+    )
+    assert status == 404
+
+    body, status = service.handle_predict(
+        {"CollectionId": "a", "Image": {"Bytes": "abc"}}
+    )
+    assert status == 200
+    assert list(body["allScores"]) == ["red"]
+    assert service.health_status()["collections"] == {"configured": 1, "loaded": ["a"]}
+
+
+def test_invalidate_drops_galleries_of_changed_students(reference_dir, tmp_path):
+    rosters = tmp_path / "rosters.json"
+    write_rosters(rosters, {"a": ["red"], "b": ["green"]})
+    store = make_recognizer(reference_dir, rosters).collections
+    store.get("a")
+    store.get("b")
+    store.get("student-gallery")
+
+    store.invalidate({"green"})
+    # The default collection has no roster, so any change may affect it.
+    assert store.loaded() == ["a"]
+
+
+def test_empty_collection_is_not_rebuilt_until_invalidated(reference_dir, tmp_path):
+    rosters = tmp_path / "rosters.json"
+    write_rosters(rosters, {"a": ["red"], "empty": ["nobody"]})
+    store = make_recognizer(reference_dir, rosters).collections
+    builds = []
+    build = store.build
+    store.build = lambda cid: builds.append(cid) or build(cid)
+
+    store.idle_seconds = 0
+    assert store.get("empty") is None
+    store.get("a")
+    assert store.get("empty") is None
+    assert builds == ["empty", "a"]
+    # The idle sweep dropped a, but the empty result is kept.
+    assert store.loaded() == []
+
+    store.invalidate({"red"})
+    assert store.get("empty") is None
+    assert builds == ["empty", "a"]
+    store.invalidate({"nobody"})
+    assert store.get("empty") is None
+    assert builds == ["empty", "a", "empty"]
+
+    write_rosters(rosters, {"a": ["red"], "empty": ["green"]})
+    assert store.get("empty") is not None
+    assert builds[-1] == "empty"
+
+
+def test_idle_galleries_are_evicted_without_new_builds(
+    reference_dir, tmp_path, monkeypatch
+):
+    rosters = tmp_path / "rosters.json"
+    write_rosters(rosters, {"a": ["red"], "b": ["green"]})
+    store = make_recognizer(reference_dir, rosters).collections
+    now = [1000.0]
+    monkeypatch.setattr(collection_store.time, "time", lambda: now[0])
+    store.idle_seconds = 60
+    store.get("a")
+    store.get("b")
+
+    now[0] += 30
+    store.get("b")  # a cache hit, no build
+    assert store.loaded() == ["a", "b"]
+    now[0] += 45
+    store.get("b")
+    assert store.loaded() == ["b"]
+
+
+def test_build_invalidated_while_running_is_not_kept(reference_dir, tmp_path):
+    rosters = tmp_path / "rosters.json"
+    write_rosters(rosters, {"a": ["red"]})
+    store = make_recognizer(reference_dir, rosters).collections
+    build = store.build
+    builds = []
+
+    def racing_build(cid):
+        builds.append(cid)
+        if len(builds) == 1:
+            # The student's photo changes while the first build is running.
+            store.invalidate({"red"})
+        return build(cid)
+
+    store.build = racing_build
+    assert store.get("a") is not None
+    assert builds == ["a", "a"]
+    assert store.loaded() == ["a"]
+
+
+def test_embedding_cache_key_includes_extension_and_size(reference_dir, tmp_path):
+    rosters = tmp_path / "rosters.json"
+    write_rosters(rosters, {"a": ["red"]})
+    backend = CountingBackend()
+    recognizer = make_recognizer(
+        reference_dir,
+        rosters,
+        backend=backend,
+        embedding_cache_dir=str(tmp_path / "cache"),
+    )
+    store = recognizer.collections
+    png = os.path.join(reference_dir, "red.png")
+    jpg = os.path.join(reference_dir, "red.jpg")
+    cv2.imwrite(jpg, probe((0, 0, 250))[:, :, ::-1].copy())
+    stat = os.stat(png)
+    os.utime(jpg, ns=(stat.st_atime_ns, stat.st_mtime_ns))  # as copytree keeps it
+
+    red = store.embedding("red", png)
+    other = store.embedding("red", jpg)
+    assert backend.calls == 2
+    assert not np.allclose(red, other)
+    assert np.allclose(store.embedding("red", png), red) and backend.calls == 2
@@ -0,0 +1,99 @@
+import os
+import subprocess
+import sys
+
+import cv2
+import numpy as np
+import pytest
+from face_recognition import (
+    FaceRecognizer,
+    create_backend,
+    reference_images,
+    student_reference_images,
+)
+
+
+class FakeBackend:
+    """Embeds an image as its mean colour, so solid-colour images are easy to match."""
+
+    model_id = "fake:mean-colour"
+
+    def extract_embedding(self, img_rgb):
+        return img_rgb.reshape(-1, 3).mean(axis=0) - 127.5
+
+
+def write_reference(directory, name, colour):
+    img = np.zeros((32, 32, 3), dtype=np.uint8)
+    img[:] = colour
+    cv2.imwrite(os.path.join(directory, name), img)
+
+
+def test_create_backend_rejects_unknown_name():
+    with pytest.raises(ValueError):
+        create_backend("tensorrt")
+
+
+def test_opencv_backend_requires_model_files(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        create_backend(
+            "opencv",
+            detector_model_path=str(tmp_path / "yunet.onnx"),
+            sface_model_path=str(tmp_path / "sface.onnx"),
+        )
+
+
+def test_importing_face_recognition_does_not_load_tensorflow():
+    output = subprocess.check_output(
+        [
+            sys.executable,
+            "-c",
+            "import sys, face_recognition; print('tensorflow' in sys.modules)",
+        ],
+        cwd=os.path.join(os.path.dirname(__file__), ".."),
+    )
+    assert output.strip() == b"False"
+
+
+def test_recognizer_uses_configured_backend(tmp_path, monkeypatch):
+    write_reference(str(tmp_path), "red.png", (0, 0, 255))
+    write_reference(str(tmp_path), "blue.png", (255, 0, 0))
+    recognizer = FaceRecognizer(reference_dir=str(tmp_path), backend=FakeBackend())
+    monkeypatch.setattr(recognizer, "get_student_info", lambda student_id: None)
+
+    assert recognizer.model_id == "fake:mean-colour"
+    assert recognizer.gallery.model_id == "fake:mean-colour"
+
+    probe = np.zeros((16, 16, 3), dtype=np.uint8)
+    probe[:] = (250, 5, 5)  # RGB red
+    result = recognizer.recognize_face(probe)
+    assert result["match"] is True
+    assert result["studentId"] == "red"
+
+
+def test_student_lookup_replaces_database_call(tmp_path):
+    recognizer = FaceRecognizer(
+        reference_dir=str(tmp_path),
+        backend=FakeBackend(),
+        student_lookup={"stu1": {"name": "Ann Lee"}}.get,
+    )
+    assert recognizer.get_student_info("stu1") == {"name": "Ann Lee"}
+
+
+def test_student_directories_add_templates(tmp_path):
+    write_reference(str(tmp_path), "red.png", (0, 0, 255))
+    os.mkdir(tmp_path / "red")
+    write_reference(str(tmp_path / "red"), "dim.png", (0, 0, 120))
+    os.mkdir(tmp_path / "blue")
+    write_reference(str(tmp_path / "blue"), "a.png", (255, 0, 0))
+    (tmp_path / "blue" / "notes.txt").write_text("not a photo")
+
+    assert [student for student, _ in reference_images(str(tmp_path))] == [
+        "blue",
+        "red",
+        "red",
+    ]
+    assert len(student_reference_images(str(tmp_path), "red")) == 2
+
+    recognizer = FaceRecognizer(reference_dir=str(tmp_path), backend=FakeBackend())
+    assert recognizer.db_student_ids == ["blue", "red"]
+    assert len(recognizer.gallery.templates) == 3
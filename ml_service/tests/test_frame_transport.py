@@ -0,0 +1,149 @@
+import socket
+import threading
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+import pytest
+
+import app as service
+from frame_transport import FrameServer, recv_message, send_message
+
+
+@pytest.fixture
+def segment():
+    frame = np.zeros((4, 6, 3), dtype=np.uint8)
+    frame[:] = (10, 20, 30)
+    segment = shared_memory.SharedMemory(create=True, size=frame.nbytes)
+    np.ndarray(frame.shape, dtype=np.uint8, buffer=segment.buf)[:] = frame
+    yield segment
+    segment.close()
+    # The server unregistered it when attaching, since it normally runs in
+    # another process than the owner.
+    resource_tracker.register(segment._name, "shared_memory")
+    segment.unlink()
+
+
+def serve(tmp_path, handler):
+    server = FrameServer(str(tmp_path / "frames.sock"), handler)
+    assert server.start()
+    return server
+
+
+def connect(server):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(5)
+    sock.connect(server.socket_path)
+    return sock
+
+
+def test_frames_are_read_in_place(tmp_path, segment):
+    seen = []
+
+    def handler(img_rgb, request):
+        seen.append(img_rgb.base is not None)
+        return {"mean": img_rgb.reshape(-1, 3).mean(axis=0).tolist()}, 200
+
+    server = serve(tmp_path, handler)
+    sock = connect(server)
+    try:
+        request = {"shm": segment.name, "shape": [4, 6, 3], "SourceId": "cam"}
+        send_message(sock, request)
+        assert recv_message(sock) == {"status": 200, "body": {"mean": [10, 20, 30]}}
+
+        # The camera writes the next frame into the same segment.
+        np.ndarray((4, 6, 3), dtype=np.uint8, buffer=segment.buf)[:] = 50
+        send_message(sock, request)
+        assert recv_message(sock)["body"] == {"mean": [50, 50, 50]}
+        assert seen == [True, True]
+    finally:
+        sock.close()
+        server.stop()
+
+
+def test_bad_requests_are_rejected(tmp_path, segment):
+    server = serve(tmp_path, lambda img_rgb, request: ({}, 200))
+    sock = connect(server)
+    try:
+        send_message(sock, {"shm": segment.name, "shape": [40, 60, 3]})
+        assert recv_message(sock)["status"] == 400
+        send_message(sock, {"shm": "no-such-segment", "shape": [4, 6, 3]})
+        assert recv_message(sock)["status"] == 400
+    finally:
+        sock.close()
+        server.stop()
+
+
+def test_second_server_defers_to_running_one(tmp_path):
+    server = serve(tmp_path, lambda img_rgb, request: ({}, 200))
+    try:
+        assert not FrameServer(server.socket_path, None).start()
+    finally:
+        server.stop()
+    # A socket file left behind by a dead process is replaced.
+    open(server.socket_path, "w").close()
+    restarted = FrameServer(server.socket_path, None)
+    assert restarted.start()
+    restarted.stop()
+
+
+def test_handle_frame_skips_decoding(monkeypatch):
+    class Recognizer:
+        def has_collection(self, collection_id):
+            return collection_id != "nope"
+
+        def recognize_face(self, img_rgb, collection_id=None, source_id=None):
+            return {"shape": list(img_rgb.shape), "source": source_id}
+
+    monkeypatch.setattr(service, "_face_recognizer", Recognizer())
+    monkeypatch.setattr(
+        service,
+        "decode_image_to_rgb",
+        lambda *a, **kw: pytest.fail("frame should not be decoded"),
+    )
+    img = np.zeros((4, 6, 3), dtype=np.uint8)
+    body, status = service.handle_frame(img, {"SourceId": "cam"})
+    assert status == 200
+    assert body == {"shape": [4, 6, 3], "source": "cam"}
+    assert service.handle_frame(img, {"CollectionId": "nope"})[1] == 404
+
+
+def test_workers_starting_together_serve_one_socket(tmp_path):
+    path = str(tmp_path / "frames.sock")
+    open(path, "w").close()  # left behind by a worker that has exited
+    servers = [FrameServer(path, None) for _ in range(8)]
+    results = []
+    threads = [
+        threading.Thread(target=lambda s=s: results.append(s.start())) for s in servers
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    try:
+        assert sorted(results) == [False] * 7 + [True]
+        connect(next(s for s in servers if s._sock is not None)).close()
+    finally:
+        for server in servers:
+            server.stop()
+
+
+def test_start_frame_server_serves_configured_socket(tmp_path, monkeypatch):
+    monkeypatch.setattr(service, "frame_socket_path", str(tmp_path / "frames.sock"))
+    monkeypatch.setattr(service, "_frame_server", None)
+
+    service.start_frame_server()
+    try:
+        assert service._frame_server.requests == 0
+        assert (tmp_path / "frames.sock").exists()
+    finally:
+        service._frame_server.stop()
+
+
+def test_unbindable_socket_is_logged_not_raised(tmp_path, monkeypatch):
+    blocker = tmp_path / "not-a-dir"
+    blocker.write_text("")
+    monkeypatch.setattr(service, "frame_socket_path", str(blocker / "frames.sock"))
+    monkeypatch.setattr(service, "_frame_server", None)
+
+    service.start_frame_server()
+    assert service._frame_server is None
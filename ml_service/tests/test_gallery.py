@@ -0,0 +1,142 @@
+import numpy as np
+import pytest
+from gallery import (
+    FloatGallery,
+    Int8Gallery,
+    TemplateGallery,
+    build_gallery,
+    quantize_int8,
+)
+
+
+def make_embeddings(count=50, dim=512, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.standard_normal((count, dim))
+
+
+def test_float_gallery_search_orders_by_cosine():
+    embeddings = make_embeddings()
+    ids = [f"stu{i}" for i in range(len(embeddings))]
+    gallery = FloatGallery(ids, embeddings)
+
+    matches = gallery.search(embeddings[7] * 3.0)
+    assert matches[0][0] == "stu7"
+    assert abs(matches[0][1] - 1.0) < 1e-5
+    assert len(matches) == len(ids)
+    assert [score for _, score in matches] == sorted(
+        [score for _, score in matches], reverse=True
+    )
+
+
+def test_quantize_int8_round_trip_error_is_small():
+    embeddings = make_embeddings()
+    codes, scales = quantize_int8(embeddings)
+    assert codes.dtype == np.int8
+    restored = codes.astype(np.float32) * scales[:, np.newaxis]
+    assert np.max(np.abs(restored - embeddings)) <= scales.max() / 2 + 1e-6
+
+
+def test_int8_gallery_reranks_top_candidates_exactly(tmp_path):
+    embeddings = make_embeddings()
+    ids = [f"stu{i}" for i in range(len(embeddings))]
+    exact = FloatGallery(ids, embeddings)
+    gallery = build_gallery(
+        ids,
+        embeddings,
+        storage="int8",
+        rerank_top_k=5,
+        float_store_path=str(tmp_path / "floats.npy"),
+    )
+    assert isinstance(gallery, Int8Gallery)
+    assert gallery.nbytes < exact.nbytes / 3
+
+    query = embeddings[3] + 0.1 * make_embeddings(1, seed=1)[0]
+    top = gallery.search(query, top_k=5)
+    expected = exact.search(query, top_k=5)
+    assert [student_id for student_id, _ in top] == [
+        student_id for student_id, _ in expected
+    ]
+    np.testing.assert_allclose(
+        [score for _, score in top], [score for _, score in expected], atol=1e-5
+    )
+
+
+def test_duplicate_ids_build_template_gallery_with_centroids():
+    templates = make_embeddings(count=6, seed=2)
+    ids = ["a", "a", "a", "b", "c", "c"]
+    gallery = build_gallery(ids, templates, template_top_k=2)
+    assert isinstance(gallery, TemplateGallery)
+    assert gallery.student_ids == ["a", "b", "c"]
+    assert gallery.embeddings.shape == (3, templates.shape[1])
+
+    # A query close to one of a's templates scores as that template, not as
+    # a's centroid.
+    matches = gallery.search(templates[1] + 0.05 * make_embeddings(1, seed=3)[0])
+    assert matches[0][0] == "a"
+    single = FloatGallery(["a"], templates[1:2])
+    np.testing.assert_allclose(
+        matches[0][1],
+        single.search(templates[1] + 0.05 * make_embeddings(1, seed=3)[0])[0][1],
+        atol=1e-5,
+    )
+
+
+def test_template_gallery_reranks_only_top_centroids():
+    templates = make_embeddings(count=40, seed=4)
+    ids = [f"stu{i // 2}" for i in range(len(templates))]
+    gallery = TemplateGallery(ids, templates, template_top_k=3)
+    query = templates[10]
+
+    centroid_scores = gallery.centroids.scores(query)
+    scores = gallery.scores(query)
+    changed = np.flatnonzero(~np.isclose(scores, centroid_scores))
+    assert 0 < len(changed) <= 3
+    assert gallery.search(query, top_k=1)[0] == ("stu5", pytest.approx(1.0))
+
+
+def test_template_gallery_supports_int8_centroids(tmp_path):
+    templates = make_embeddings(count=20, seed=5)
+    ids = [f"stu{i // 4}" for i in range(len(templates))]
+    gallery = build_gallery(
+        ids,
+        templates,
+        storage="int8",
+        float_store_path=str(tmp_path / "centroids.npy"),
+    )
+    assert isinstance(gallery.centroids, Int8Gallery)
+    assert gallery.search(templates[13], top_k=1)[0][0] == "stu3"
+
+
+def test_template_gallery_stores_int8_templates(tmp_path):
+    templates = make_embeddings(count=40, seed=6)
+    ids = [f"stu{i // 4}" for i in range(len(templates))]
+    dense = TemplateGallery(ids, templates, template_top_k=3)
+    gallery = TemplateGallery(
+        ids,
+        templates,
+        template_top_k=3,
+        storage="int8",
+        float_store_path=str(tmp_path / "centroids.npy"),
+    )
+    assert isinstance(gallery.templates, Int8Gallery)
+    assert gallery.templates.codes.dtype == np.int8
+    assert (tmp_path / "centroids.templates.npy").exists()
+    assert gallery.nbytes < dense.nbytes / 3
+
+    # The best template of each candidate is re-scored exactly.
+    query = templates[21] + 0.05 * make_embeddings(1, seed=7)[0]
+    ((best, score),) = gallery.search(query, top_k=1)
+    ((dense_best, dense_score),) = dense.search(query, top_k=1)
+    assert best == dense_best == "stu5"
+    assert score == pytest.approx(dense_score, abs=1e-6)
+
+
+def test_int8_gallery_does_not_leave_temporary_files(tmp_path, monkeypatch):
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path))
+    embeddings = make_embeddings()
+    gallery = build_gallery(
+        [f"stu{i}" for i in range(len(embeddings))], embeddings, storage="int8"
+    )
+    assert list(tmp_path.iterdir()) == []
+    # The unlinked copy is still mapped and used for re-ranking.
+    assert gallery.search(embeddings[2], top_k=1)[0][0] == "stu2"
@@ -0,0 +1,187 @@
+import sqlite3
+import time
+
+import pytest
+
+import app as service
+from app import app
+from jobs import DONE, FAILED, QUEUED, RUNNING, JobQueue, JobWorkerPool, QueueFull
+
+PAYLOAD = {"Image": {"Bytes": "abc"}}
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.db"), lease_seconds=60, max_attempts=2)
+
+
+def test_jobs_are_claimed_in_order(queue):
+    first = queue.enqueue(PAYLOAD)
+    second = queue.enqueue({"Image": {"Bytes": "def"}}, callback_url="http://cb")
+
+    assert queue.claim() == (first, PAYLOAD, None, 1)
+    job_id, payload, callback_url, attempt = queue.claim()
+    assert (job_id, callback_url) == (second, "http://cb")
+    assert queue.claim() is None
+    assert queue.get(first)["status"] == RUNNING
+
+
+def test_completed_job_keeps_result_not_frame(queue):
+    job_id = queue.enqueue(PAYLOAD)
+    attempt = queue.claim()[3]
+    assert queue.complete(job_id, {"match": True, "studentId": "stu1"}, 200, attempt)
+
+    job = queue.get(job_id)
+    assert job["status"] == DONE
+    assert job["result"] == {"match": True, "studentId": "stu1"}
+    assert job["statusCode"] == 200
+    assert queue.depth() == 0
+
+
+def test_expired_lease_is_reclaimed_after_restart(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    crashed = JobQueue(path, lease_seconds=0)
+    job_id = crashed.enqueue(PAYLOAD)
+    crashed.claim()
+
+    restarted = JobQueue(path, lease_seconds=60)
+    time.sleep(0.01)
+    assert restarted.claim()[0] == job_id
+    assert restarted.get(job_id)["attempts"] == 2
+
+
+def test_stale_worker_cannot_overwrite_reclaimed_job(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    slow = JobQueue(path, lease_seconds=0)
+    job_id = slow.enqueue(PAYLOAD)
+    stale_attempt = slow.claim()[3]
+
+    other = JobQueue(path, lease_seconds=60)
+    time.sleep(0.01)
+    attempt = other.claim()[3]
+
+    assert not slow.complete(job_id, {"match": False}, 200, stale_attempt)
+    assert slow.retry_or_fail(job_id, "boom", stale_attempt) is None
+    assert other.get(job_id)["status"] == RUNNING
+    assert other.complete(job_id, {"match": True}, 200, attempt)
+    assert other.get(job_id)["result"] == {"match": True}
+
+
+def test_failed_handler_is_retried_then_failed(queue):
+    job_id = queue.enqueue(PAYLOAD)
+    pool = JobWorkerPool(queue, lambda payload: ({"error": "boom"}, 500))
+
+    pool.process(*queue.claim())
+    assert queue.get(job_id)["status"] == QUEUED
+
+    pool.process(*queue.claim())
+    job = queue.get(job_id)
+    assert job["status"] == FAILED
+    assert job["error"] == "boom"
+
+
+def test_queue_rejects_jobs_beyond_max_depth(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"), max_depth=1)
+    queue.enqueue(PAYLOAD)
+    with pytest.raises(QueueFull):
+        queue.enqueue(PAYLOAD)
+
+
+def test_worker_pool_drains_queue_and_calls_back(queue, monkeypatch):
+    callbacks = []
+
+    class DummyResponse:
+        status_code = 200
+        text = ""
+
+    def fake_post(url, json=None, timeout=None):
+        callbacks.append((url, json))
+        return DummyResponse()
+
+    monkeypatch.setattr("requests.post", fake_post)
+    pool = JobWorkerPool(
+        queue, lambda payload: ({"match": False}, 200), workers=1, poll_interval=0.01
+    )
+    job_id = queue.enqueue(PAYLOAD, callback_url="http://camera/callback")
+    pool.start()
+    try:
+        deadline = time.time() + 5
+        while queue.get(job_id)["status"] != DONE and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        pool.stop()
+
+    assert queue.get(job_id)["result"] == {"match": False}
+    assert callbacks[0][0] == "http://camera/callback"
+    assert callbacks[0][1]["jobId"] == job_id
+
+
+def test_submit_and_poll_endpoints(queue, monkeypatch):
+    pool = JobWorkerPool(queue, service.handle_predict)
+    monkeypatch.setattr(service, "job_callback_urls", ["http://cb"])
+    monkeypatch.setattr(service, "_job_queue", queue)
+    monkeypatch.setattr(service, "_job_pool", pool)
+
+    with app.test_client() as client:
+        response = client.post(
+            "/api/predict/jobs", json=dict(PAYLOAD, CallbackUrl="http://cb")
+        )
+        assert response.status_code == 202
+        job_id = response.get_json()["jobId"]
+        assert response.headers["Location"].endswith(f"/api/predict/jobs/{job_id}")
+
+        response = client.get(f"/api/predict/jobs/{job_id}")
+        assert response.status_code == 200
+        assert response.get_json()["status"] == QUEUED
+
+        assert client.get("/api/predict/jobs/missing").status_code == 404
+        assert client.post("/api/predict/jobs", json={}).status_code == 400
+
+    assert queue.claim() == (job_id, PAYLOAD, "http://cb", 1)
+
+
+def test_callback_urls_must_be_allowed(queue, monkeypatch):
+    monkeypatch.setattr(service, "_job_queue", queue)
+    monkeypatch.setattr(service, "_job_pool", JobWorkerPool(queue, None))
+    monkeypatch.setattr(service, "job_callback_urls", ["http://camera:8080/jobs/"])
+
+    def submit(callback_url):
+        body, status = service.handle_submit_job(
+            dict(PAYLOAD, CallbackUrl=callback_url)
+        )
+        return status
+
+    assert submit("http://camera:8080/jobs/done") == 202
+    assert submit("http://camera:8080/admin") == 400
+    assert submit("http://camera:8080.evil.example/jobs/") == 400
+    assert submit("http://169.254.169.254/latest/meta-data") == 400
+    monkeypatch.setattr(service, "job_callback_urls", [])
+    assert submit("http://camera:8080/jobs/done") == 400
+
+
+def test_worker_survives_queue_errors(queue, monkeypatch):
+    failures = []
+    complete = queue.complete
+
+    def flaky_complete(job_id, result, status_code, attempt):
+        if not failures:
+            failures.append(job_id)
+            raise sqlite3.OperationalError("database is locked")
+        return complete(job_id, result, status_code, attempt)
+
+    monkeypatch.setattr(queue, "complete", flaky_complete)
+    queue.lease_seconds = 0
+    pool = JobWorkerPool(
+        queue, lambda payload: ({"match": False}, 200), workers=1, poll_interval=0.01
+    )
+    first = queue.enqueue(PAYLOAD)
+    pool.start()
+    try:
+        deadline = time.time() + 5
+        while queue.get(first)["status"] != DONE and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        pool.stop()
+    assert failures == [first]
+    # The worker that hit the error picked the job up again after its lease.
+    assert queue.get(first)["status"] == DONE
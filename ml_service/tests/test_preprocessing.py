@@ -0,0 +1,186 @@
+import base64
+
+import cv2
+import numpy as np
+import pytest
+from preprocessing import Preprocessor, RoiCache, jpeg_size, reduced_imread_flag
+from utils import decode_image_to_rgb
+
+
+class BrightSquareBackend:
+    """Detects the bounding box of bright pixels and records what it was given."""
+
+    model_id = "fake:bright-square"
+    enforce_detection = True
+
+    def __init__(self):
+        self.detect_shapes = []
+        self.embedded_shapes = []
+
+    def detect_faces(self, img_rgb):
+        self.detect_shapes.append(img_rgb.shape)
+        ys, xs = np.nonzero(img_rgb[:, :, 0] > 128)
+        if len(xs) == 0:
+            return []
+        x, y = int(xs.min()), int(ys.min())
+        return [(x, y, int(xs.max()) - x + 1, int(ys.max()) - y + 1)]
+
+    def extract_embedding(self, img_rgb):
+        self.embedded_shapes.append(img_rgb.shape)
+        return np.array([img_rgb.shape[0], img_rgb.shape[1]], dtype=np.float32)
+
+    def embed_face(self, face_rgb):
+        return self.extract_embedding(face_rgb)
+
+
+def frame_with_face(width, height, box):
+    img = np.zeros((height, width, 3), dtype=np.uint8)
+    x, y, w, h = box
+    img[y : y + h, x : x + w] = 255
+    return img
+
+
+def jpeg_bytes(img):
+    ok, encoded = cv2.imencode(".jpg", img)
+    assert ok
+    return encoded.tobytes()
+
+
+def test_small_frames_skip_preprocessing():
+    backend = BrightSquareBackend()
+    img = frame_with_face(320, 240, (100, 80, 60, 60))
+    Preprocessor(detection_max_side=640).extract_embedding(backend, img)
+    assert backend.detect_shapes == []
+    assert backend.embedded_shapes == [img.shape]
+
+
+def test_detects_downsized_and_maps_boxes_back():
+    backend = BrightSquareBackend()
+    img = frame_with_face(3840, 2160, (1200, 600, 400, 480))
+    boxes = Preprocessor(detection_max_side=640).detect(backend, img)
+
+    assert max(backend.detect_shapes[0][:2]) == 640
+    x, y, w, h = boxes[0]
+    assert abs(x - 1200) <= 6 and abs(y - 600) <= 6
+    assert abs(w - 400) <= 12 and abs(h - 480) <= 12
+
+
+def test_embeds_full_resolution_crop():
+    backend = BrightSquareBackend()
+    img = frame_with_face(3840, 2160, (1200, 600, 400, 480))
+    Preprocessor(detection_max_side=640, crop_margin=0.25).extract_embedding(
+        backend, img
+    )
+
+    height, width = backend.embedded_shapes[0][:2]
+    # 480x400 face plus 25% margin on each side, cut from the 4K frame.
+    assert abs(height - 720) <= 20 and abs(width - 600) <= 20
+
+
+def test_no_face_raises_when_detection_is_enforced():
+    backend = BrightSquareBackend()
+    img = np.zeros((1080, 1920, 3), dtype=np.uint8)
+    with pytest.raises(ValueError):
+        Preprocessor(detection_max_side=640).extract_embedding(backend, img)
+
+
+def test_jpeg_size_reads_header():
+    img = np.zeros((720, 1280, 3), dtype=np.uint8)
+    assert jpeg_size(jpeg_bytes(img)) == (1280, 720)
+    ok, png = cv2.imencode(".png", img)
+    assert jpeg_size(png.tobytes()) is None
+
+
+def test_reduced_decode_keeps_min_side():
+    data = jpeg_bytes(np.zeros((2160, 3840, 3), dtype=np.uint8))
+    assert reduced_imread_flag(data, 1280) == cv2.IMREAD_REDUCED_COLOR_2
+    assert reduced_imread_flag(data, 640) == cv2.IMREAD_REDUCED_COLOR_4
+    assert reduced_imread_flag(data, 480) == cv2.IMREAD_REDUCED_COLOR_8
+    assert reduced_imread_flag(data, 4000) == cv2.IMREAD_COLOR
+
+    encoded = base64.b64encode(data).decode()
+    assert decode_image_to_rgb(encoded, min_side=1280).shape == (1080, 1920, 3)
+    assert decode_image_to_rgb(encoded).shape == (2160, 3840, 3)
+
+
+def test_roi_reuse_detects_only_around_last_face():
+    backend = BrightSquareBackend()
+    cache = RoiCache(refresh_frames=3)
+    preprocessor = Preprocessor(detection_max_side=640, roi_cache=cache, roi_margin=0.5)
+    img = frame_with_face(1920, 1080, (900, 400, 200, 240))
+
+    # First frame: full-frame detection, and the box is remembered.
+    preprocessor.extract_embedding(backend, img, source="room1/seat1")
+    assert max(backend.detect_shapes[0][:2]) == 640
+    assert cache.get("room1/seat1") is not None
+
+    # Next frames: the backend only sees the 200x240 box plus 50% margin.
+    backend.detect_shapes.clear()
+    backend.embedded_shapes.clear()
+    for _ in range(3):
+        preprocessor.extract_embedding(backend, img, source="room1/seat1")
+    assert backend.detect_shapes == []
+    assert len(backend.embedded_shapes) == 3
+    height, width = backend.embedded_shapes[0][:2]
+    assert abs(height - 480) <= 4 and abs(width - 400) <= 4
+    assert cache.stats()["hits"] == 3
+
+    # refresh_frames reached: the next frame runs full-frame detection again.
+    preprocessor.extract_embedding(backend, img, source="room1/seat1")
+    assert len(backend.detect_shapes) == 1
+
+
+class DetectingBackend(BrightSquareBackend):
+    """Like a real backend, extract_embedding fails when there is no face."""
+
+    def extract_embedding(self, img_rgb):
+        if not (img_rgb[:, :, 0] > 128).any():
+            raise ValueError("Face could not be detected in the image")
+        return super().extract_embedding(img_rgb)
+
+
+def test_roi_miss_falls_back_to_full_frame():
+    backend = DetectingBackend()
+    cache = RoiCache()
+    preprocessor = Preprocessor(detection_max_side=640, roi_cache=cache)
+    preprocessor.extract_embedding(
+        backend, frame_with_face(1920, 1080, (900, 400, 200, 240)), source="cam"
+    )
+
+    # The student moved to the other side of the frame.
+    moved = frame_with_face(1920, 1080, (100, 100, 200, 240))
+    backend.detect_shapes.clear()
+    preprocessor.extract_embedding(backend, moved, source="cam")
+    assert cache.stats()["misses"] == 1
+    assert cache.get("cam")[:2] == pytest.approx((100, 100), abs=6)
+
+
+def test_face_missing_from_padded_crop_is_not_embedded_unaligned():
+    class FalsePositiveBackend(DetectingBackend):
+        # Finds a "face" in the downscaled frame that is not there.
+        def detect_faces(self, img_rgb):
+            self.detect_shapes.append(img_rgb.shape)
+            return [(10, 10, 40, 40)]
+
+        def embed_face(self, face_rgb):
+            raise AssertionError("embedded an unaligned crop")
+
+    backend = FalsePositiveBackend()
+    cache = RoiCache()
+    preprocessor = Preprocessor(detection_max_side=640, roi_cache=cache)
+    with pytest.raises(ValueError, match="Face could not be detected"):
+        preprocessor.extract_embedding(
+            backend, np.zeros((1080, 1920, 3), dtype=np.uint8), source="cam"
+        )
+    assert cache.get("cam") is None
+
+
+def test_frames_without_source_skip_roi_cache():
+    backend = BrightSquareBackend()
+    cache = RoiCache()
+    img = frame_with_face(320, 240, (100, 80, 60, 60))
+    Preprocessor(detection_max_side=640, roi_cache=cache).extract_embedding(
+        backend, img
+    )
+    assert backend.detect_shapes == []
+    assert cache.stats()["sources"] == 0
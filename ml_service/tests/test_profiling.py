@@ -0,0 +1,135 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import app as service
+import profiling
+from app import app
+from gallery import FloatGallery
+
+TOKEN = {"X-Admin-Token": "secret"}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("ADMIN_TOKEN", "secret")
+    monkeypatch.setattr(profiling, "_session", None)
+    with app.test_client() as client:
+        yield client
+
+
+def test_admin_endpoints_are_hidden_without_token(client, monkeypatch):
+    monkeypatch.delenv("ADMIN_TOKEN")
+    assert client.get("/api/admin/profile", headers=TOKEN).status_code == 404
+
+
+def test_admin_endpoints_reject_wrong_token(client):
+    response = client.post("/api/admin/profile", headers={"X-Admin-Token": "nope"})
+    assert response.status_code == 403
+
+
+def test_cprofile_covers_next_requests(client, monkeypatch):
+    def slow_predict(data):
+        time.sleep(0.001)
+        return {"match": False}, 200
+
+    monkeypatch.setattr(service, "run_predict", slow_predict)
+    assert profiling.active_session() is None
+
+    response = client.post(
+        "/api/admin/profile", headers=TOKEN, json={"mode": "cprofile", "requests": 2}
+    )
+    assert response.status_code == 202
+    assert client.get("/api/admin/profile", headers=TOKEN).status_code == 202
+
+    for _ in range(3):
+        service.handle_predict({"Image": {"Bytes": "abc"}})
+
+    # Only two requests were profiled, and nothing is hooked afterwards.
+    assert profiling.active_session() is None
+    response = client.get("/api/admin/profile", headers=TOKEN)
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    assert "slow_predict" in response.get_data(as_text=True)
+
+
+def test_sampling_profile_returns_collapsed_stacks(client):
+    stop = threading.Event()
+
+    def busy_loop():
+        while not stop.is_set():
+            sum(range(1000))
+
+    worker = threading.Thread(target=busy_loop, name="busy-worker")
+    worker.start()
+    try:
+        response = client.post(
+            "/api/admin/profile",
+            headers=TOKEN,
+            json={"mode": "sample", "seconds": 0.2, "intervalMs": 1},
+        )
+        assert response.status_code == 202
+        time.sleep(0.4)
+        response = client.get("/api/admin/profile", headers=TOKEN)
+    finally:
+        stop.set()
+        worker.join()
+
+    assert response.status_code == 200
+    lines = response.get_data(as_text=True).splitlines()
+    busy = [line for line in lines if line.startswith("busy-worker;")]
+    assert busy and "busy_loop (test_profiling.py:" in busy[0]
+    assert int(busy[0].rsplit(" ", 1)[1]) > 0
+
+
+def test_rejects_unknown_mode(client):
+    response = client.post("/api/admin/profile", headers=TOKEN, json={"mode": "perf"})
+    assert response.status_code == 400
+
+
+def test_memory_report_attributes_gallery_allocations(client):
+    assert client.post("/api/admin/memory", headers=TOKEN).status_code == 200
+    try:
+        gallery = FloatGallery(["a"] * 2000, np.ones((2000, 512)))
+        report = client.get("/api/admin/memory?limit=5", headers=TOKEN).get_json()
+    finally:
+        client.delete("/api/admin/memory", headers=TOKEN)
+
+    assert report["tracing"] is True
+    assert report["categories"]["gallery"] >= gallery.nbytes
+    assert len(report["top"]) == 5
+    report = client.get("/api/admin/memory", headers=TOKEN).get_json()
+    assert report["tracing"] is False
+
+
+@pytest.mark.parametrize(
+    "path, method, params",
+    [
+        ("/api/admin/memory", "post", {"frames": "ten"}),
+        ("/api/admin/memory", "post", {"frames": 0}),
+        ("/api/admin/memory", "get", {"limit": "all"}),
+        ("/api/admin/profile", "post", {"seconds": "soon"}),
+        ("/api/admin/profile", "post", {"requests": None}),
+        ("/api/admin/profile", "post", {"mode": "sample", "intervalMs": -1}),
+    ],
+)
+def test_bad_numbers_are_rejected(client, path, method, params):
+    if method == "get":
+        response = client.get(path, headers=TOKEN, query_string=params)
+    else:
+        response = client.post(path, headers=TOKEN, json=params)
+    assert response.status_code == 400
+    assert "must be" in response.get_json()["error"]
+    assert profiling._session is None
+
+
+def test_tracemalloc_can_start_with_the_process(monkeypatch):
+    monkeypatch.setenv("TRACEMALLOC_FRAMES", "5")
+    profiling.start_memory_tracing_from_env()
+    try:
+        assert profiling.tracemalloc.get_traceback_limit() == 5
+        assert profiling.memory_report(limit=1)["tracing"] is True
+    finally:
+        profiling.stop_memory_tracing()
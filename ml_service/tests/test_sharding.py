@@ -0,0 +1,149 @@
+import numpy as np
+import pytest
+import requests
+from sharding import ShardedGallery, shard_for
+
+
+class DummyResponse:
+    def __init__(self, status_code, json_data):
+        self.status_code = status_code
+        self._json = json_data
+
+    def json(self):
+        return self._json
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code}")
+
+
+def test_shard_for_is_stable_and_in_range():
+    ids = [f"stu{i}" for i in range(200)]
+    assignments = [shard_for(student_id, 4) for student_id in ids]
+    assert assignments == [shard_for(student_id, 4) for student_id in ids]
+    assert set(assignments) == {0, 1, 2, 3}
+
+
+def test_sharded_search_merges_top_k(monkeypatch):
+    shard_results = {
+        "http://shard0": [["alice", 0.9], ["bob", 0.4]],
+        "http://shard1": [["carol", 0.7], ["dave", 0.1]],
+    }
+
+    def dummy_post(url, json, timeout, headers=None):
+        assert json["topK"] == 3
+        return DummyResponse(200, {"matches": shard_results[url.split("/api")[0]]})
+
+    monkeypatch.setattr("sharding.requests.post", dummy_post)
+    gallery = ShardedGallery(list(shard_results), top_k=3)
+    matches = gallery.search(np.ones(4))
+    assert matches == [("alice", 0.9), ("carol", 0.7), ("bob", 0.4)]
+
+
+def test_sharded_search_tolerates_restarting_shard(monkeypatch):
+    calls = {"http://shard1": 0}
+
+    def dummy_post(url, json, timeout, headers=None):
+        base = url.split("/api")[0]
+        if base == "http://shard1":
+            calls[base] += 1
+            raise requests.ConnectionError("connection refused")
+        return DummyResponse(200, {"matches": [["alice", 0.9]]})
+
+    monkeypatch.setattr("sharding.requests.post", dummy_post)
+    gallery = ShardedGallery(["http://shard0", "http://shard1"], retries=2, backoff=0)
+    assert gallery.search(np.ones(4)) == [("alice", 0.9)]
+    assert calls["http://shard1"] == 3
+    assert gallery.failed_shards == {"http://shard1"}
+
+
+def test_sharded_search_fails_when_all_shards_down(monkeypatch):
+    def dummy_post(url, json, timeout, headers=None):
+        raise requests.ConnectionError("connection refused")
+
+    monkeypatch.setattr("sharding.requests.post", dummy_post)
+    gallery = ShardedGallery(["http://shard0"], retries=0)
+    with pytest.raises(RuntimeError):
+        gallery.search(np.ones(4))
+
+
+def test_failed_shard_is_skipped_until_probe_succeeds(monkeypatch):
+    state = {"shard1_up": False, "shard1_calls": 0}
+
+    def dummy_post(url, json, timeout, headers=None):
+        if url.startswith("http://shard1"):
+            state["shard1_calls"] += 1
+            if not state["shard1_up"]:
+                raise requests.Timeout("read timed out")
+            return DummyResponse(200, {"matches": [["bob", 0.95]]})
+        return DummyResponse(200, {"matches": [["alice", 0.9]]})
+
+    def dummy_get(url, timeout):
+        if not state["shard1_up"]:
+            raise requests.ConnectionError("connection refused")
+        return DummyResponse(200, {"status": "ok", "model_id": "m1"})
+
+    monkeypatch.setattr("sharding.requests.post", dummy_post)
+    monkeypatch.setattr("sharding.requests.get", dummy_get)
+    gallery = ShardedGallery(
+        ["http://shard0", "http://shard1"], model_id="m1", probe_interval=60
+    )
+
+    matches = gallery.search(np.ones(4))
+    # Timeouts are not retried.
+    assert state["shard1_calls"] == 1
+    assert matches == [("alice", 0.9)]
+    assert matches.missing_shards == ["http://shard1"] and matches.shard_count == 2
+
+    # Skipped, with no probe before probe_interval has passed.
+    assert gallery.search(np.ones(4)).missing_shards == ["http://shard1"]
+    assert state["shard1_calls"] == 1
+    gallery._probe("http://shard1")
+    assert gallery.failed_shards == {"http://shard1"}
+
+    state["shard1_up"] = True
+    gallery._probe("http://shard1")
+    assert gallery.failed_shards == set()
+    matches = gallery.search(np.ones(4))
+    assert matches == [("bob", 0.95), ("alice", 0.9)] and matches.missing_shards == []
+
+
+def test_model_mismatch_is_not_retried(monkeypatch):
+    calls = []
+
+    def dummy_post(url, json, timeout, headers=None):
+        calls.append(url)
+        if url.startswith("http://shard1"):
+            return DummyResponse(409, {"error": "Embedding model mismatch"})
+        return DummyResponse(200, {"matches": [["alice", 0.9]]})
+
+    def dummy_get(url, timeout):
+        return DummyResponse(200, {"status": "ok", "model_id": "old-model"})
+
+    monkeypatch.setattr("sharding.requests.post", dummy_post)
+    monkeypatch.setattr("sharding.requests.get", dummy_get)
+    gallery = ShardedGallery(["http://shard0", "http://shard1"], model_id="m1")
+    matches = gallery.search(np.ones(4))
+    assert calls.count("http://shard1/api/shard/search") == 1
+    assert matches.missing_shards == ["http://shard1"]
+    # Health is fine but the model still differs, so it stays excluded.
+    gallery._probe("http://shard1")
+    assert gallery.failed_shards == {"http://shard1"}
+
+
+def test_shards_do_not_inherit_coordinator_settings(monkeypatch):
+    import shard_supervisor
+
+    started = []
+    monkeypatch.setenv("SHARD_URLS", "http://127.0.0.1:8100")
+    monkeypatch.setenv("COLLECTIONS_FILE", "/config/collections.json")
+    monkeypatch.setenv("FRAME_SOCKET_PATH", "/run/frames.sock")
+    monkeypatch.setattr(
+        shard_supervisor.subprocess,
+        "Popen",
+        lambda command, env: started.append(env),
+    )
+    shard_supervisor.start_shard(1, 4, 8101, 1)
+    env = started[0]
+    assert env["SHARD_INDEX"] == "1" and env["SHARD_COUNT"] == "4"
+    assert not {"SHARD_URLS", "COLLECTIONS_FILE", "FRAME_SOCKET_PATH"} & set(env)
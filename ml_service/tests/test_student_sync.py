@@ -0,0 +1,115 @@
+import pytest
+
+from student_sync import StudentDirectory
+
+
+class FakeResponse:
+    def __init__(self, body, status_code=200):
+        self.body = body
+        self.status_code = status_code
+        self.text = str(body)
+
+    def json(self):
+        return self.body
+
+    def raise_for_status(self):
+        pass
+
+
+def change(seq, student_id, op="upsert", **student):
+    return {
+        "seq": seq,
+        "studentId": student_id,
+        "op": op,
+        "student": dict(studentId=student_id, **student) if op == "upsert" else None,
+    }
+
+
+@pytest.fixture
+def feed(monkeypatch):
+    """Serves pages of a change log and records the requests made."""
+    requests = pytest.importorskip("requests")
+    log, calls = [], []
+
+    def fake_get(url, params=None, timeout=None, headers=None):
+        calls.append((url, dict(params or {})))
+        if url.endswith("/api/student"):
+            return FakeResponse({"studentId": params["studentId"], "name": "Direct"})
+        pending = [c for c in log if c["seq"] > params["since"]]
+        page = pending[: params["limit"]]
+        return FakeResponse(
+            {
+                "changes": page,
+                "lastSeq": page[-1]["seq"] if page else params["since"],
+                "hasMore": len(page) == params["limit"],
+            }
+        )
+
+    monkeypatch.setattr(requests, "get", fake_get)
+    return log, calls
+
+
+def test_sync_applies_changes_incrementally(feed):
+    log, calls = feed
+    log.extend(
+        [change(1, "ann", name="Ann"), change(2, "bob", name="Bob"), change(3, "cy")]
+    )
+    invalidated = []
+    directory = StudentDirectory("http://db", page_size=2, on_change=invalidated.append)
+
+    assert directory.sync() == 3
+    assert directory.last_seq == 3
+    assert directory.get("ann")["name"] == "Ann"
+    # Paged: since=0 then since=2.
+    assert [params["since"] for _, params in calls] == [0, 2]
+
+    log.extend([change(4, "ann", op="delete"), change(5, "bob", name="Robert")])
+    calls.clear()
+    assert directory.sync() == 2
+    assert [params["since"] for _, params in calls] == [3, 5]
+    assert directory.get("ann") is None
+    assert directory.get("bob")["name"] == "Robert"
+    assert invalidated[-1] == {"ann", "bob"}
+
+
+def test_lookup_falls_back_to_database_until_synced(feed):
+    _, calls = feed
+    directory = StudentDirectory("http://db")
+    assert directory.get("ann")["name"] == "Direct"
+    assert calls[0][0] == "http://db/api/student"
+
+    directory.sync()
+    assert directory.get("ann") is None
+
+
+def test_recreated_feed_forces_full_resync(monkeypatch):
+    requests = pytest.importorskip("requests")
+    feed = {"epoch": "a", "log": [change(1, "ann", name="Ann"), change(2, "bob")]}
+    calls = []
+
+    def fake_get(url, params=None, timeout=None, headers=None):
+        calls.append(params["since"])
+        page = [c for c in feed["log"] if c["seq"] > params["since"]]
+        return FakeResponse(
+            {
+                "changes": page,
+                "lastSeq": page[-1]["seq"] if page else params["since"],
+                "hasMore": False,
+                "epoch": feed["epoch"],
+            }
+        )
+
+    monkeypatch.setattr(requests, "get", fake_get)
+    invalidated = []
+    directory = StudentDirectory("http://db", on_change=invalidated.append)
+    directory.sync()
+    assert directory.last_seq == 2 and directory.epoch == "a"
+
+    # The database was recreated: seqs start over below our last_seq.
+    feed.update(epoch="b", log=[change(1, "cy", name="Cy")])
+    calls.clear()
+    directory.sync()
+    assert calls == [2, 0]
+    assert directory.epoch == "b" and directory.last_seq == 1
+    assert directory.get("ann") is None and directory.get("cy")["name"] == "Cy"
+    assert {"ann", "bob"} <= invalidated[-2]
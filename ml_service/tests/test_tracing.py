@@ -0,0 +1,166 @@
+import base64
+import json
+import pathlib
+
+import cv2
+import numpy as np
+import pytest
+
+import app as service
+import tracing
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+TRACEPARENT = f"00-{TRACE_ID}-00f067aa0ba902b7-01"
+
+
+@pytest.fixture
+def exported(tmp_path, monkeypatch):
+    """Spans exported while the test runs, read back from a TRACE_FILE."""
+    path = tmp_path / "spans.jsonl"
+    exporter = tracing.FileExporter(str(path))
+    monkeypatch.setattr(tracing, "_exporters", [exporter])
+
+    def read():
+        exporter.flush()
+        if not path.exists():
+            return []
+        return [json.loads(line) for line in path.read_text().splitlines()]
+
+    return read
+
+
+def test_spans_continue_remote_trace(exported):
+    with tracing.span("predict", TRACEPARENT) as outer:
+        with tracing.span("decode", bytes=10) as inner:
+            assert tracing.headers() == {"traceparent": inner.traceparent}
+    assert tracing.current_span() is None
+
+    decode, predict = exported()
+    assert predict["traceId"] == decode["traceId"] == TRACE_ID
+    assert predict["parentSpanId"] == "00f067aa0ba902b7"
+    assert decode["parentSpanId"] == outer.span_id
+    assert decode["attributes"] == {"bytes": 10}
+
+
+def test_unsampled_traces_are_not_exported(exported):
+    with tracing.span("predict", f"00-{TRACE_ID}-00f067aa0ba902b7-00") as span:
+        assert tracing.headers()["traceparent"].endswith("-00")
+    assert not span.sampled
+    assert exported() == []
+
+
+def test_invalid_traceparent_starts_new_trace():
+    assert tracing.parse_traceparent("00-abc-def-01") is None
+    assert tracing.parse_traceparent(f"00-{'0' * 32}-00f067aa0ba902b7-01") is None
+    with tracing.span("predict", "garbage") as span:
+        assert span.trace_id != TRACE_ID and span.parent_id is None
+
+
+def test_errors_are_recorded(exported):
+    with pytest.raises(ValueError):
+        with tracing.span("search"):
+            raise ValueError("index missing")
+    assert exported()[0]["error"] == "index missing"
+
+
+def test_predict_request_joins_callers_trace(exported, tmp_path, monkeypatch):
+    class Recognizer:
+        def has_collection(self, collection_id):
+            return True
+
+        def recognize_face(self, img_rgb, collection_id=None, source_id=None):
+            with tracing.span("search"):
+                return {"match": False}
+
+    monkeypatch.setattr(service, "_face_recognizer", Recognizer())
+    monkeypatch.setenv("IMAGE_OUTPUT_DIR", str(tmp_path))
+    _, encoded = cv2.imencode(".jpg", np.zeros((8, 8, 3), dtype=np.uint8))
+    payload = {"Image": {"Bytes": base64.b64encode(encoded.tobytes()).decode()}}
+
+    with service.app.test_client() as client:
+        response = client.post(
+            "/api/predict", json=payload, headers={"traceparent": TRACEPARENT}
+        )
+    assert response.status_code == 200
+
+    spans = {span["name"]: span for span in exported()}
+    assert {"predict", "decode", "search"} <= set(spans)
+    assert {span["traceId"] for span in spans.values()} == {TRACE_ID}
+    predict = spans["predict"]
+    assert predict["parentSpanId"] == "00f067aa0ba902b7"
+    assert predict["attributes"]["status"] == 200
+    assert spans["decode"]["parentSpanId"] == predict["spanId"]
+    assert spans["decode"]["attributes"]["shape"] == "8x8"
+
+
+def test_otlp_payload():
+    span = tracing.start_span("search", TRACEPARENT, collection="c1", faces=2)
+    span.error = "timeout"
+    span.end()
+    otlp = tracing.otlp_payload([span])["resourceSpans"][0]["scopeSpans"][0]
+    (otlp_span,) = otlp["spans"]
+    assert otlp_span["traceId"] == TRACE_ID
+    assert otlp_span["parentSpanId"] == "00f067aa0ba902b7"
+    assert int(otlp_span["endTimeUnixNano"]) >= int(otlp_span["startTimeUnixNano"])
+    assert otlp_span["attributes"] == [
+        {"key": "collection", "value": {"stringValue": "c1"}},
+        {"key": "faces", "value": {"intValue": "2"}},
+    ]
+    assert otlp_span["status"] == {"code": 2, "message": "timeout"}
+
+
+def test_report_shows_slowest_trace_per_hop(tmp_path, capsys):
+    spans = [
+        {"spanId": "a", "parentSpanId": None, "name": "capture", "ms": 120},
+        {"spanId": "b", "parentSpanId": "a", "name": "ml_predict", "ms": 100},
+        {"spanId": "c", "parentSpanId": "b", "name": "search", "ms": 80},
+    ]
+    path = tmp_path / "spans.jsonl"
+    with open(path, "w") as f:
+        for i, s in enumerate(spans):
+            record = {
+                "traceId": TRACE_ID,
+                "spanId": s["spanId"],
+                "parentSpanId": s["parentSpanId"],
+                "service": "camera",
+                "name": s["name"],
+                "startTimeUnixNano": i,
+                "durationMs": s["ms"],
+                "attributes": {},
+                "error": None,
+            }
+            f.write(json.dumps(record) + "\n")
+
+    tracing.report([str(path)])
+    output = capsys.readouterr().out
+    assert "1 traces, p95 120.0 ms" in output
+    assert f"trace {TRACE_ID}  120.0 ms" in output
+    lines = output.splitlines()
+    search = next(line for line in lines if "camera/search" in line)
+    assert search.startswith("      ") and search.rstrip().endswith("80.0 ms")
+
+
+def test_service_copies_are_identical():
+    # Each service is built from its own directory, so it ships its own copy.
+    root = pathlib.Path(__file__).resolve().parents[2]
+    copies = [root / service / "tracing.py" for service in ("camera", "database")]
+    if not all(path.exists() for path in copies):
+        pytest.skip("Only the ml_service directory is available")
+    ours = pathlib.Path(tracing.__file__).read_bytes()
+    for path in copies:
+        assert path.read_bytes() == ours, f"{path} differs from ml_service/tracing.py"
+
+
+def test_file_exporter_queues_spans_until_flushed(tmp_path):
+    path = tmp_path / "spans.jsonl"
+    exporter = tracing.FileExporter(str(path), interval=60)
+    for name in ("decode", "search"):
+        span = tracing.Span(name, TRACE_ID, None, True, {})
+        span.end_ns = span.start_ns
+        exporter.export(span)
+    # Ending a span does no file I/O on the request's thread.
+    assert not path.exists()
+
+    exporter.flush()
+    names = [json.loads(line)["name"] for line in path.read_text().splitlines()]
+    assert names == ["decode", "search"]
@@ -0,0 +1,410 @@
+"""
+Request tracing across the camera, ML service, database and frontend.
+
+Each camera capture starts a trace. Its ID is passed on in a W3C traceparent
+header (00-<trace id>-<parent span id>-<flags>), and every service records
+spans for its part of the work under that trace. Finished spans are exported
+when configured:
+
+- TRACE_FILE: appended as JSON, one span per line;
+- TRACE_OTLP_ENDPOINT: POSTed as OTLP/HTTP JSON, e.g. to
+  http://jaeger:4318/v1/traces.
+
+Both are written in batches from a background thread, every
+TRACE_EXPORT_INTERVAL seconds and at exit, so requests do not wait on them.
+
+Without either, trace IDs are still passed on and logged, so the log lines of
+one capture can be matched up across services. TRACE_SAMPLE_RATE is the
+fraction of new traces that are exported. The decision travels in the
+traceparent flags, so a capture is recorded by every service or by none.
+
+The Python services each ship an identical copy of this module, since each
+is built from its own directory. ml_service/tests/test_tracing.py fails when
+the copies differ, so change all three together. In the camera's embedded
+mode the ML service code imports the camera's copy, so its spans nest under
+the capture.
+
+    python tracing.py report spans-*.jsonl
+
+prints the slowest traces in span files, with the time spent in each hop.
+"""
+
+import argparse
+import atexit
+import contextvars
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar("trace_span", default=None)
+_exporters = []
+_service_name = None
+_sample_rate = 1.0
+
+
+class Span:
+    __slots__ = (
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "sampled",
+        "attributes",
+        "error",
+        "start_ns",
+        "end_ns",
+        "_started",
+        "_token",
+    )
+
+    def __init__(self, name, trace_id, parent_id, sampled, attributes):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.attributes = attributes
+        self.error = None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self._started = time.perf_counter_ns()
+        self._token = None
+
+    @property
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    @property
+    def elapsed_ms(self):
+        """Time since the span started, while it is still running."""
+        return (time.perf_counter_ns() - self._started) / 1e6
+
+    @property
+    def duration_ms(self):
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def end(self):
+        """Finish the span and export it. Spans from start_span must be ended."""
+        if self.end_ns is not None:
+            return
+        self.end_ns = self.start_ns + time.perf_counter_ns() - self._started
+        if self._token is not None:
+            try:
+                _current.reset(self._token)
+            except ValueError:
+                # Ended in another context than it was started in.
+                pass
+            self._token = None
+        if self.sampled:
+            for exporter in _exporters:
+                exporter.export(self)
+
+    def to_dict(self):
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "service": _service_name,
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "durationMs": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+def parse_traceparent(header):
+    """(trace id, parent span id, sampled) from a traceparent header, or None."""
+    parts = (header or "").strip().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+        sampled = bool(int(parts[3][:2], 16) & 1)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1], parts[2], sampled
+
+
+def start_span(name, traceparent=None, **attributes):
+    """
+    Start a span and make it the current one. Its parent is the remote span
+    in traceparent if given, else the current span; otherwise it starts a new
+    trace.
+    """
+    remote = parse_traceparent(traceparent) if traceparent else None
+    parent = _current.get()
+    if remote is not None:
+        trace_id, parent_id, sampled = remote
+    elif parent is not None:
+        trace_id, parent_id, sampled = parent.trace_id, parent.span_id, parent.sampled
+    else:
+        trace_id, parent_id = os.urandom(16).hex(), None
+        sampled = random.random() < _sample_rate
+    span = Span(name, trace_id, parent_id, sampled, attributes)
+    span._token = _current.set(span)
+    return span
+
+
+@contextmanager
+def span(name, traceparent=None, **attributes):
+    current = start_span(name, traceparent, **attributes)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = str(e) or type(e).__name__
+        raise
+    finally:
+        current.end()
+
+
+def current_span():
+    return _current.get()
+
+
+def current_trace_id():
+    current = _current.get()
+    return current.trace_id if current is not None else None
+
+
+def current_traceparent():
+    current = _current.get()
+    return current.traceparent if current is not None else None
+
+
+def headers():
+    """Headers that continue the current trace in the service being called."""
+    current = _current.get()
+    return {"traceparent": current.traceparent} if current is not None else {}
+
+
+class BatchExporter:
+    """
+    Queues finished spans and hands them to _send from a background thread,
+    at most max_batch at a time, so ending a span never does I/O. Spans
+    beyond max_queue are dropped rather than slowing down requests while
+    the destination is unavailable. flush() sends what is queued right away.
+    """
+
+    def __init__(self, interval=1.0, max_batch=512, max_queue=10000):
+        self.interval = interval
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        self.dropped = 0
+        self._spans = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def export(self, span):
+        with self._lock:
+            if len(self._spans) >= self.max_queue:
+                self.dropped += 1
+                return
+            self._spans.append(span)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="trace-export", daemon=True
+                )
+                self._thread.start()
+        if len(self._spans) >= self.max_batch:
+            self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        while True:
+            with self._lock:
+                batch = self._spans[: self.max_batch]
+                del self._spans[: self.max_batch]
+            if not batch:
+                return
+            self._send(batch)
+
+    def _send(self, batch):
+        raise NotImplementedError
+
+
+class FileExporter(BatchExporter):
+    """Appends each batch of spans to path in one write, as JSON lines."""
+
+    def __init__(self, path, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        # Keeps batches whole when flush() runs beside the export thread.
+        self._write_lock = threading.Lock()
+
+    def _send(self, batch):
+        lines = "".join(json.dumps(span.to_dict()) + "\n" for span in batch)
+        with self._write_lock:
+            try:
+                with open(self.path, "a") as f:
+                    f.write(lines)
+            except OSError as e:
+                logger.warning(
+                    f"Dropped {len(batch)} spans, cannot write {self.path}: {e}"
+                )
+
+
+class OtlpExporter(BatchExporter):
+    """Sends batches of spans to endpoint as OTLP/HTTP JSON."""
+
+    def __init__(self, endpoint, **kwargs):
+        super().__init__(**kwargs)
+        self.endpoint = endpoint
+
+    def _send(self, batch):
+        import urllib.request
+
+        request = urllib.request.Request(
+            self.endpoint,
+            data=json.dumps(otlp_payload(batch)).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            urllib.request.urlopen(request, timeout=5).close()
+        except OSError as e:
+            logger.warning(f"Dropped {len(batch)} spans, collector unreachable: {e}")
+
+
+def otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_payload(spans):
+    otlp_spans = []
+    for span in spans:
+        otlp_span = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 1,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [
+                {"key": key, "value": otlp_value(value)}
+                for key, value in span.attributes.items()
+                if value is not None
+            ],
+            "status": {"code": 2, "message": span.error} if span.error else {},
+        }
+        if span.parent_id:
+            otlp_span["parentSpanId"] = span.parent_id
+        otlp_spans.append(otlp_span)
+    service = {"key": "service.name", "value": {"stringValue": _service_name}}
+    return {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": [service]},
+                "scopeSpans": [{"scope": {"name": "classroom"}, "spans": otlp_spans}],
+            }
+        ]
+    }
+
+
+def flush():
+    for exporter in _exporters:
+        exporter.flush()
+
+
+def _log_record_factory(factory):
+    def build(*args, **kwargs):
+        record = factory(*args, **kwargs)
+        record.trace_id = current_trace_id() or "-"
+        return record
+
+    return build
+
+
+def configure(service_name):
+    """
+    Set up exporters from the environment and add trace_id to log records.
+    Only the first call in a process takes effect.
+    """
+    global _service_name, _sample_rate
+    if _service_name is not None:
+        return
+    _service_name = os.environ.get("TRACE_SERVICE_NAME", service_name)
+    _sample_rate = float(os.environ.get("TRACE_SAMPLE_RATE", "1"))
+    logging.setLogRecordFactory(_log_record_factory(logging.getLogRecordFactory()))
+
+    interval = float(os.environ.get("TRACE_EXPORT_INTERVAL", "1"))
+    if os.environ.get("TRACE_FILE"):
+        _exporters.append(FileExporter(os.environ["TRACE_FILE"], interval=interval))
+    if os.environ.get("TRACE_OTLP_ENDPOINT"):
+        _exporters.append(
+            OtlpExporter(os.environ["TRACE_OTLP_ENDPOINT"], interval=interval)
+        )
+    if _exporters:
+        atexit.register(flush)
+
+
+def report(paths, top=10):
+    """Print the slowest traces in span files, one line per span."""
+    traces = defaultdict(list)
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    span = json.loads(line)
+                    traces[span["traceId"]].append(span)
+
+    def total(spans):
+        roots = [s for s in spans if not s.get("parentSpanId")] or spans
+        return max(s["durationMs"] for s in roots)
+
+    slowest = sorted(traces.values(), key=total, reverse=True)[:top]
+    durations = sorted(total(spans) for spans in traces.values())
+    if durations:
+        p95 = durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+        print(
+            f"{len(durations)} traces, p95 {p95:.1f} ms, slowest {durations[-1]:.1f} ms"
+        )
+
+    for spans in slowest:
+        children = defaultdict(list)
+        ids = {s["spanId"] for s in spans}
+        for s in sorted(spans, key=lambda s: s["startTimeUnixNano"]):
+            parent = s.get("parentSpanId")
+            children[parent if parent in ids else None].append(s)
+        print(f"\ntrace {spans[0]['traceId']}  {total(spans):.1f} ms")
+
+        def show(parent_id, depth):
+            for s in children[parent_id]:
+                error = f"  error: {s['error']}" if s.get("error") else ""
+                label = f"{'  ' * depth}{s['service']}/{s['name']}"
+                print(f"  {label:<48}{s['durationMs']:>10.1f} ms{error}")
+                show(s["spanId"], depth + 1)
+
+        show(None, 0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize exported spans")
+    parser.add_argument("command", choices=["report"])
+    parser.add_argument("paths", nargs="+", help="TRACE_FILE outputs to combine")
+    parser.add_argument("--top", type=int, default=10, help="slowest traces to show")
+    args = parser.parse_args()
+    report(args.paths, args.top)
@@ -1,9 +1,9 @@
 import base64
 import cv2
 import numpy as np
-import matplotlib.pyplot as plt
 import os
 import logging
+from preprocessing import reduced_imread_flag
 
 
 def display_decoded_image(encoded_image):
@@ -11,6 +11,9 @@ def display_decoded_image(encoded_image):
     Decode the base64 image, convert it to a format OpenCV can work with,
     and display it briefly using matplotlib.
     """
+    # Debug-only helper; importing pyplot costs more than the rest of the service.
+    import matplotlib.pyplot as plt
+
     try:
         # Decode the base64 string to bytes
         img_bytes = base64.b64decode(encoded_image)
@@ -69,13 +72,20 @@ def save_decoded_image(encoded_image):
         return None
 
 
-def decode_image_to_rgb(encoded_image):
+def decode_image_to_rgb(encoded_image, min_side=None):
+    """
+    Decode a base64 image to RGB. With min_side set, large JPEGs are decoded at
+    a reduced scale whose longest side is still at least min_side.
+    """
     try:
         img_bytes = base64.b64decode(encoded_image)
         
         nparr = np.frombuffer(img_bytes, np.uint8)
         
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        flag = cv2.IMREAD_COLOR
+        if min_side:
+            flag = reduced_imread_flag(img_bytes, min_side)
+        img = cv2.imdecode(nparr, flag)
         if img is None:
             logging.error("Failed to decode image to RGB.")
             return None